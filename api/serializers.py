@@ -0,0 +1,114 @@
+"""
+Read-only serializers for the JSON API.
+
+Every serializer can be cut down with ``?fields=a,b,c``. Its Meta.requires
+maps each field to the model columns (and related columns, by ``__``
+path) it reads, so the views load exactly those with select_related() and
+only() instead of whole rows and lazy per-row lookups.
+"""
+from rest_framework import serializers
+
+from bookings.models import Booking
+from equipment.models import Equipment
+from users.models import UserCounters
+
+
+class SparseFieldsSerializer(serializers.ModelSerializer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.context.get('fields')
+        if requested:
+            for name in set(self.fields) - set(requested):
+                self.fields.pop(name)
+
+    @classmethod
+    def field_names(cls):
+        return list(cls.Meta.fields)
+
+    @classmethod
+    def select_fields(cls, requested):
+        """The requested field names this serializer has, in order (all when none are requested)."""
+        if not requested:
+            return cls.field_names()
+        return [name for name in cls.field_names() if name in requested]
+
+    @classmethod
+    def shape(cls, queryset, fields, always=('id',)):
+        """Limit ``queryset`` to what rendering ``fields`` reads."""
+        requires = getattr(cls.Meta, 'requires', {})
+        columns = set(always)
+        for name in fields:
+            columns.update(requires.get(name, [name]))
+        related = {path.rsplit('__', 1)[0] for path in columns if '__' in path}
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*columns)
+
+
+def _person(user):
+    return {'id': user.id, 'name': user.get_full_name() or user.username}
+
+
+PERSON_COLUMNS = ['id', 'username', 'first_name', 'last_name']
+
+
+class EquipmentSerializer(SparseFieldsSerializer):
+    url = serializers.HyperlinkedIdentityField(view_name='api:equipment_detail')
+    owner = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Equipment
+        fields = [
+            'id', 'url', 'name', 'category', 'description', 'rent_per_day', 'rent_per_hour',
+            'location', 'latitude', 'longitude', 'availability', 'owner', 'images',
+            'created_at', 'updated_at',
+        ]
+        requires = {
+            'url': ['id'],
+            'owner': [f'owner__{column}' for column in PERSON_COLUMNS],
+            'images': ['image', 'image_variants'],
+        }
+
+    def get_owner(self, obj):
+        return _person(obj.owner)
+
+    def get_images(self, obj):
+        request = self.context.get('request')
+        return {
+            variant: {ext: request.build_absolute_uri(url) if url and request else url for ext, url in urls.items()}
+            for variant, urls in obj.images.items()
+        }
+
+
+class BookingSerializer(SparseFieldsSerializer):
+    url = serializers.HyperlinkedIdentityField(view_name='api:booking_detail')
+    equipment = serializers.SerializerMethodField()
+    farmer = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Booking
+        fields = [
+            'id', 'url', 'equipment', 'farmer', 'start_date', 'start_time', 'duration',
+            'duration_type', 'start_at', 'end_at', 'total_amount', 'payment_mode', 'status',
+            'created_at', 'updated_at',
+        ]
+        requires = {
+            'url': ['id'],
+            'equipment': ['equipment__id', 'equipment__name'],
+            'farmer': [f'farmer__{column}' for column in PERSON_COLUMNS],
+        }
+
+    def get_equipment(self, obj):
+        return {'id': obj.equipment.id, 'name': obj.equipment.name}
+
+    def get_farmer(self, obj):
+        return _person(obj.farmer)
+
+
+class CountersSerializer(serializers.ModelSerializer):
+    bookings_active = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = UserCounters
+        exclude = ['user']
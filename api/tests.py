@@ -0,0 +1,149 @@
+from datetime import date, timedelta
+
+from django.urls import reverse
+
+from bookings.transitions import create_booking, transition
+from equipment.models import Equipment
+from greengear_project.querycount import budget_for
+from greengear_project.testing import QueryBudgetTestCase
+from users.models import User
+from . import urls
+
+
+class ApiTests(QueryBudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owners = [User.objects.create_user(f'owner{i}', role='owner', first_name=f'Owner {i}') for i in range(2)]
+        cls.farmer = User.objects.create_user('farmer', role='farmer')
+        cls.other_farmer = User.objects.create_user('other', role='farmer')
+        cls.equipment = [
+            Equipment.objects.create(
+                owner=cls.owners[i % 2], name=f'Rotavator {i}', category='rotavator',
+                description='7 ft rotavator', rent_per_day=800, location='Pune',
+            )
+            for i in range(25)
+        ]
+        start = date.today() + timedelta(days=3)
+        cls.bookings = [create_booking(cls.farmer, item.id, start, 1, 'days') for item in cls.equipment[:3]]
+        transition(cls.bookings[0].id, 'approved')
+
+    def get(self, name, *args, query='', **headers):
+        response = self.client.get(reverse(f'api:{name}', args=args) + query, headers=headers)
+        self.assertWithinQueryBudget(response)
+        self.assertNoRepeatedQueries(response)
+        return response
+
+    def test_every_view_has_a_budget(self):
+        for pattern in urls.urlpatterns:
+            self.assertIsNotNone(budget_for(f'{urls.app_name}:{pattern.name}'), pattern.name)
+
+    def test_equipment_pages(self):
+        seen = []
+        response = self.get('equipment_list', query='?page_size=10')
+        while True:
+            body = response.json()
+            seen += [row['id'] for row in body['results']]
+            if not body['next']:
+                break
+            response = self.client.get(body['next'])
+        available = Equipment.objects.filter(availability=True).order_by('-created_at', '-id')
+        self.assertEqual(seen, list(available.values_list('id', flat=True)))
+
+    def test_sparse_fields(self):
+        response = self.get('equipment_list', query='?fields=id,name,owner')
+        row = response.json()['results'][0]
+        self.assertEqual(set(row), {'id', 'name', 'owner'})
+        self.assertIn('name', row['owner'])
+
+        item = self.equipment[5]
+        response = self.get('equipment_detail', item.id, query='?fields=name,rent_per_day')
+        self.assertEqual(response.json(), {'name': item.name, 'rent_per_day': '800.00'})
+
+    def test_conditional_get(self):
+        item = self.equipment[5]
+        response = self.get('equipment_detail', item.id)
+        etag = response['ETag']
+        response = self.get('equipment_detail', item.id, If_None_Match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.query_stats.count, 1)
+
+        item.rent_per_day = 900
+        item.save()
+        response = self.get('equipment_detail', item.id, If_None_Match=etag)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.get('equipment_list')
+        etag = response['ETag']
+        self.assertEqual(self.get('equipment_list', If_None_Match=etag).status_code, 304)
+        self.equipment[7].delete()
+        self.assertEqual(self.get('equipment_list', If_None_Match=etag).status_code, 200)
+
+    def test_search(self):
+        self.equipment[3].name = 'Disc harrow'
+        self.equipment[3].save()
+        response = self.get('equipment_list', query='?q=harrow&fields=id,name')
+        self.assertEqual(response.json()['results'], [{'id': self.equipment[3].id, 'name': 'Disc harrow'}])
+        # Ranked results still page
+        response = self.get('equipment_list', query='?q=rotavator&page_size=10')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 10)
+        self.assertEqual(self.client.get(response.json()['next']).status_code, 200)
+
+    def test_invalid_ids_are_rejected(self):
+        response = self.client.get(reverse('api:equipment_list') + '?owner=abc')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('owner', response.json())
+        owner = self.owners[0]
+        response = self.get('equipment_list', query=f'?owner={owner.id}&fields=owner')
+        self.assertEqual({row['owner']['id'] for row in response.json()['results']}, {owner.id})
+
+        self.client.force_login(self.farmer)
+        self.assertEqual(self.client.get(reverse('api:booking_list') + '?equipment=1;drop').status_code, 400)
+        response = self.get('booking_list', query=f'?equipment={self.equipment[1].id}')
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.bookings[1].id])
+
+    def test_query_plans(self):
+        with self.assertNoFullScans():
+            for url in (
+                reverse('api:equipment_list'),
+                reverse('api:equipment_list') + '?category=rotavator',
+                reverse('api:equipment_detail', args=[self.equipment[0].id]),
+            ):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.client.force_login(self.farmer)
+        with self.assertNoFullScans():
+            for url in (
+                reverse('api:booking_list'),
+                reverse('api:booking_list') + '?status=approved',
+                reverse('api:dashboard'),
+            ):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_bookings_are_scoped_to_the_user(self):
+        self.assertEqual(self.client.get(reverse('api:booking_list')).status_code, 403)
+
+        self.client.force_login(self.farmer)
+        response = self.get('booking_list')
+        self.assertEqual(len(response.json()['results']), 3)
+        response = self.get('booking_list', query='?status=approved&fields=id,status,equipment')
+        self.assertEqual(response.json()['results'], [
+            {'id': self.bookings[0].id, 'status': 'approved',
+             'equipment': {'id': self.equipment[0].id, 'name': self.equipment[0].name}},
+        ])
+        self.get('booking_detail', self.bookings[1].id)
+        self.get('dashboard')
+
+        self.client.force_login(self.other_farmer)
+        self.assertEqual(self.get('booking_list').json()['results'], [])
+        self.assertEqual(self.get('booking_detail', self.bookings[1].id).status_code, 404)
+
+        self.client.force_login(self.owners[0])
+        response = self.get('booking_list')
+        self.assertEqual(
+            {row['id'] for row in response.json()['results']},
+            {b.id for b in self.bookings if b.equipment.owner_id == self.owners[0].id},
+        )
+        response = self.get('dashboard')
+        self.assertEqual(response.json()['counters']['requests_approved'], 1)
+        self.assertEqual(self.get('dashboard', If_None_Match=response['ETag']).status_code, 304)
@@ -0,0 +1,12 @@
+from django.urls import path
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    path('equipment/', views.equipment_list, name='equipment_list'),
+    path('equipment/<int:pk>/', views.equipment_detail, name='equipment_detail'),
+    path('bookings/', views.booking_list, name='booking_list'),
+    path('bookings/<int:pk>/', views.booking_detail, name='booking_detail'),
+    path('dashboard/', views.dashboard, name='dashboard'),
+]
@@ -0,0 +1,189 @@
+"""
+Read-only JSON API for the catalog, bookings and dashboards.
+
+Lists are keyset-paginated with the same signed cursors as the HTML
+views. Every response carries an ETag derived from the rows' updated_at
+(plus the query string), and a request whose If-None-Match still matches
+gets an empty 304. For lists that check is still one aggregate over the
+whole filtered set, so a poll costs a scan of the matching rows (of an
+index only, for the plain catalog); what it saves is fetching,
+serializing and sending the page.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags, urlencode
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+
+from bookings.models import Booking
+from equipment.models import Equipment
+from equipment.search import search_equipment
+from greengear_project.pagination import CURSOR_PARAM, paginate
+from users.counters import counters_for
+from .serializers import BookingSerializer, CountersSerializer, EquipmentSerializer
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+LIST_ORDERING = ('-created_at', '-id')
+
+
+def _requested_fields(request):
+    fields = request.query_params.get('fields', '')
+    return {name.strip() for name in fields.split(',') if name.strip()}
+
+
+def _page_size(request):
+    try:
+        size = int(request.query_params.get('page_size', PAGE_SIZE))
+    except ValueError:
+        return PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def _id_param(request, name):
+    """The ``name`` query parameter as an id, None when absent; a 400 when it isn't a number."""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: 'A valid integer is required.'})
+
+
+def _etag(*parts):
+    return '"%s"' % hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+
+
+def _not_modified(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return None
+    etags = parse_etags(header)
+    if etag in etags or '*' in etags:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return None
+
+
+def _page_link(request, cursor):
+    if cursor is None:
+        return None
+    params = request.query_params.copy()
+    params[CURSOR_PARAM] = cursor
+    return request.build_absolute_uri(f'{request.path}?{urlencode(sorted(params.lists()), doseq=True)}')
+
+
+def _list_response(request, queryset, serializer_class, ordering=LIST_ORDERING):
+    """Conditional, paginated, field-limited response for ``queryset``."""
+    # Any insert, delete or update in the filtered set moves one of these;
+    # both read every matching row
+    state = queryset.order_by().aggregate(last_update=Max('updated_at'), count=Count('id'))
+    etag = _etag(serializer_class.__name__, state['last_update'], state['count'], sorted(request.query_params.lists()))
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+
+    fields = serializer_class.select_fields(_requested_fields(request))
+    # Annotations (e.g. search_rank) are selected anyway; only() takes columns
+    ordering_columns = [f.lstrip('-') for f in ordering if f.lstrip('-') not in queryset.query.annotations]
+    rows = serializer_class.shape(queryset, fields, always=['id', 'updated_at'] + ordering_columns)
+    page = paginate(request, rows, ordering=ordering, per_page=_page_size(request))
+    serializer = serializer_class(page.object_list, many=True, context={'request': request, 'fields': fields})
+    return Response({
+        'next': _page_link(request, page.next_cursor),
+        'previous': _page_link(request, page.previous_cursor),
+        'results': serializer.data,
+    }, headers={'ETag': etag})
+
+
+def _detail_response(request, queryset, pk, serializer_class):
+    updated_at = get_object_or_404(queryset.values_list('updated_at', flat=True), pk=pk)
+    fields = serializer_class.select_fields(_requested_fields(request))
+    etag = _etag(serializer_class.__name__, pk, updated_at, sorted(fields))
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+
+    obj = get_object_or_404(serializer_class.shape(queryset, fields), pk=pk)
+    serializer = serializer_class(obj, context={'request': request, 'fields': fields})
+    return Response(serializer.data, headers={'ETag': etag})
+
+
+def _visible_bookings(user):
+    bookings = Booking.objects.all()
+    if user.is_superuser:
+        return bookings
+    if user.role == 'owner':
+        return bookings.filter(equipment__owner=user)
+    return bookings.filter(farmer=user)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def equipment_list(request):
+    params = request.query_params
+    equipment = Equipment.objects.all()
+    owner_id = _id_param(request, 'owner')
+    if owner_id is not None:
+        equipment = equipment.filter(owner_id=owner_id)
+    if params.get('available', 'true').lower() != 'all':
+        equipment = equipment.filter(availability=params.get('available', 'true').lower() == 'true')
+    if params.get('category'):
+        equipment = equipment.filter(category=params['category'])
+    if params.get('location'):
+        equipment = equipment.filter(location__icontains=params['location'])
+
+    ordering = LIST_ORDERING
+    if params.get('q'):
+        equipment = search_equipment(equipment, params['q'])
+        if 'search_rank' in equipment.query.annotations:
+            ordering = ('-search_rank',) + LIST_ORDERING
+    return _list_response(request, equipment, EquipmentSerializer, ordering)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def equipment_detail(request, pk):
+    return _detail_response(request, Equipment.objects.all(), pk, EquipmentSerializer)
+
+
+@api_view(['GET'])
+def booking_list(request):
+    bookings = _visible_bookings(request.user)
+    if request.query_params.get('status'):
+        bookings = bookings.filter(status=request.query_params['status'])
+    equipment_id = _id_param(request, 'equipment')
+    if equipment_id is not None:
+        bookings = bookings.filter(equipment_id=equipment_id)
+    return _list_response(request, bookings, BookingSerializer)
+
+
+@api_view(['GET'])
+def booking_detail(request, pk):
+    return _detail_response(request, _visible_bookings(request.user), pk, BookingSerializer)
+
+
+@api_view(['GET'])
+def dashboard(request):
+    user = request.user
+    counters = counters_for(user)
+    if user.role == 'owner':
+        recent = Booking.objects.filter(equipment__owner=user)
+    else:
+        recent = Booking.objects.filter(farmer=user)
+    fields = BookingSerializer.select_fields(_requested_fields(request))
+    recent = BookingSerializer.shape(recent, fields, always=['id', 'created_at']).order_by(*LIST_ORDERING)[:5]
+
+    data = {
+        'role': user.role,
+        'counters': CountersSerializer(counters).data,
+        'recent_bookings': BookingSerializer(recent, many=True, context={'request': request, 'fields': fields}).data,
+    }
+    # No single updated_at covers the counters; tag the payload itself
+    etag = _etag('dashboard', user.id, data)
+    return _not_modified(request, etag) or Response(data, headers={'ETag': etag})
@@ -10,7 +10,7 @@ class BookingAdmin(admin.ModelAdmin):
     list_editable = ('status',)
     fieldsets = (
         ('Booking Information', {
-            'fields': ('farmer', 'equipment', 'start_date', 'duration', 'duration_type')
+            'fields': ('farmer', 'equipment', 'start_date', 'start_time', 'duration', 'duration_type')
         }),
         ('Financial Details', {
             'fields': ('total_amount', 'payment_mode')
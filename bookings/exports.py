@@ -0,0 +1,186 @@
+"""
+Streamed CSV exports of bookings and earnings.
+
+Rows are read with a chunked iterator() and written to the response one
+line at a time through StreamingHttpResponse, so an export of the whole
+booking history holds one chunk of rows in memory, never the full list.
+Text cells a spreadsheet would run as a formula (names, phone numbers,
+anything users typed) are written with a leading apostrophe.
+
+Under ASGI the response gets an async iterator instead: Django would
+otherwise read a sync iterator to the end in a thread before sending a
+byte. Each chunk of lines is read with sync_to_async on the request's
+thread, which holds its database connection and the open cursor.
+"""
+import csv
+from datetime import date
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from equipment.models import Equipment
+
+from .models import Booking
+
+CHUNK_SIZE = 2000
+
+BOOKING_HEADER = [
+    'Booking', 'Created', 'Status', 'Equipment', 'Category', 'Owner', 'Farmer', 'Farmer phone',
+    'Start', 'End', 'Duration', 'Duration type', 'Payment mode', 'Amount',
+]
+
+EARNINGS_HEADER = [
+    'Booking', 'Completed', 'Equipment', 'Owner', 'Farmer', 'Start', 'Duration', 'Duration type',
+    'Amount', 'Running total',
+]
+
+EXPORT_FIELDS = [
+    'id', 'created_at', 'updated_at', 'status', 'start_date', 'start_at', 'end_at', 'duration',
+    'duration_type', 'payment_mode', 'total_amount',
+    'equipment__name', 'equipment__category',
+    'equipment__owner__username', 'equipment__owner__first_name', 'equipment__owner__last_name',
+    'farmer__username', 'farmer__first_name', 'farmer__last_name', 'farmer__phone',
+]
+
+# Choice labels looked up once instead of through get_FOO_display() per row
+STATUS_LABELS = dict(Booking.STATUS_CHOICES)
+DURATION_TYPE_LABELS = dict(Booking.DURATION_TYPE_CHOICES)
+PAYMENT_MODE_LABELS = dict(Booking.PAYMENT_MODE_CHOICES)
+CATEGORY_LABELS = dict(Equipment.CATEGORY_CHOICES)
+
+
+# Text starting with these is run as a formula by spreadsheet apps
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class ExportError(ValueError):
+    pass
+
+
+class Echo:
+    """File-like object whose write() hands the line back instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def safe_cell(value):
+    """``value``, with text a spreadsheet would evaluate quoted by a leading apostrophe."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _date_param(params, name):
+    value = params.get(name, '').strip()
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ExportError(f'"{value}" is not a valid date; use YYYY-MM-DD.')
+
+
+def filter_bookings(bookings, params):
+    """
+    Narrow ``bookings`` by the ``from``/``to`` start dates (inclusive) and
+    any number of ``status`` values in ``params``.
+    """
+    start, end = _date_param(params, 'from'), _date_param(params, 'to')
+    if start and end and start > end:
+        raise ExportError('The start of the date range is after its end.')
+    if start:
+        bookings = bookings.filter(start_date__gte=start)
+    if end:
+        bookings = bookings.filter(start_date__lte=end)
+
+    statuses = [status for status in params.getlist('status') if status]
+    unknown = set(statuses) - set(dict(Booking.STATUS_CHOICES))
+    if unknown:
+        raise ExportError(f'Unknown status: {", ".join(sorted(unknown))}.')
+    if statuses:
+        bookings = bookings.filter(status__in=statuses)
+    return bookings
+
+
+def _export_queryset(bookings):
+    return (
+        bookings.select_related('farmer', 'equipment', 'equipment__owner')
+        .only(*EXPORT_FIELDS)
+        .order_by('start_at', 'id')
+    )
+
+
+def _person(user):
+    return user.get_full_name() or user.username
+
+
+def _local_formatter():
+    tz = timezone.get_current_timezone()
+    return lambda value: value.astimezone(tz).strftime('%Y-%m-%d %H:%M') if value else ''
+
+
+def booking_rows(bookings):
+    yield BOOKING_HEADER
+    local = _local_formatter()
+    for booking in _export_queryset(bookings).iterator(chunk_size=CHUNK_SIZE):
+        yield [
+            booking.id,
+            local(booking.created_at),
+            STATUS_LABELS.get(booking.status, booking.status),
+            booking.equipment.name,
+            CATEGORY_LABELS.get(booking.equipment.category, booking.equipment.category),
+            _person(booking.equipment.owner),
+            _person(booking.farmer),
+            booking.farmer.phone,
+            local(booking.start_at),
+            local(booking.end_at),
+            booking.duration,
+            DURATION_TYPE_LABELS.get(booking.duration_type, booking.duration_type),
+            PAYMENT_MODE_LABELS.get(booking.payment_mode, booking.payment_mode),
+            booking.total_amount,
+        ]
+
+
+def earnings_rows(bookings):
+    yield EARNINGS_HEADER
+    local = _local_formatter()
+    total = 0
+    for booking in _export_queryset(bookings.filter(status='completed')).iterator(chunk_size=CHUNK_SIZE):
+        total += booking.total_amount
+        yield [
+            booking.id,
+            local(booking.updated_at),
+            booking.equipment.name,
+            _person(booking.equipment.owner),
+            _person(booking.farmer),
+            booking.start_date.isoformat(),
+            booking.duration,
+            DURATION_TYPE_LABELS.get(booking.duration_type, booking.duration_type),
+            booking.total_amount,
+            total,
+        ]
+
+
+async def _async_chunks(lines):
+    next_chunk = sync_to_async(lambda: ''.join(islice(lines, CHUNK_SIZE)), thread_sensitive=True)
+    try:
+        while chunk := await next_chunk():
+            yield chunk
+    finally:
+        # Close the cursor on the thread that opened it, even if the client went away
+        await sync_to_async(lines.close, thread_sensitive=True)()
+
+
+def csv_response(rows, filename, asynchronous=False):
+    """A streamed CSV of ``rows``; pass ``asynchronous`` when serving under ASGI."""
+    writer = csv.writer(Echo())
+    lines = (writer.writerow([safe_cell(value) for value in row]) for row in rows)
+    response = StreamingHttpResponse(
+        _async_chunks(lines) if asynchronous else lines,
+        content_type='text/csv; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
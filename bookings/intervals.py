@@ -0,0 +1,63 @@
+"""
+Booking intervals and conflict detection.
+
+Every booking occupies the half-open interval [start_at, end_at): day
+bookings run from midnight of start_date for ``duration`` days, hourly
+bookings from start_time for ``duration`` hours. Active (pending or
+approved) bookings of one piece of equipment never overlap, because every
+new one is checked here first. Thanks to that, only the active booking
+that starts last before the new interval ends can overlap it. It is
+found with one seek per active status on the (equipment, status,
+start_at, end_at) index, no matter how long the booking history is: a
+single query over both statuses would have to merge or sort their rows.
+"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+ACTIVE_STATUSES = ('pending', 'approved')
+
+# Hourly bookings without an explicit start time begin at the start of the working day
+DEFAULT_START_TIME = time(8, 0)
+
+
+def booking_interval(start_date, duration, duration_type, start_time=None):
+    """Return the aware ``(start_at, end_at)`` datetimes for a booking."""
+    duration = int(duration)
+    if duration_type == 'hours':
+        start = datetime.combine(start_date, start_time or DEFAULT_START_TIME)
+        length = timedelta(hours=duration)
+    else:
+        start = datetime.combine(start_date, time.min)
+        length = timedelta(days=duration)
+    start_at = timezone.make_aware(start)
+    return start_at, start_at + length
+
+
+def find_conflict(equipment_id, start_at, end_at, exclude_id=None):
+    """Return an active booking of the equipment overlapping [start_at, end_at), or None."""
+    from .models import Booking
+
+    latest = None
+    for status in ACTIVE_STATUSES:
+        candidates = Booking.objects.filter(equipment_id=equipment_id, status=status, start_at__lt=end_at)
+        if exclude_id is not None:
+            candidates = candidates.exclude(id=exclude_id)
+        booking = candidates.order_by('-start_at').first()
+        if booking is not None and (latest is None or booking.start_at > latest.start_at):
+            latest = booking
+    if latest is not None and latest.end_at > start_at:
+        return latest
+    return None
+
+
+def upcoming_bookings(equipment_id, limit=None):
+    """Active bookings of the equipment that have not ended yet, soonest first."""
+    from .models import Booking
+
+    bookings = Booking.objects.filter(
+        equipment_id=equipment_id,
+        status__in=ACTIVE_STATUSES,
+        end_at__gt=timezone.now(),
+    ).order_by('start_at')
+    return bookings[:limit] if limit else bookings
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from bookings import sweeper
+
+
+class Command(BaseCommand):
+    help = 'Complete approved bookings that have ended and release their equipment'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=sweeper.BATCH_SIZE, help='Bookings completed per transaction')
+
+    def handle(self, *args, **options):
+        completed = sweeper.sweep(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Completed {completed} ended bookings.'))
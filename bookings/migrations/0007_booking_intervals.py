@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+from bookings.intervals import booking_interval
+
+
+def fill_intervals(apps, schema_editor):
+    Booking = apps.get_model('bookings', 'Booking')
+    for booking in Booking.objects.only('id', 'start_date', 'duration', 'duration_type').iterator():
+        start_at, end_at = booking_interval(booking.start_date, booking.duration, booking.duration_type)
+        Booking.objects.filter(id=booking.id).update(start_at=start_at, end_at=end_at)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0006_keyset_pagination_indexes'),
+        ('equipment', '0006_coordinates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='end_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='start_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='start_time',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['equipment', 'status', 'start_at', 'end_at'], name='booking_interval_idx'),
+        ),
+        migrations.RunPython(fill_intervals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0007_booking_intervals'),
+        ('equipment', '0009_access_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['farmer', 'status', '-created_at', '-id'], name='booking_farmer_status_idx'),
+        ),
+    ]
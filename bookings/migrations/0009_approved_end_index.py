@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0008_access_path_indexes'),
+        ('equipment', '0011_similar_neighbors'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status', 'approved')), fields=['end_at', 'id'], name='booking_approved_end_idx'),
+        ),
+    ]
@@ -1,6 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from equipment.models import Equipment
+from . import pricing
+from .intervals import booking_interval
 
 class Booking(models.Model):
     STATUS_CHOICES = (
@@ -23,8 +25,12 @@ class Booking(models.Model):
     farmer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='bookings')
     equipment = models.ForeignKey(Equipment, on_delete=models.CASCADE, related_name='bookings')
     start_date = models.DateField()
+    start_time = models.TimeField(null=True, blank=True)
     duration = models.IntegerField()
     duration_type = models.CharField(max_length=10, choices=DURATION_TYPE_CHOICES, default='days')
+    # The [start_at, end_at) interval the equipment is occupied for
+    start_at = models.DateTimeField(null=True, editable=False)
+    end_at = models.DateTimeField(null=True, editable=False)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     payment_mode = models.CharField(max_length=20, choices=PAYMENT_MODE_CHOICES, default='cash')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
@@ -34,23 +40,48 @@ class Booking(models.Model):
     def __str__(self):
         return f"Booking #{self.id} - {self.equipment.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What the row looked like when loaded, for the per-user counters
+        instance._loaded_state = (
+            instance.__dict__.get('farmer_id'),
+            instance.__dict__.get('equipment_id'),
+            instance.__dict__.get('status'),
+            instance.__dict__.get('total_amount'),
+        )
+        return instance
+
+    def price(self):
+        return pricing.price(self.equipment, self.duration, self.duration_type)
+
     def save(self, *args, **kwargs):
+        self.start_date = self._meta.get_field('start_date').to_python(self.start_date)
+        self.start_time = self._meta.get_field('start_time').to_python(self.start_time)
+        self.start_at, self.end_at = booking_interval(
+            self.start_date, self.duration, self.duration_type, self.start_time
+        )
+        
         # Calculate total amount if not set
         if not self.total_amount and self.equipment:
-            if self.duration_type == 'days':
-                self.total_amount = self.duration * (self.equipment.rent_per_day or 0)
-            else:
-                self.total_amount = self.duration * (self.equipment.rent_per_hour or 0)
+            self.total_amount = self.price()
         
-        # Update equipment availability based on booking status
-        if self.status in ['approved', 'pending']:
-            self.equipment.availability = False
-            self.equipment.save()
-        elif self.status in ['completed', 'rejected', 'cancelled']:
-            self.equipment.availability = True
-            self.equipment.save()
-        super().save(*args, **kwargs)
+        # This write and the signal handlers (user counters) commit or roll
+        # back together. Equipment availability is the owner's own flag:
+        # bookings only block their own dates (see intervals)
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            self._loaded_state = (self.farmer_id, self.equipment_id, self.status, self.total_amount)
 
     class Meta:
         db_table = 'bookings_booking'
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['equipment', 'status', 'start_at', 'end_at'], name='booking_interval_idx'),
+            models.Index(fields=['farmer', '-created_at', '-id'], name='booking_farmer_created_idx'),
+            # A farmer's bookings filtered by status, newest first
+            models.Index(fields=['farmer', 'status', '-created_at', '-id'], name='booking_farmer_status_idx'),
+            models.Index(fields=['-created_at', '-id'], name='booking_created_idx'),
+            # Approved bookings by end, for the lifecycle sweeper
+            models.Index(fields=['end_at', 'id'], condition=models.Q(status='approved'), name='booking_approved_end_idx'),
+        ]
\ No newline at end of file
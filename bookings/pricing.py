@@ -0,0 +1,125 @@
+"""
+Booking prices.
+
+Every price, from a single booking's total to the quotes for many items
+and durations on the booking form and the equipment list, is computed by
+amounts() over NumPy arrays of rates and durations:
+
+- A day costs the day rate, or WORKING_HOURS_PER_DAY at the hourly rate
+  for equipment rented by the hour only (as Equipment.daily_rate).
+- An hourly booking costs its hours at the hourly rate, but never more
+  than the day rate for any 24 hours of it: ``d`` days and ``r`` hours
+  cost ``d * min(day rate, 24 * hourly rate) + min(r * hourly rate, day rate)``.
+- Bookings of LONG_RENTAL_DISCOUNTS days or longer get that percentage
+  off, rounded to the paisa.
+
+Amounts are computed in paise, which float64 holds exactly, so totals
+match the Decimal arithmetic they replace.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+import numpy as np
+
+from equipment.models import WORKING_HOURS_PER_DAY
+
+# (days, percent off) for bookings at least that long, longest first
+LONG_RENTAL_DISCOUNTS = (
+    (30, 20),
+    (7, 10),
+)
+
+# The durations quotes are compared across, as (key, duration, duration_type, label)
+COMPARED_DURATIONS = (
+    ('4h', 4, 'hours', '4 hours'),
+    ('1d', 1, 'days', '1 day'),
+    ('7d', 7, 'days', '1 week'),
+    ('30d', 30, 'days', '1 month'),
+)
+
+Quote = namedtuple('Quote', 'duration duration_type amount discount')
+
+
+def _paise(rates):
+    # Missing rates are infinitely expensive, so min() picks the other one
+    return np.array([np.inf if rate is None else round(float(rate) * 100) for rate in rates], dtype=np.float64)
+
+
+def discounts(days):
+    """Percent off for bookings ``days`` long (an array of possibly fractional days)."""
+    days = np.asarray(days, dtype=np.float64)
+    percent = np.zeros(days.shape, dtype=np.int64)
+    for threshold, off in reversed(LONG_RENTAL_DISCOUNTS):
+        percent[days >= threshold] = off
+    return percent
+
+
+def amounts(day_paise, hour_paise, durations, hourly):
+    """
+    Prices in paise, elementwise over the broadcast arrays: the rates (inf
+    when the equipment has none), the durations, and whether those are
+    hours. NaN where the equipment has no rate for the booking.
+    """
+    day_paise, hour_paise = np.asarray(day_paise), np.asarray(hour_paise)
+    durations, hourly = np.asarray(durations, dtype=np.int64), np.asarray(hourly, dtype=bool)
+    day = np.fmin(day_paise, hour_paise * WORKING_HOURS_PER_DAY)
+
+    whole_days, hours = np.divmod(durations, 24)
+    # Both branches are computed everywhere; inf * 0 in the unused one is harmless
+    with np.errstate(invalid='ignore'):
+        by_day = durations * day
+        by_hour = (
+            np.where(whole_days > 0, whole_days * np.fmin(day_paise, 24 * hour_paise), 0)
+            + np.where(hours > 0, np.fmin(hours * hour_paise, day_paise), 0)
+        )
+    base = np.where(hourly, by_hour, by_day)
+    base = np.where(np.isfinite(base), base, np.nan)
+
+    percent = discounts(np.where(hourly, durations / 24, durations))
+    return np.floor((base * (100 - percent) + 50) / 100)
+
+
+def _decimal(paise):
+    return None if np.isnan(paise) else Decimal(int(paise)).scaleb(-2)
+
+
+def prices(day_rates, hour_rates, durations, duration_types):
+    """Price of each (day rate, hourly rate, duration, duration type) row; 0 without a rate for it."""
+    paise = amounts(
+        _paise(day_rates), _paise(hour_rates), list(durations),
+        [duration_type == 'hours' for duration_type in duration_types],
+    )
+    return [_decimal(value) or Decimal('0.00') for value in paise.tolist()]
+
+
+def price(equipment, duration, duration_type):
+    """Price of booking ``equipment`` for ``duration`` days or hours."""
+    return prices([equipment.rent_per_day], [equipment.rent_per_hour], [duration], [duration_type])[0]
+
+
+def quote_table(equipment_list, durations, duration_type):
+    """
+    ``[[Quote, ...], ...]``: a row per item of ``equipment_list``, a quote
+    per duration. Quotes for equipment without a rate have amount None.
+    """
+    durations = list(durations)
+    hourly = duration_type == 'hours'
+    paise = amounts(
+        _paise(item.rent_per_day for item in equipment_list)[:, None],
+        _paise(item.rent_per_hour for item in equipment_list)[:, None],
+        np.array(durations)[None, :],
+        hourly,
+    )
+    off = discounts(np.array(durations) / 24 if hourly else durations).tolist()
+    return [
+        [Quote(duration, duration_type, _decimal(value), percent) for duration, value, percent in zip(durations, row, off)]
+        for row in paise.tolist()
+    ]
+
+
+def compared_duration(key):
+    """The COMPARED_DURATIONS entry called ``key``, or None."""
+    for option in COMPARED_DURATIONS:
+        if option[0] == key:
+            return option
+    return None
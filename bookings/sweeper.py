@@ -0,0 +1,87 @@
+"""
+Booking lifecycle sweeper.
+
+Approved bookings whose interval has ended are completed here instead of
+waiting for the owner to mark them. ``manage.py sweep_bookings`` runs it; it
+is meant to run from cron every minute::
+
+    * * * * * cd /srv/greengear && python manage.py sweep_bookings
+
+Ended bookings are found on the partial (end_at, id) index of approved
+bookings, so a sweep with nothing to do is one index seek however long the
+booking history is. They are handled BATCH_SIZE at a time, each batch in a
+short transaction of set-based UPDATEs: the bookings and the owners' and
+farmers' counters. Like transition(), a
+batch first locks the equipment rows involved, so it never interleaves
+with an owner changing one of the same bookings, and overlapping sweeps
+simply find nothing left to do.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from equipment import catalog_cache
+from equipment.models import Equipment
+from users import counters
+from . import pricing
+from .models import Booking
+
+BATCH_SIZE = 500
+
+SWEPT_FIELDS = (
+    'id', 'farmer_id', 'equipment_id', 'equipment__owner_id', 'total_amount', 'duration', 'duration_type',
+    'equipment__rent_per_day', 'equipment__rent_per_hour',
+)
+
+
+def ended_bookings(now=None):
+    """Approved bookings that ended by ``now``, oldest first."""
+    return Booking.objects.filter(status='approved', end_at__lte=now or timezone.now()).order_by('end_at', 'id')
+
+
+def _complete(ids, now):
+    """Complete the still-approved bookings among ``ids``; returns how many were."""
+    with transaction.atomic():
+        equipment_ids = sorted(set(Booking.objects.filter(id__in=ids).values_list('equipment_id', flat=True)))
+        locked = Equipment.objects.filter(id__in=equipment_ids).order_by('id')
+        if connection.features.has_select_for_update:
+            locked = locked.select_for_update()
+        list(locked.values_list('id'))
+
+        # Re-read under the lock: an owner may have just changed some of them
+        rows = list(Booking.objects.filter(id__in=ids, status='approved').values(*SWEPT_FIELDS))
+        if not rows:
+            return 0
+        Booking.objects.filter(id__in=[row['id'] for row in rows]).update(status='completed', updated_at=now)
+        # As in transition(): completing prices a booking that has no amount yet
+        unpriced = [row for row in rows if not row['total_amount']]
+        amounts = dict(zip([row['id'] for row in unpriced], pricing.prices(
+            [row['equipment__rent_per_day'] for row in unpriced],
+            [row['equipment__rent_per_hour'] for row in unpriced],
+            [row['duration'] for row in unpriced],
+            [row['duration_type'] for row in unpriced],
+        )))
+        Booking.objects.bulk_update(
+            [Booking(id=booking_id, total_amount=amount) for booking_id, amount in amounts.items()], ['total_amount']
+        )
+
+        counters.bookings_changed([
+            (
+                (row['farmer_id'], row['equipment__owner_id'], 'approved', row['total_amount']),
+                (row['farmer_id'], row['equipment__owner_id'], 'completed', amounts.get(row['id'], row['total_amount'])),
+            )
+            for row in rows
+        ])
+    return len(rows)
+
+
+def sweep(batch_size=BATCH_SIZE, now=None):
+    """Complete every approved booking that has ended. Returns how many were completed."""
+    now = now or timezone.now()
+    completed = 0
+    # Every batch leaves the index (completed, or changed by an owner
+    # meanwhile), so the next one starts at the next ended booking
+    while ids := list(ended_bookings(now).values_list('id', flat=True)[:batch_size]):
+        completed += _complete(ids, now)
+    if completed:
+        catalog_cache.invalidate()
+    return completed
@@ -1,3 +1,506 @@
-from django.test import TestCase
+import csv
+import threading
+import warnings
+from io import StringIO
+from unittest import mock
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from equipment.models import Equipment
+from greengear_project.querycount import budget_for
+from greengear_project.testing import QueryBudgetTestCase, query_plan
+from users.counters import counters_for
+from users.models import User
+from . import pricing, urls
+from .models import Booking
+from .sweeper import ended_bookings, sweep
+from .intervals import DEFAULT_START_TIME, booking_interval, find_conflict
+from .transitions import BookingConflict, TransitionError, create_booking, transition
+
+
+def make_equipment():
+    owner = User.objects.create_user('owner', role='owner')
+    return Equipment.objects.create(
+        owner=owner, name='Tractor', category='tractor', description='45 HP',
+        rent_per_day=1000, rent_per_hour=150, location='Pune',
+    )
+
+
+class BookingTransitionTests(TestCase):
+    def setUp(self):
+        self.equipment = make_equipment()
+        self.farmer = User.objects.create_user('farmer', role='farmer')
+        self.start = date.today() + timedelta(days=3)
+
+    def book(self, start=None, duration=2):
+        return create_booking(self.farmer, self.equipment.id, start or self.start, duration, 'days')
+
+    def test_lifecycle(self):
+        booking = self.book()
+        self.assertEqual(booking.status, 'pending')
+        self.assertEqual(booking.total_amount, 2000)
+        self.assertEqual(transition(booking.id, 'approved').status, 'approved')
+        self.assertEqual(transition(booking.id, 'completed').status, 'completed')
+
+    def test_invalid_transitions(self):
+        booking = self.book()
+        with self.assertRaises(TransitionError):
+            transition(booking.id, 'completed')
+        transition(booking.id, 'rejected')
+        for status in ('approved', 'completed', 'cancelled'):
+            with self.assertRaises(TransitionError):
+                transition(booking.id, status)
+        self.assertEqual(Booking.objects.get(id=booking.id).status, 'rejected')
+
+    def test_overlapping_booking_is_refused(self):
+        self.book()
+        with self.assertRaises(BookingConflict):
+            self.book(start=self.start + timedelta(days=1))
+        # Back to back is fine
+        self.book(start=self.start + timedelta(days=2))
+
+    def test_bookings_leave_availability_alone(self):
+        # A request for later dates keeps the equipment listed
+        first = self.book(start=self.start + timedelta(days=300))
+        self.equipment.refresh_from_db()
+        self.assertTrue(self.equipment.availability)
+        self.assertContains(self.client.get(reverse('equipment:list')), 'Tractor')
+
+        # Closing a booking doesn't undo the owner taking it off the market
+        Equipment.objects.filter(id=self.equipment.id).update(availability=False)
+        transition(first.id, 'cancelled')
+        self.equipment.refresh_from_db()
+        self.assertFalse(self.equipment.availability)
+
+    def test_detail_shows_whether_booked_now(self):
+        url = reverse('equipment:detail', args=[self.equipment.id])
+        self.book()
+        response = self.client.get(url)
+        self.assertEqual((response.context['is_available'], response.context['can_book']), (True, True))
+
+        self.book(start=date.today())
+        response = self.client.get(url)
+        self.assertEqual((response.context['is_available'], response.context['can_book']), (False, True))
+        self.assertContains(response, 'Booked right now')
+
+    def test_transition_writes_only_changed_columns(self):
+        booking = self.book()
+        with CaptureQueriesContext(connection) as queries:
+            transition(booking.id, 'rejected')
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+        booking_updates = [sql for sql in updates if sql.startswith('UPDATE "bookings_booking"')]
+        self.assertFalse([sql for sql in updates if sql.startswith('UPDATE "equipment_equipment"')])
+        self.assertEqual(len(booking_updates), 1)
+        self.assertNotIn('"start_date"', booking_updates[0])
+
+
+class BookingIntervalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipment = make_equipment()
+        cls.farmer = User.objects.create_user('farmer', role='farmer')
+        cls.day = date.today() + timedelta(days=10)
+        # Days 0-1, and 10:00-14:00 on day 3
+        cls.days = create_booking(cls.farmer, cls.equipment.id, cls.day, 2, 'days')
+        cls.hours = create_booking(cls.farmer, cls.equipment.id, cls.day + timedelta(days=3), 4, 'hours', time(10))
+
+    def conflict(self, day, duration, duration_type, start_time=None, exclude_id=None):
+        start_at, end_at = booking_interval(self.day + timedelta(days=day), duration, duration_type, start_time)
+        return find_conflict(self.equipment.id, start_at, end_at, exclude_id)
+
+    def test_intervals(self):
+        self.assertEqual(self.days.end_at - self.days.start_at, timedelta(days=2))
+        self.assertEqual(self.days.start_at.time(), time.min)
+        self.assertEqual(self.hours.start_at.time(), time(10))
+        self.assertEqual(self.hours.end_at.time(), time(14))
+        start_at, _ = booking_interval(self.day, 2, 'hours')
+        self.assertEqual(start_at.time(), DEFAULT_START_TIME)
+
+    def test_touching_intervals_do_not_conflict(self):
+        self.assertIsNone(self.conflict(-2, 2, 'days'))
+        self.assertIsNone(self.conflict(2, 1, 'days'))
+        self.assertIsNone(self.conflict(-1, 24, 'hours', time(0)))
+        self.assertIsNone(self.conflict(3, 2, 'hours', time(8)))
+        self.assertIsNone(self.conflict(3, 2, 'hours', time(14)))
+
+    def test_overlap_and_containment(self):
+        for args, booking in (
+            ((-1, 2, 'days'), self.days),
+            ((1, 2, 'days'), self.days),
+            # Containing the booking, and contained in it
+            ((-1, 5, 'days'), self.hours),
+            ((0, 1, 'days'), self.days),
+            ((1, 3, 'hours', time(8)), self.days),
+            ((3, 1, 'hours', time(11)), self.hours),
+            ((3, 2, 'hours', time(13)), self.hours),
+            ((3, 4, 'hours', time(9)), self.hours),
+        ):
+            self.assertEqual(self.conflict(*args), booking, args)
+
+    def test_hourly_against_daily(self):
+        # A day booking takes the whole day, an hourly one just its hours
+        self.assertEqual(self.conflict(1, 2, 'hours', time(23)), self.days)
+        self.assertEqual(self.conflict(3, 1, 'days'), self.hours)
+        self.assertIsNone(self.conflict(2, 10, 'hours', time(0)))
+
+    def test_only_active_bookings_conflict(self):
+        self.assertIsNone(self.conflict(0, 1, 'days', exclude_id=self.days.id))
+        transition(self.days.id, 'cancelled')
+        self.assertIsNone(self.conflict(0, 2, 'days'))
+        transition(self.hours.id, 'rejected')
+        self.assertIsNone(self.conflict(-1, 10, 'days'))
+
+        # A later inactive booking doesn't hide an earlier active one
+        active = create_booking(self.farmer, self.equipment.id, self.day, 2, 'days')
+        self.assertEqual(self.conflict(1, 3, 'days'), active)
+        self.assertEqual(create_booking(self.farmer, self.equipment.id, self.day + timedelta(days=2), 1, 'days').status, 'pending')
+
+    def test_one_seek_per_status(self):
+        transition(self.hours.id, 'approved')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.conflict(2, 3, 'days'), self.hours)
+        self.assertEqual(len(queries), 2)
+        if connection.vendor == 'sqlite':
+            for query in queries.captured_queries:
+                plan = query_plan(query['sql'])
+                self.assertEqual(len(plan), 1, plan)
+                self.assertIn('booking_interval_idx', plan[0])
+
+
+class PricingTests(TestCase):
+    def test_prices(self):
+        rows = [
+            # day rate, hourly rate, duration, type, price
+            (1000, 150, 2, 'days', 2000),
+            (None, 100, 2, 'days', 1600),
+            (None, None, 2, 'days', 0),
+            (1000, 150, 5, 'hours', 750),
+            # Hours past the day rate cost the day rate
+            (1000, 150, 10, 'hours', 1000),
+            (1000, 150, 30, 'hours', 1900),
+            (1000, None, 3, 'hours', 1000),
+            # Long rentals are discounted
+            (1000, 150, 7, 'days', 6300),
+            (1000, 150, 30, 'days', 24000),
+            (99.99, None, 7, 'days', Decimal('629.94')),
+            (1000, 150, 200, 'hours', 8100),
+        ]
+        prices = pricing.prices(*zip(*[row[:4] for row in rows]))
+        self.assertEqual(prices, [row[4] for row in rows])
+
+    def test_quote_table(self):
+        equipment = [make_equipment(), Equipment(rent_per_day=None, rent_per_hour=None)]
+        first, second = pricing.quote_table(equipment, [1, 7], 'days')
+        self.assertEqual([(quote.amount, quote.discount) for quote in first], [(1000, 0), (6300, 10)])
+        self.assertEqual([quote.amount for quote in second], [None, None])
+        self.assertEqual(pricing.quote_table([], [1], 'days'), [])
+
+    def test_booking_form(self):
+        equipment = make_equipment()
+        farmer = User.objects.create_user('farmer', role='farmer')
+        self.client.force_login(farmer)
+        response = self.client.get(reverse('bookings:create', args=[equipment.id]))
+        self.assertEqual(response.context['quotes']['days'][6], ['6300.00', 10])
+        self.assertEqual(response.context['quotes']['hours'][9], ['1000.00', 0])
+        self.assertContains(response, '1 week:</span>')
+
+        booking = create_booking(farmer, equipment.id, date.today() + timedelta(days=1), 7, 'days')
+        self.assertEqual(booking.total_amount, 6300)
+
+
+class BookingSweeperTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.equipment = make_equipment()
+        self.farmer = User.objects.create_user('farmer', role='farmer')
+        self.start = date.today() + timedelta(days=3)
+
+    def book(self, offset, status='approved'):
+        booking = create_booking(self.farmer, self.equipment.id, self.start + timedelta(days=offset), 2, 'days')
+        if status != 'pending':
+            transition(booking.id, status)
+        return booking
+
+    def day(self, offset):
+        # Midnight ``offset`` days after self.start
+        return timezone.make_aware(datetime.combine(self.start + timedelta(days=offset), time()))
+
+    def test_ended_bookings_are_completed(self):
+        ended, later = self.book(0), self.book(5)
+        pending = self.book(10, status='pending')
+
+        self.assertEqual(sweep(now=self.day(3)), 1)
+        statuses = dict(Booking.objects.values_list('id', 'status'))
+        self.assertEqual(statuses, {ended.id: 'completed', later.id: 'approved', pending.id: 'pending'})
+        # Nothing left to do until the next one ends
+        self.assertEqual(sweep(now=self.day(3)), 0)
+
+    def test_batches_leave_availability_alone(self):
+        self.book(0)
+        self.book(2)
+        Equipment.objects.filter(id=self.equipment.id).update(availability=False)
+        self.assertEqual(sweep(batch_size=1, now=self.day(4)), 2)
+        self.equipment.refresh_from_db()
+        self.assertFalse(self.equipment.availability)
+
+    def test_counters_and_amounts(self):
+        farmer = counters_for(self.farmer)
+        owner = counters_for(self.equipment.owner)
+        self.assertEqual((farmer.bookings_approved, owner.requests_approved), (0, 0))
+
+        booking = self.book(0)
+        # Bookings without an amount are priced when they complete
+        Booking.objects.filter(id=booking.id).update(total_amount=0)
+        sweep(now=self.day(2))
+
+        booking.refresh_from_db()
+        self.assertEqual(booking.total_amount, 2000)
+        farmer, owner = counters_for(self.farmer), counters_for(self.equipment.owner)
+        self.assertEqual((farmer.bookings_approved, farmer.bookings_completed), (0, 1))
+        self.assertEqual((owner.requests_approved, owner.requests_completed), (0, 1))
+        self.assertEqual(owner.total_earnings, 2000)
+
+    def test_command(self):
+        self.book(-10)
+        out = StringIO()
+        call_command('sweep_bookings', stdout=out)
+        self.assertIn('Completed 1 ended bookings.', out.getvalue())
+
+    def test_query_plan(self):
+        self.assertUsesIndex(ended_bookings().values('id'), 'booking_approved_end_idx')
+
+
+class BookingQueryBudgetTests(QueryBudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owners = [User.objects.create_user(f'owner{i}', role='owner') for i in range(3)]
+        cls.owner = owners[0]
+        cls.farmer = User.objects.create_user('farmer', role='farmer')
+        cls.equipment = [
+            Equipment.objects.create(
+                owner=owners[i % 3], name=f'Harvester {i}', category='harvester',
+                description='Combine harvester', rent_per_day=2500, rent_per_hour=400, location='Pune',
+            )
+            for i in range(6)
+        ]
+        start = date.today() + timedelta(days=3)
+        cls.bookings = [create_booking(cls.farmer, item.id, start, 2, 'days') for item in cls.equipment]
+
+    def assertCheap(self, response):
+        self.assertWithinQueryBudget(response)
+        self.assertNoRepeatedQueries(response)
+
+    def test_every_view_has_a_budget(self):
+        for pattern in urls.urlpatterns:
+            self.assertIsNotNone(budget_for(f'{urls.app_name}:{pattern.name}'), pattern.name)
+
+    def test_farmer_views(self):
+        self.client.force_login(self.farmer)
+        item = self.equipment[0]
+        for url in (
+            reverse('bookings:create', args=[item.id]),
+            reverse('bookings:detail', args=[self.bookings[0].id]),
+            reverse('bookings:farmer_list'),
+            reverse('bookings:farmer_list') + '?status=pending',
+        ):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertCheap(response)
+
+        response = self.client.post(reverse('bookings:create', args=[item.id]), {
+            'start_date': (date.today() + timedelta(days=10)).isoformat(),
+            'duration': '4', 'duration_type': 'hours', 'start_time': '09:00',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertWithinQueryBudget(response)
+
+    def test_owner_views(self):
+        self.client.force_login(self.owner)
+        booking = self.bookings[0]
+        for url in (reverse('bookings:detail', args=[booking.id]), reverse('bookings:owner_list')):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertCheap(response)
+
+        for status in ('approved', 'completed'):
+            response = self.client.get(reverse('bookings:update_status', args=[booking.id, status]))
+            self.assertEqual(response.status_code, 302)
+            self.assertWithinQueryBudget(response)
+
+    def test_query_plans(self):
+        self.client.force_login(self.farmer)
+        with self.assertNoFullScans():
+            for url in (
+                reverse('bookings:create', args=[self.equipment[1].id]),
+                reverse('bookings:detail', args=[self.bookings[0].id]),
+                reverse('bookings:farmer_list'),
+                reverse('bookings:farmer_list') + '?status=pending',
+            ):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.client.force_login(self.owner)
+        with self.assertNoFullScans():
+            for url in (reverse('bookings:owner_list'), reverse('bookings:owner_list') + '?status=approved'):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+        farmer_bookings = Booking.objects.filter(farmer=self.farmer).order_by('-created_at', '-id')
+        self.assertUsesIndex(farmer_bookings.filter(status='pending')[:21], 'booking_farmer_status_idx')
+        self.assertUsesIndex(farmer_bookings[:21], 'booking_farmer_created_idx')
+        self.assertUsesIndex(
+            Booking.objects.filter(equipment=self.equipment[0], status__in=['pending', 'approved']),
+            'booking_interval_idx',
+        )
+
+
+class BookingExportTests(QueryBudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', role='owner')
+        other_owner = User.objects.create_user('other', role='owner')
+        cls.farmer = User.objects.create_user('farmer', role='farmer')
+        cls.admin = User.objects.create_user('admin', role='owner', is_superuser=True)
+        start = date.today() + timedelta(days=3)
+        cls.bookings = []
+        for i, owner in enumerate([cls.owner] * 4 + [other_owner]):
+            item = Equipment.objects.create(
+                owner=owner, name=f'Sprayer {i}', category='sprayer', description='Boom sprayer',
+                rent_per_day=500, rent_per_hour=80, location='Pune',
+            )
+            cls.bookings.append(create_booking(cls.farmer, item.id, start + timedelta(days=i), 1, 'days'))
+        for booking in cls.bookings[:2]:
+            transition(booking.id, 'approved')
+            transition(booking.id, 'completed')
+
+    def export(self, name='bookings:export', query=''):
+        response = self.client.get(reverse(name) + query)
+        self.assertEqual(response.status_code, 200)
+        self.assertWithinQueryBudget(response)
+        # The whole export is one query, however many rows it streams
+        with CaptureQueriesContext(connection) as queries:
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(queries), 1)
+        return lines[0].split(','), [line.split(',') for line in lines[1:]]
+
+    def test_owner_sees_only_their_bookings(self):
+        self.client.force_login(self.owner)
+        header, rows = self.export()
+        self.assertEqual(header[0], 'Booking')
+        self.assertEqual([int(row[0]) for row in rows], [b.id for b in self.bookings[:4]])
+
+    def test_admin_sees_every_booking(self):
+        self.client.force_login(self.admin)
+        _, rows = self.export()
+        self.assertEqual(len(rows), 5)
+
+    def test_filters(self):
+        self.client.force_login(self.owner)
+        _, rows = self.export(query='?status=pending')
+        self.assertEqual([int(row[0]) for row in rows], [b.id for b in self.bookings[2:4]])
+
+        first = self.bookings[1].start_date.isoformat()
+        _, rows = self.export(query=f'?from={first}&to={first}&status=completed&status=pending')
+        self.assertEqual([int(row[0]) for row in rows], [self.bookings[1].id])
+
+    def test_earnings_running_total(self):
+        self.client.force_login(self.owner)
+        header, rows = self.export('bookings:export_earnings')
+        self.assertEqual(header[-1], 'Running total')
+        self.assertEqual([row[-1] for row in rows], ['500.00', '1000.00'])
+
+    async def test_streams_under_asgi(self):
+        await self.async_client.aforce_login(self.owner)
+        with mock.patch('bookings.exports.CHUNK_SIZE', 2), warnings.catch_warnings():
+            # Django warns when it has to buffer a sync iterator for ASGI
+            warnings.filterwarnings('error', 'StreamingHttpResponse must consume')
+            response = await self.async_client.get(reverse('bookings:export'))
+            self.assertTrue(response.is_async)
+            parts = [part async for part in response]
+        # The header and four rows, two lines at a time
+        self.assertEqual(len(parts), 3)
+        lines = b''.join(parts).decode().splitlines()
+        self.assertEqual([int(line.split(',')[0]) for line in lines[1:]], [b.id for b in self.bookings[:4]])
+
+    def test_formulas_are_not_exported(self):
+        booking = self.bookings[0]
+        booking.equipment.name = '=HYPERLINK("http://evil.example","Sprayer")'
+        booking.equipment.save()
+        User.objects.filter(id=self.farmer.id).update(first_name='@SUM(A1:A9)', phone='+919876543210')
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('bookings:export'))
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        row = next(row for row in rows if row[0] == str(booking.id))
+        self.assertEqual(row[3], '\'=HYPERLINK("http://evil.example","Sprayer")')
+        self.assertEqual(row[6], "'@SUM(A1:A9)")
+        self.assertEqual(row[7], "'+919876543210")
+        # Numbers are left alone
+        self.assertEqual(row[-1], '500.00')
+
+    def test_rejected_requests(self):
+        self.client.force_login(self.owner)
+        for query in ('?from=yesterday', '?from=2030-01-02&to=2030-01-01', '?status=lost'):
+            response = self.client.get(reverse('bookings:export') + query)
+            self.assertRedirects(response, reverse('bookings:owner_list'), fetch_redirect_response=False)
+
+        self.client.force_login(self.farmer)
+        self.assertEqual(self.client.get(reverse('bookings:export')).status_code, 302)
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    THREADS = 6
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('needs a file or server test database shared by several connections')
+        self.equipment = make_equipment()
+        self.farmers = [
+            User.objects.create_user(f'farmer{i}', role='farmer')
+            for i in range(self.THREADS)
+        ]
+        self.start = date.today() + timedelta(days=3)
+
+    def run_concurrently(self, calls):
+        barrier = threading.Barrier(len(calls))
+        outcomes = [None] * len(calls)
+
+        def worker(index, call):
+            try:
+                barrier.wait()
+                outcomes[index] = call()
+            except Exception as e:
+                outcomes[index] = e
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i, call)) for i, call in enumerate(calls)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_exactly_one_farmer_gets_the_slot(self):
+        outcomes = self.run_concurrently([
+            lambda farmer=farmer: create_booking(farmer, self.equipment.id, self.start, 2, 'days')
+            for farmer in self.farmers
+        ])
+        winners = [o for o in outcomes if isinstance(o, Booking)]
+        self.assertEqual(len(winners), 1, outcomes)
+        self.assertTrue(all(isinstance(o, (Booking, BookingConflict)) for o in outcomes), outcomes)
+        self.assertEqual(Booking.objects.filter(equipment=self.equipment).count(), 1)
+
+    def test_exactly_one_status_change_wins(self):
+        booking = create_booking(self.farmers[0], self.equipment.id, self.start, 2, 'days')
+        outcomes = self.run_concurrently([
+            lambda status=status: transition(booking.id, status)
+            for status in ('approved', 'rejected') * 3
+        ])
+        winners = [o for o in outcomes if isinstance(o, Booking)]
+        self.assertEqual(len(winners), 1, outcomes)
+        self.assertTrue(all(isinstance(o, (Booking, TransitionError)) for o in outcomes), outcomes)
+        self.assertEqual(Booking.objects.get(id=booking.id).status, winners[0].status)
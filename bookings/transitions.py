@@ -0,0 +1,86 @@
+"""
+Booking state machine.
+
+    pending  -> approved | rejected | cancelled
+    approved -> completed | cancelled
+
+Creating a booking and every status change run in one transaction that
+first locks the equipment row (SELECT ... FOR UPDATE where the database
+supports it; SQLite transactions are begun IMMEDIATE, see settings, and
+so hold the database write lock throughout). Conflict and status checks
+therefore see every booking committed before them, and two farmers
+asking for the same slot at the same moment get exactly one booking
+between them.
+"""
+from django.db import connection, transaction
+
+from equipment.models import Equipment
+from .intervals import booking_interval, find_conflict
+from .models import Booking
+
+TRANSITIONS = {
+    'pending': ('approved', 'rejected', 'cancelled'),
+    'approved': ('completed', 'cancelled'),
+}
+
+
+class TransitionError(Exception):
+    """The booking can't be created or moved to the requested status."""
+
+
+class BookingConflict(TransitionError):
+    def __init__(self, conflict):
+        super().__init__(f'Overlaps booking #{conflict.id}.')
+        self.conflict = conflict
+
+
+def lock_equipment(**lookup):
+    """Lock the matching equipment row until the surrounding transaction ends and return it."""
+    equipment = Equipment.objects.filter(**lookup)
+    if connection.features.has_select_for_update:
+        equipment = equipment.select_for_update()
+    return equipment.get()
+
+
+def allowed_transitions(status):
+    return TRANSITIONS.get(status, ())
+
+
+def create_booking(farmer, equipment_id, start_date, duration, duration_type, start_time=None):
+    """Insert a pending booking, or raise BookingConflict if its interval is taken."""
+    with transaction.atomic():
+        equipment = lock_equipment(id=equipment_id)
+        start_at, end_at = booking_interval(start_date, duration, duration_type, start_time)
+        conflict = find_conflict(equipment.id, start_at, end_at)
+        if conflict:
+            raise BookingConflict(conflict)
+        booking = Booking(
+            farmer=farmer,
+            equipment=equipment,
+            start_date=start_date,
+            start_time=start_time,
+            duration=duration,
+            duration_type=duration_type,
+        )
+        booking.save()
+    return booking
+
+
+def transition(booking_id, status):
+    """Move the booking to ``status`` and return it, or raise TransitionError."""
+    with transaction.atomic():
+        equipment = lock_equipment(bookings=booking_id)
+        # Re-read under the lock; the caller's copy may already be stale
+        booking = Booking.objects.get(id=booking_id)
+        booking.equipment = equipment
+        if status not in allowed_transitions(booking.status):
+            raise TransitionError(
+                f'Booking #{booking.id} is {booking.get_status_display().lower()} and cannot be marked {status}.'
+            )
+        booking.status = status
+        update_fields = ['status', 'updated_at']
+        if status == 'completed' and not booking.total_amount:
+            booking.total_amount = booking.price()
+            update_fields.append('total_amount')
+        booking.save(update_fields=update_fields)
+    return booking
@@ -8,5 +8,7 @@ urlpatterns = [
     path('<int:booking_id>/', views.booking_detail, name='detail'),
     path('farmer/', views.farmer_bookings, name='farmer_list'),
     path('owner/', views.owner_bookings, name='owner_list'),
+    path('export/bookings.csv', views.export_bookings, name='export'),
+    path('export/earnings.csv', views.export_earnings, name='export_earnings'),
     path('update/<int:booking_id>/<str:status>/', views.update_booking_status, name='update_status'),
 ]
\ No newline at end of file
@@ -1,10 +1,22 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.core.handlers.asgi import ASGIRequest
 from django.db.models import Q
+from django.utils import timezone
 from datetime import date, datetime  # Add this import
 from .models import Booking
+from . import pricing
+from .exports import ExportError, booking_rows, csv_response, earnings_rows, filter_bookings
+from .intervals import upcoming_bookings
+from .transitions import BookingConflict, TransitionError, create_booking, transition
 from equipment.models import Equipment
+from greengear_project.db_router import replica_reads
+from greengear_project.pagination import paginate
+
+# Longest bookings the form prices as the farmer types; longer ones are priced on submit
+QUOTED_DAYS = 90
+QUOTED_HOURS = 72
 
 @login_required
 def booking_create(request, equipment_id):
@@ -12,28 +24,21 @@ def booking_create(request, equipment_id):
         messages.error(request, 'Only farmers can book equipment.')
         return redirect('home')
     
-    equipment = get_object_or_404(Equipment, id=equipment_id)
+    equipment = get_object_or_404(Equipment.objects.select_related('owner'), id=equipment_id)
     
-    # Check if equipment is available
+    # Existing bookings only block their own dates; unavailable equipment
+    # has been taken off the market by its owner
     if not equipment.availability:
         messages.error(request, 'This equipment is currently not available for booking.')
         return redirect('equipment:detail', equipment_id=equipment_id)
-    
-    # Check for active bookings
-    active_booking = Booking.objects.filter(
-        equipment=equipment,
-        status__in=['pending', 'approved']
-    ).exists()
-    
-    if active_booking:
-        messages.error(request, 'This equipment is currently booked by another farmer.')
-        return redirect('equipment:detail', equipment_id=equipment_id)
+    booked_intervals = list(upcoming_bookings(equipment.id))
     
     # Set minimum date to today
     min_date = date.today().isoformat()
     
     if request.method == 'POST':
         start_date = request.POST.get('start_date')
+        start_time = request.POST.get('start_time') or None
         duration = request.POST.get('duration')
         duration_type = request.POST.get('duration_type')
         
@@ -46,50 +51,66 @@ def booking_create(request, equipment_id):
             messages.error(request, 'Start date must be in the future.')
             return redirect('bookings:create', equipment_id=equipment_id)
         
-        # Check for date conflicts
-        existing_booking = Booking.objects.filter(
-            equipment=equipment,
-            start_date=start_date,
-            status__in=['pending', 'approved']
-        ).exists()
-        
-        if existing_booking:
-            messages.error(request, 'Equipment is already booked for the selected date.')
+        try:
+            start_date = date.fromisoformat(start_date)
+            start_time = datetime.strptime(start_time, '%H:%M').time() if start_time else None
+            if int(duration) < 1:
+                raise ValueError
+        except ValueError:
+            messages.error(request, 'Please enter a valid start date, time and duration.')
             return redirect('bookings:create', equipment_id=equipment_id)
         
-        # Calculate total amount
-        if duration_type == 'days':
-            total_amount = int(duration) * (equipment.rent_per_day or 0)
-        else:
-            total_amount = int(duration) * (equipment.rent_per_hour or 0)
+        # Only hourly bookings start at a particular time of day
+        if duration_type != 'hours':
+            start_time = None
         
+        # The overlap check and the insert run under a lock on the equipment
         try:
-            booking = Booking.objects.create(
-                farmer=request.user,
-                equipment=equipment,
-                start_date=start_date,
-                duration=duration,
-                duration_type=duration_type,
-                total_amount=total_amount
+            booking = create_booking(
+                request.user, equipment.id, start_date, int(duration), duration_type, start_time
             )
-            messages.success(request, f'Booking request sent! Total amount: ₹{total_amount}. Pay cash on delivery.')
+            messages.success(request, f'Booking request sent! Total amount: ₹{booking.total_amount}. Pay cash on delivery.')
             return redirect('bookings:detail', booking_id=booking.id)
+        except BookingConflict as e:
+            conflict = e.conflict
+            messages.error(
+                request,
+                f'Equipment is already booked from {timezone.localtime(conflict.start_at):%b %d, %Y %H:%M} '
+                f'to {timezone.localtime(conflict.end_at):%b %d, %Y %H:%M}. Please choose another time.'
+            )
+            return redirect('bookings:create', equipment_id=equipment_id)
         except Exception as e:
             messages.error(request, f'Error creating booking: {str(e)}')
     
+    # Every total the form can show, priced at once
+    quotes = {
+        duration_type: pricing.quote_table([equipment], range(1, limit + 1), duration_type)[0]
+        for duration_type, limit in (('days', QUOTED_DAYS), ('hours', QUOTED_HOURS))
+    }
+    
     context = {
         'equipment': equipment,
         'equipment_id': equipment_id,
-        'min_date': min_date
+        'min_date': min_date,
+        'booked_intervals': booked_intervals,
+        'quotes': {
+            duration_type: [[str(quote.amount or 0), quote.discount] for quote in row]
+            for duration_type, row in quotes.items()
+        },
+        'compared_quotes': [
+            (label, quotes[duration_type][duration - 1])
+            for _, duration, duration_type, label in pricing.COMPARED_DURATIONS
+        ],
     }
     return render(request, 'bookings/create.html', context)
 
 @login_required
 def booking_detail(request, booking_id):
+    bookings = Booking.objects.select_related('equipment', 'equipment__owner', 'farmer')
     if request.user.role == 'farmer':
-        booking = get_object_or_404(Booking, id=booking_id, farmer=request.user)
+        booking = get_object_or_404(bookings, id=booking_id, farmer=request.user)
     else:
-        booking = get_object_or_404(Booking, id=booking_id, equipment__owner=request.user)
+        booking = get_object_or_404(bookings, id=booking_id, equipment__owner=request.user)
     
     context = {
         'booking': booking
@@ -97,6 +118,7 @@ def booking_detail(request, booking_id):
     return render(request, 'bookings/detail.html', context)
 
 @login_required
+@replica_reads
 def farmer_bookings(request):
     if request.user.role != 'farmer':
         messages.error(request, 'Access denied.')
@@ -109,13 +131,17 @@ def farmer_bookings(request):
     if status_filter:
         bookings = bookings.filter(status=status_filter)
     
+    page = paginate(request, bookings, ordering=('-created_at', '-id'))
+    
     context = {
-        'bookings': bookings,
+        'bookings': page.object_list,
+        'page': page,
         'status_filter': status_filter
     }
     return render(request, 'bookings/farmer_list.html', context)
 
 @login_required
+@replica_reads
 def owner_bookings(request):
     if request.user.role != 'owner':
         messages.error(request, 'Access denied.')
@@ -130,8 +156,11 @@ def owner_bookings(request):
     if status_filter:
         booking_requests = booking_requests.filter(status=status_filter)
     
+    page = paginate(request, booking_requests, ordering=('-created_at', '-id'))
+    
     context = {
-        'booking_requests': booking_requests,
+        'booking_requests': page.object_list,
+        'page': page,
         'status_filter': status_filter
     }
     return render(request, 'bookings/owner_list.html', context)
@@ -149,18 +178,12 @@ def update_booking_status(request, booking_id, status):
         messages.error(request, 'Invalid status.')
         return redirect('bookings:owner_list')
     
-    # If marking as completed, ensure total_amount is calculated
-    if status == 'completed' and not booking.total_amount:
-        # Recalculate total amount
-        if booking.duration_type == 'days':
-            booking.total_amount = booking.duration * (booking.equipment.rent_per_day or 0)
-        else:
-            booking.total_amount = booking.duration * (booking.equipment.rent_per_hour or 0)
-    
     # Update booking status
-    old_status = booking.status
-    booking.status = status
-    booking.save()
+    try:
+        booking = transition(booking.id, status)
+    except TransitionError as e:
+        messages.error(request, str(e))
+        return redirect('bookings:owner_list')
     
     status_display = dict(Booking.STATUS_CHOICES).get(status)
     messages.success(request, f'Booking #{booking_id} has been {status_display.lower()}.')
@@ -169,4 +192,37 @@ def update_booking_status(request, booking_id, status):
     if status == 'completed':
         messages.info(request, f'Earnings of ₹{booking.total_amount} added to your total.')
     
-    return redirect('bookings:owner_list')
\ No newline at end of file
+    return redirect('bookings:owner_list')
+
+def _exportable_bookings(user):
+    """Every booking for admins, bookings of their own equipment for owners, else None."""
+    if user.is_superuser:
+        return Booking.objects.all()
+    if user.role == 'owner':
+        return Booking.objects.filter(equipment__owner=user)
+    return None
+
+def _export(request, rows, name):
+    bookings = _exportable_bookings(request.user)
+    if bookings is None:
+        messages.error(request, 'Access denied.')
+        return redirect('home')
+    
+    try:
+        bookings = filter_bookings(bookings, request.GET)
+    except ExportError as e:
+        messages.error(request, str(e))
+        return redirect('users:admin_dashboard' if request.user.is_superuser else 'bookings:owner_list')
+    
+    return csv_response(
+        rows(bookings), f'greengear-{name}-{date.today().isoformat()}.csv',
+        asynchronous=isinstance(request, ASGIRequest),
+    )
+
+@login_required
+def export_bookings(request):
+    return _export(request, booking_rows, 'bookings')
+
+@login_required
+def export_earnings(request):
+    return _export(request, earnings_rows, 'earnings')
@@ -13,7 +13,7 @@ class EquipmentAdmin(admin.ModelAdmin):
             'fields': ('owner', 'name', 'category', 'description')
         }),
         ('Pricing & Location', {
-            'fields': ('rent_per_day', 'rent_per_hour', 'location')
+            'fields': ('rent_per_day', 'rent_per_hour', 'location', 'latitude', 'longitude')
         }),
         ('Status & Images', {
             'fields': ('availability', 'image')
@@ -0,0 +1,113 @@
+"""
+Cached catalog listings.
+
+Listings (home page featured equipment, explore results, similar
+equipment) are cached under keys built from their parameters and a
+catalog version. Any Equipment or Booking write bumps the version (see
+equipment.signals), so every cached listing goes stale at once and is
+rebuilt on its next hit. Individual cards are cached separately in the
+templates with ``{% cache %}``, keyed by equipment id and updated_at, so
+an edit only re-renders the card that changed.
+
+The version only reaches every worker (and the management commands that
+bump it) through a shared cache such as Redis or memcached (CACHE_URL).
+With a process-local one, a bump is seen by its own process alone, so
+listings are kept for at most CATALOG_LOCAL_CACHE_TTL seconds there and
+``check --deploy`` warns about it.
+
+Listings built from a read replica are not stored while the version is
+younger than the replica may be behind: the replica could still be
+missing the write that bumped it, and the stale listing would be cached
+as current.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+
+from greengear_project import db_router
+
+VERSION_KEY = 'equipment:catalog:version'
+DEFAULT_TTL = 600
+DEFAULT_LOCAL_TTL = 30
+
+# Backends whose entries live in one process
+PROCESS_LOCAL_BACKENDS = {'django.core.cache.backends.locmem.LocMemCache'}
+
+
+def shared():
+    """Whether every process sees the same default cache."""
+    return settings.CACHES[DEFAULT_CACHE_ALIAS]['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def ttl():
+    """Seconds listings are kept: CATALOG_CACHE_TTL, capped for a process-local cache."""
+    seconds = getattr(settings, 'CATALOG_CACHE_TTL', DEFAULT_TTL)
+    if shared():
+        return seconds
+    return min(seconds, getattr(settings, 'CATALOG_LOCAL_CACHE_TTL', DEFAULT_LOCAL_TTL))
+
+
+def version():
+    # A timestamp, not a counter: if the key is evicted the new version
+    # can't collide with one that cached listings were stored under
+    return cache.get_or_set(VERSION_KEY, time.time_ns, None)
+
+
+async def aversion():
+    return await cache.aget_or_set(VERSION_KEY, time.time_ns, None)
+
+
+def invalidate():
+    cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def listing_digest(params):
+    return hashlib.md5(repr(sorted(params.items())).encode(), usedforsecurity=False).hexdigest()
+
+
+def listing_key(name, listing_version, params):
+    return f'equipment:catalog:{name}:{listing_version}:{listing_digest(params)}'
+
+
+def cacheable(listing_version):
+    """
+    Whether a listing built now may be stored under ``listing_version``.
+    Not while a replica serving the reads could still be missing the
+    write that set it (see greengear_project.db_router.max_staleness()).
+    """
+    if not db_router.reading_replicas():
+        return True
+    return time.time_ns() - listing_version > db_router.max_staleness() * 1e9
+
+
+def cached_listing(name, params, build, timeout=None):
+    """
+    Return the cached result of ``build()`` for ``name`` and ``params``,
+    building it on a miss. It is kept for ``timeout`` seconds (ttl() by default).
+    """
+    if not ttl():
+        return build()
+    listing_version = version()
+    key = listing_key(name, listing_version, params)
+    result = cache.get(key)
+    if result is None:
+        result = build()
+        if cacheable(listing_version):
+            cache.set(key, result, min(timeout or ttl(), ttl()))
+    return result
+
+
+async def acached_listing(name, params, build):
+    """Async cached_listing(); ``build`` is a coroutine function."""
+    if not ttl():
+        return await build()
+    listing_version = await aversion()
+    key = listing_key(name, listing_version, params)
+    result = await cache.aget(key)
+    if result is None:
+        result = await build()
+        if cacheable(listing_version):
+            await cache.aset(key, result, ttl())
+    return result
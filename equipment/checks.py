@@ -0,0 +1,16 @@
+from django.core.checks import Tags, Warning, register
+
+from . import catalog_cache
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if catalog_cache.shared():
+        return []
+    return [Warning(
+        "CACHES['default'] is process-local, so a catalog change made by one worker "
+        'or management command is not seen by the others until their listings expire.',
+        hint=f'Set CACHE_URL to a Redis or memcached server; until then listings are '
+             f'cached for at most {catalog_cache.ttl()} seconds.',
+        id='equipment.W001',
+    )]
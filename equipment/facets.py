@@ -0,0 +1,140 @@
+"""
+Result counts for the equipment list filters.
+
+A single grouped query counts the listings matching the current search for
+every (category, price band, location) combination. The count for each
+filter value is then summed from those rows in Python. Counts for a facet
+ignore that facet's own filter and respect all the others, so each number
+is how many results picking that value would show.
+
+The grouped rows depend only on the search text, not on the filters, so
+every filter combination of one search shares them. They are cached
+briefly for the unfiltered list, and for searches once they have been
+made a few times.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, Q, Value, When
+
+from . import catalog_cache
+from .models import Equipment
+from .search import matching, search_terms
+
+# (value, label, lowest daily_rate, highest daily_rate exclusive)
+PRICE_BANDS = (
+    ('0-500', 'Under ₹500/day', None, 500),
+    ('500-1000', '₹500 - ₹1,000/day', 500, 1000),
+    ('1000-2000', '₹1,000 - ₹2,000/day', 1000, 2000),
+    ('2000+', 'Over ₹2,000/day', 2000, None),
+)
+
+# Most locations listed, busiest first
+LOCATION_LIMIT = 10
+
+DEFAULT_TTL = 60
+
+# A search's counts are cached once it is made this often within HITS_WINDOW seconds
+POPULAR_AFTER = 3
+HITS_WINDOW = 600
+
+
+def ttl():
+    return getattr(settings, 'FACET_CACHE_TTL', DEFAULT_TTL)
+
+
+def _band_q(low, high):
+    q = Q()
+    if low is not None:
+        q &= Q(daily_rate__gte=low)
+    if high is not None:
+        q &= Q(daily_rate__lt=high)
+    return q
+
+
+def price_band_q(value):
+    """Q object for the price band called ``value``, or None for an unknown band."""
+    for band, _, low, high in PRICE_BANDS:
+        if band == value:
+            return _band_q(low, high)
+    return None
+
+
+def grouped_rows(queryset, search_query):
+    """``(category, price band, location, count)`` rows for ``queryset`` narrowed to the search."""
+    price_band = Case(
+        *[When(_band_q(low, high), then=Value(band)) for band, _, low, high in PRICE_BANDS],
+        default=Value(''),
+        output_field=CharField(),
+    )
+    rows = (
+        queryset.filter(matching(search_query))
+        .order_by()
+        .annotate(price_band=price_band)
+        .values_list('category', 'price_band', 'location')
+        .annotate(count=Count('id'))
+    )
+    return list(rows)
+
+
+def _popular(search_key):
+    key = f'equipment:facets:hits:{search_key}'
+    cache.add(key, 0, HITS_WINDOW)
+    try:
+        return cache.incr(key) >= POPULAR_AFTER
+    except ValueError:
+        # Expired between add() and incr()
+        return False
+
+
+def cached_rows(queryset, search_query, params=None):
+    """
+    grouped_rows() for the public catalog, cached for unfiltered and popular
+    searches. ``params`` are any filters already applied to ``queryset``.
+    """
+    key_params = dict(params or {}, q=' '.join(search_terms(search_query)))
+    unfiltered = not any(key_params.values())
+    if ttl() and (unfiltered or _popular(catalog_cache.listing_digest(key_params))):
+        return catalog_cache.cached_listing(
+            'facets', key_params, lambda: grouped_rows(queryset, search_query), timeout=ttl()
+        )
+    return grouped_rows(queryset, search_query)
+
+
+def facet_counts(rows, category='', price_range='', location=''):
+    """
+    Per-value counts for the category, price band and location filters.
+    With ``rows`` None the values are listed with None counts.
+    """
+    counted = rows is not None
+    location = location.lower()
+    if not any(band == price_range for band, *_ in PRICE_BANDS):
+        price_range = ''
+
+    categories, bands, locations = Counter(), Counter(), Counter()
+    for row_category, row_band, row_location, count in rows or ():
+        in_category = not category or row_category == category
+        in_band = not price_range or row_band == price_range
+        in_location = not location or location in (row_location or '').lower()
+        if in_band and in_location:
+            categories[row_category] += count
+        if in_category and in_location and row_band:
+            bands[row_band] += count
+        if in_category and in_band and row_location:
+            locations[row_location] += count
+
+    return {
+        'category': [
+            {'value': value, 'label': label, 'count': categories[value] if counted else None}
+            for value, label in Equipment.CATEGORY_CHOICES
+        ],
+        'price_range': [
+            {'value': band, 'label': label, 'count': bands[band] if counted else None}
+            for band, label, _, _ in PRICE_BANDS
+        ],
+        'location': [
+            {'value': value, 'count': count}
+            for value, count in locations.most_common(LOCATION_LIMIT)
+        ],
+    }
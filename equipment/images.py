@@ -0,0 +1,108 @@
+"""
+Resized WebP/JPEG variants of equipment photos.
+
+Uploaded originals can be several megabytes; list cards and thumbnails
+only need a few hundred pixels. Each variant is stored next to the
+original as ``<name>__<variant>.<ext>`` and recorded in
+``Equipment.image_variants`` so templates never have to touch storage.
+"""
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from . import catalog_cache
+
+logger = logging.getLogger(__name__)
+
+# Bounding boxes the variant must cover (the CSS crops with object-fit: cover)
+VARIANT_SIZES = {
+    'thumb': (160, 120),
+    'card': (480, 360),
+    'detail': (1200, 900),
+}
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_path(original_name, variant, ext):
+    stem, _ = os.path.splitext(original_name)
+    return f'{stem}__{variant}.{ext}'
+
+
+def _flatten(image):
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _cover(image, size):
+    # Scale down until the smaller side just covers the box; never upscale
+    width, height = image.size
+    scale = max(size[0] / width, size[1] / height)
+    if scale >= 1:
+        return image
+    return image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+
+
+def delete_variants(variants, storage):
+    for formats in (variants or {}).values():
+        for path in formats.values():
+            if path and storage.exists(path):
+                storage.delete(path)
+
+
+def generate_variants(image_field):
+    """Write every variant of ``image_field`` to its storage and return their paths."""
+    storage = image_field.storage
+    try:
+        with image_field.open('rb') as handle:
+            source = Image.open(handle)
+            source.load()
+    except (OSError, UnidentifiedImageError):
+        logger.warning('Could not read %s to build image variants', image_field.name, exc_info=True)
+        return {}
+
+    source = _flatten(source)
+    variants = {}
+    for variant, size in VARIANT_SIZES.items():
+        resized = _cover(source, size)
+        paths = {}
+        for ext, (image_format, options) in FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, image_format, **options)
+            path = variant_path(image_field.name, variant, ext)
+            if storage.exists(path):
+                storage.delete(path)
+            paths[ext] = storage.save(path, ContentFile(buffer.getvalue()))
+        variants[variant] = paths
+    return variants
+
+
+def update_variants(equipment):
+    """
+    Replace the equipment's variants with ones built from its current image.
+
+    The row is written with update(), not save(): the save that stored the
+    image has already run the post_save handlers (search index, counters,
+    catalog version), and a second save would run them all again.
+    """
+    storage = equipment.image.storage
+    delete_variants(equipment.image_variants, storage)
+    equipment.image_variants = generate_variants(equipment.image) if equipment.image else {}
+    # A new updated_at re-keys the cached cards, which may already show the original
+    equipment.updated_at = timezone.now()
+    type(equipment)._default_manager.filter(pk=equipment.pk).update(
+        image_variants=equipment.image_variants, updated_at=equipment.updated_at,
+    )
+    catalog_cache.invalidate()
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from equipment import images
+from equipment.models import Equipment
+
+
+class Command(BaseCommand):
+    help = 'Build the resized WebP/JPEG variants of equipment photos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate variants that already exist')
+
+    def handle(self, *args, **options):
+        equipment = Equipment.objects.exclude(image='').exclude(image__isnull=True).only('id', 'image', 'image_variants')
+        if not options['all']:
+            equipment = equipment.filter(image_variants={})
+        count = 0
+        for item in equipment.iterator():
+            images.update_variants(item)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Generated image variants for {count} equipment.'))
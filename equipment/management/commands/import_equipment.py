@@ -0,0 +1,234 @@
+import csv
+import json
+import os
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from equipment import catalog_cache, search
+from equipment.models import Equipment, equipment_image_path
+from greengear_project import geo
+from users import counters
+from users.models import User
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'available'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'unavailable'}
+
+
+class RowError(Exception):
+    pass
+
+
+def _categories():
+    categories = {}
+    for value, label in Equipment.CATEGORY_CHOICES:
+        categories[value] = value
+        categories[label.lower()] = value
+    return categories
+
+
+def _text(row, field):
+    value = row.get(field)
+    return '' if value is None else str(value).strip()
+
+
+def _decimal(row, field):
+    value = _text(row, field)
+    if not value:
+        return None
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        raise RowError(f'{field} "{value}" is not a number')
+    # NaN and Infinity parse, but can't be compared or stored
+    if not amount.is_finite():
+        raise RowError(f'{field} "{value}" is not a number')
+    if amount < 0 or amount.as_tuple().exponent < -2 or amount >= 10 ** 8:
+        raise RowError(f'{field} {value} is out of range')
+    return amount
+
+
+def _coordinate(row, field, limit):
+    value = row.get(field)
+    if value in (None, ''):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise RowError(f'{field} "{value}" is not a number')
+    if not -limit <= number <= limit:
+        raise RowError(f'{field} {value} is out of range')
+    return number
+
+
+class Command(BaseCommand):
+    help = 'Import equipment from a CSV or JSON Lines file, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row, or .jsonl with one object per line')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--images-dir', help='Directory the "image" column is relative to')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Validate every row without saving')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        self.images_dir = options['images_dir']
+        self.categories = _categories()
+        self.owners = {}
+        self.errors = 0
+
+        imported = 0
+        owner_ids = set()
+        try:
+            handle = open(path, newline='', encoding='utf-8-sig')
+        except OSError as e:
+            raise CommandError(f'Cannot open {path}: {e}')
+        with handle:
+            rows = self._read_csv(handle) if file_format == 'csv' else self._read_jsonl(handle)
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                equipment = self._build(batch, dry_run=options['dry_run'])
+                if equipment and not options['dry_run']:
+                    self._insert(equipment, options['batch_size'])
+                    owner_ids.update(item.owner_id for item in equipment)
+                imported += len(equipment)
+
+        if owner_ids:
+            counters.rebuild(owner_ids)
+            # Similar equipment is scored out of band, by the next rebuild_similar_equipment run
+            catalog_cache.invalidate()
+
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        summary = f'{verb} {imported} equipment, {self.errors} rows rejected.'
+        self.stdout.write(self.style.SUCCESS(summary) if not self.errors else self.style.WARNING(summary))
+
+    def _read_csv(self, handle):
+        # Line numbers count the header, as spreadsheets do
+        for line, row in enumerate(csv.DictReader(handle), start=2):
+            yield line, row
+
+    def _read_jsonl(self, handle):
+        for line, text in enumerate(handle, start=1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError as e:
+                yield line, e
+                continue
+            yield line, row if isinstance(row, dict) else ValueError('not a JSON object')
+
+    def _reject(self, line, message):
+        self.errors += 1
+        self.stderr.write(f'line {line}: {message}')
+
+    def _resolve_owners(self, batch):
+        emails = {
+            _text(row, 'owner_email').lower()
+            for _, row in batch if isinstance(row, dict)
+        } - set(self.owners) - {''}
+        if emails:
+            # Emails are matched case-insensitively, as they are written in the
+            # file, on the Lower(email) index
+            found = (
+                User.objects.alias(email_lower=Lower('email'))
+                .filter(email_lower__in=emails, role='owner').only('id', 'email')
+            )
+            for user in found:
+                self.owners[user.email.lower()] = user
+            for email in emails:
+                self.owners.setdefault(email, None)
+
+    def _build(self, batch, dry_run):
+        self._resolve_owners(batch)
+        equipment = []
+        for line, row in batch:
+            if isinstance(row, Exception):
+                self._reject(line, f'invalid JSON ({row})')
+                continue
+            try:
+                equipment.append(self._equipment(row, dry_run))
+            except RowError as e:
+                self._reject(line, str(e))
+        return equipment
+
+    def _equipment(self, row, dry_run):
+        email = _text(row, 'owner_email').lower()
+        owner = self.owners.get(email)
+        if owner is None:
+            raise RowError(f'no equipment owner with email "{email}"' if email else 'owner_email is missing')
+
+        name = _text(row, 'name')
+        location = _text(row, 'location')
+        if not name or not location:
+            raise RowError('name and location are required')
+        if len(name) > 200 or len(location) > 100:
+            raise RowError('name or location is too long')
+
+        category = self.categories.get(_text(row, 'category').lower())
+        if category is None:
+            raise RowError(f'unknown category "{row.get("category")}"')
+
+        rent_per_day = _decimal(row, 'rent_per_day')
+        rent_per_hour = _decimal(row, 'rent_per_hour')
+        if rent_per_day is None and rent_per_hour is None:
+            raise RowError('rent_per_day or rent_per_hour is required')
+
+        availability = _text(row, 'availability').lower()
+        if availability and availability not in TRUE_VALUES | FALSE_VALUES:
+            raise RowError(f'availability "{availability}" is not yes/no')
+
+        item = Equipment(
+            owner=owner,
+            name=name,
+            category=category,
+            description=_text(row, 'description'),
+            rent_per_day=rent_per_day,
+            rent_per_hour=rent_per_hour,
+            location=location,
+            availability=availability not in FALSE_VALUES,
+            latitude=_coordinate(row, 'latitude', 90),
+            longitude=_coordinate(row, 'longitude', 180),
+        )
+        if (item.latitude is None) != (item.longitude is None):
+            raise RowError('latitude and longitude go together')
+        if item.latitude is None:
+            item.locate()
+        else:
+            item.geohash = geo.geohash_encode(item.latitude, item.longitude)
+
+        image = _text(row, 'image')
+        if image:
+            item.image = self._store_image(item, image, dry_run)
+        return item
+
+    def _store_image(self, item, image, dry_run):
+        if not self.images_dir:
+            raise RowError('has an image but no --images-dir was given')
+        # Resolved through symlinks, so a link can't lead out of the directory either
+        images_dir = os.path.realpath(self.images_dir)
+        source = os.path.realpath(os.path.join(images_dir, image))
+        if os.path.commonpath([source, images_dir]) != images_dir:
+            raise RowError(f'image "{image}" is outside --images-dir')
+        if not os.path.isfile(source):
+            raise RowError(f'image "{image}" not found')
+        if dry_run:
+            return None
+        with open(source, 'rb') as handle:
+            return default_storage.save(equipment_image_path(item, os.path.basename(source)), File(handle))
+
+    def _insert(self, equipment, batch_size):
+        # bulk_create sends no signals: index the new rows here, and
+        # refresh counters and the catalog cache once at the end
+        with transaction.atomic():
+            Equipment.objects.bulk_create(equipment, batch_size=batch_size)
+            search.index_many(equipment)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from equipment import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Recompute the co-booking neighbors behind the farmer dashboard recommendations'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Recompute every item (default: only items with bookings changed since the last run)',
+        )
+
+    def handle(self, *args, **options):
+        refreshed = recommendations.refresh(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Refreshed recommendations for {refreshed} items.'))
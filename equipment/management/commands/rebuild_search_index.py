@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from equipment import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the equipment full-text search index from the equipment table'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stdout.write('Search index is maintained by the database on this backend; nothing to do.')
+            return
+        search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Equipment search index rebuilt.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from equipment import similar
+
+
+class Command(BaseCommand):
+    help = 'Recompute the similar equipment shown on the equipment detail pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Recompute every item (default: only the lists touched by items saved since the last run)',
+        )
+
+    def handle(self, *args, **options):
+        refreshed = similar.refresh(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Recomputed similar equipment for {refreshed} items.'))
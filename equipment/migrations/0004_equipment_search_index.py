@@ -0,0 +1,50 @@
+from django.db import migrations
+
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE equipment_search USING fts5("
+    "name, category, location, description, prefix='2 3')",
+    "INSERT INTO equipment_search (rowid, name, category, location, description) "
+    "SELECT id, COALESCE(name, ''), COALESCE(category, ''), COALESCE(location, ''), "
+    "COALESCE(description, '') FROM equipment_equipment",
+]
+SQLITE_REVERSE = [
+    "DROP TABLE IF EXISTS equipment_search",
+]
+
+POSTGRES_FORWARD = [
+    "ALTER TABLE equipment_equipment ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(category, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(location, '')), 'C') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'D')"
+    ") STORED",
+    "CREATE INDEX equipment_search_vector_gin ON equipment_equipment USING GIN (search_vector)",
+]
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS equipment_search_vector_gin",
+    "ALTER TABLE equipment_equipment DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        statements = statements_by_vendor.get(schema_editor.connection.vendor, [])
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0003_alter_equipment_options_equipment_image_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:57
+
+from django.db import migrations, models
+
+from greengear_project import geo
+
+
+def geocode_existing(apps, schema_editor):
+    Equipment = apps.get_model('equipment', 'Equipment')
+    for obj in Equipment.objects.exclude(location='').only('id', 'location').iterator():
+        point = geo.geocode(obj.location)
+        if point:
+            Equipment.objects.filter(id=obj.id).update(
+                latitude=point[0],
+                longitude=point[1],
+                geohash=geo.geohash_encode(*point),
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0005_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipment',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='equipment',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='equipment',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(geocode_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:51
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0007_image_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipment',
+            name='daily_rate',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.comparison.Coalesce('rent_per_day', django.db.models.expressions.CombinedExpression(models.F('rent_per_hour'), '*', models.Value(8))), output_field=models.DecimalField(decimal_places=2, max_digits=12, null=True)),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(condition=models.Q(('availability', True)), fields=['daily_rate', 'id'], name='equipment_rate_idx'),
+        ),
+    ]
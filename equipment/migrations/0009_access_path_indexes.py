@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0008_daily_rate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(condition=models.Q(('availability', True)), fields=['-created_at', '-id'], name='equipment_available_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(condition=models.Q(('availability', True)), fields=['category', '-created_at', '-id'], name='equipment_category_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0009_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EquipmentNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('cobooked', 'Booked by the same farmers')], max_length=20)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('computed_at', models.DateTimeField()),
+                ('equipment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='equipment.equipment')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbor_of', to='equipment.equipment')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'equipment', 'rank'), name='equipment_neighbor_rank_uniq')],
+            },
+        ),
+    ]
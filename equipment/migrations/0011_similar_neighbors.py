@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0010_equipment_neighbors'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='equipmentneighbor',
+            name='kind',
+            field=models.CharField(choices=[('cobooked', 'Booked by the same farmers'), ('similar', 'Similar description, category, location and price')], max_length=20),
+        ),
+    ]
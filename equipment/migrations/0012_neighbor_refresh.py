@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0011_similar_neighbors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NeighborRefresh',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('cobooked', 'Booked by the same farmers'), ('similar', 'Similar description, category, location and price')], max_length=20, unique=True)),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
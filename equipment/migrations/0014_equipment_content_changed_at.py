@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:54
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def copy_updated_at(apps, schema_editor):
+    # Existing rows were last changed at most this recently
+    Equipment = apps.get_model('equipment', 'Equipment')
+    Equipment.objects.update(content_changed_at=models.F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0013_equipment_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipment',
+            name='content_changed_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.RunPython(copy_updated_at, migrations.RunPython.noop),
+    ]
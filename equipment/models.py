@@ -1,11 +1,24 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.utils import timezone
 import os
 
+from greengear_project.geo import GeoLocatedModel
+
+from . import images
+
+# Hours of a working day, to compare hourly rates with daily ones
+WORKING_HOURS_PER_DAY = 8
+
+# What equipment.similar scores items on
+CONTENT_FIELDS = ('name', 'description', 'category', 'location', 'rent_per_day', 'rent_per_hour')
+
 def equipment_image_path(instance, filename):
     return f'equipment_photos/user_{instance.owner.id}/{filename}'
 
-class Equipment(models.Model):
+class Equipment(GeoLocatedModel):
     CATEGORY_CHOICES = (
         ('tractor', 'Tractor'),
         ('sprayer', 'Sprayer'),
@@ -21,21 +34,129 @@ class Equipment(models.Model):
     description = models.TextField()
     rent_per_day = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     rent_per_hour = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # The day rate, or a working day at the hourly rate, for price filters and
+    # sorting; the database recomputes it whenever either rate changes
+    daily_rate = models.GeneratedField(
+        expression=Coalesce('rent_per_day', F('rent_per_hour') * WORKING_HOURS_PER_DAY),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2, null=True),
+        db_persist=True,
+    )
     location = models.CharField(max_length=100)
     availability = models.BooleanField(default=True)
     image = models.ImageField(upload_to=equipment_image_path, null=True, blank=True)
+    # Resized copies of ``image``, {variant: {format: path}}; see equipment.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Last change to CONTENT_FIELDS; availability and image changes leave it
+    content_changed_at = models.DateTimeField(default=timezone.now, db_index=True, editable=False)
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_owner_id = instance.__dict__.get('owner_id')
+        instance._loaded_content = instance._content()
+        return instance
+
+    def _content(self):
+        return tuple(self.__dict__.get(field) for field in CONTENT_FIELDS)
+
+    def save(self, *args, **kwargs):
+        loaded_content = getattr(self, '_loaded_content', None)
+        if not self._state.adding and loaded_content is not None and loaded_content != self._content():
+            self.content_changed_at = timezone.now()
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'content_changed_at'}
+        # Signal handlers (search index, user counters) run in the same transaction
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            self._loaded_owner_id = self.owner_id
+            self._loaded_content = self._content()
+
+    @property
+    def images(self):
+        """Variant URLs per size, falling back to the original image."""
+        if not self.image:
+            return {}
+        storage = self.image.storage
+        urls = {}
+        for variant in images.VARIANT_SIZES:
+            paths = self.image_variants.get(variant, {})
+            urls[variant] = {
+                'webp': storage.url(paths['webp']) if paths.get('webp') else None,
+                'jpeg': storage.url(paths['jpeg']) if paths.get('jpeg') else self.image.url,
+            }
+        return urls
+
     def delete(self, *args, **kwargs):
         if self.image:
+            images.delete_variants(self.image_variants, self.image.storage)
             if os.path.isfile(self.image.path):
                 os.remove(self.image.path)
         super().delete(*args, **kwargs)
 
     class Meta:
         db_table = 'equipment_equipment'
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='equipment_created_idx'),
+            # The public catalog (available equipment only), newest first, overall and per category
+            models.Index(fields=['-created_at', '-id'], condition=Q(availability=True), name='equipment_available_idx'),
+            models.Index(
+                fields=['category', '-created_at', '-id'], condition=Q(availability=True), name='equipment_category_idx'
+            ),
+            # Price-sorted catalog pages walk this index (backwards for high to low)
+            models.Index(fields=['daily_rate', 'id'], condition=Q(availability=True), name='equipment_rate_idx'),
+            # Covers the API's ETag check (latest change and count of the catalog)
+            models.Index(fields=['availability', 'updated_at'], name='equipment_updated_idx'),
+        ]
+
+
+class EquipmentNeighbor(models.Model):
+    """
+    A precomputed "related equipment" entry: ``neighbor`` is the ``rank``-th
+    closest item to ``equipment`` by the ``kind`` measure.
+    """
+    COBOOKED = 'cobooked'
+    SIMILAR = 'similar'
+    KIND_CHOICES = (
+        (COBOOKED, 'Booked by the same farmers'),
+        (SIMILAR, 'Similar description, category, location and price'),
+    )
+
+    equipment = models.ForeignKey(Equipment, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Equipment, on_delete=models.CASCADE, related_name='neighbor_of')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.neighbor} for {self.equipment} ({self.kind} #{self.rank})"
+
+    class Meta:
+        constraints = [
+            # Also the index for reading an item's neighbors in rank order
+            models.UniqueConstraint(fields=['kind', 'equipment', 'rank'], name='equipment_neighbor_rank_uniq'),
+        ]
+
+
+class NeighborRefresh(models.Model):
+    """When the ``kind`` neighbor lists were last brought up to date, for incremental refreshes."""
+    kind = models.CharField(max_length=20, choices=EquipmentNeighbor.KIND_CHOICES, unique=True)
+    refreshed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.kind} neighbors refreshed at {self.refreshed_at}"
+
+    @classmethod
+    def last(cls, kind):
+        return cls.objects.filter(kind=kind).values_list('refreshed_at', flat=True).first()
+
+    @classmethod
+    def mark(cls, kind, refreshed_at):
+        cls.objects.update_or_create(kind=kind, defaults={'refreshed_at': refreshed_at})
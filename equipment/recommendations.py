@@ -0,0 +1,178 @@
+"""
+Co-booking recommendations for the farmer dashboard.
+
+Two items are related when the same farmers book them: the score of a
+pair is the cosine similarity of their sets of farmers, i.e. the entry of
+XᵀX for the farmer × equipment booking matrix X, divided by the square
+roots of both items' farmer counts. The sparse product is computed offline
+with NumPy from every pair of items within each farmer's bookings, and the
+TOP_K best neighbors of each item are stored as EquipmentNeighbor rows.
+
+A farmer's recommendations are then one indexed lookup: the neighbors of
+everything they have booked, summed and ranked, minus what they booked.
+
+``manage.py rebuild_recommendations`` refreshes the table. By default it
+only rewrites the items touched by bookings changed since the last run
+(recorded as a NeighborRefresh row, whether or not it wrote anything),
+from the bookings of the farmers who booked those items; run it with
+``--full`` now and then (e.g. nightly) to also pick up deleted bookings
+and the drift of other items' scores.
+"""
+from collections import defaultdict
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from bookings.models import Booking
+from .models import Equipment, EquipmentNeighbor, NeighborRefresh
+
+TOP_K = 10
+
+# Rejected and cancelled bookings say nothing about what a farmer wants
+BOOKED_STATUSES = ('pending', 'approved', 'completed')
+
+
+def cobooking_neighbors(pairs, k=TOP_K, items=None, farmer_counts=None):
+    """
+    ``{equipment_id: [(neighbor_id, score), ...]}`` with the ``k`` best
+    neighbors of each item, best first. ``pairs`` is an (n, 2) array of
+    distinct (farmer id, equipment id) rows. With ``items`` only the
+    neighbors of those equipment ids are computed; then ``pairs`` only
+    needs the rows of the farmers who booked them, and ``farmer_counts``
+    maps every other item to its number of farmers.
+    """
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    if not len(pairs):
+        return {}
+    item_ids, item_idx = np.unique(pairs[:, 1], return_inverse=True)
+    _, farmer_idx = np.unique(pairs[:, 0], return_inverse=True)
+    order = np.argsort(farmer_idx, kind='stable')
+    farmer_idx, item_idx = farmer_idx[order], item_idx[order]
+
+    # Every (left, right) combination of items within each farmer's run of rows
+    starts = np.flatnonzero(np.r_[True, farmer_idx[1:] != farmer_idx[:-1]])
+    sizes = np.diff(np.r_[starts, len(farmer_idx)])
+    squares = sizes ** 2
+    farmer = np.repeat(np.arange(len(sizes)), squares)
+    offset = np.arange(squares.sum()) - np.repeat(np.cumsum(squares) - squares, squares)
+    left = item_idx[starts[farmer] + offset // sizes[farmer]]
+    right = item_idx[starts[farmer] + offset % sizes[farmer]]
+
+    keep = left != right
+    if items is not None:
+        keep &= np.isin(item_ids, list(items))[left]
+    n = len(item_ids)
+    codes, counts = np.unique(left[keep] * n + right[keep], return_counts=True)
+    left, right = codes // n, codes % n
+    farmers_per_item = np.bincount(item_idx, minlength=n)
+    if farmer_counts:
+        farmers_per_item = np.array(
+            [farmer_counts.get(item, count) for item, count in zip(item_ids.tolist(), farmers_per_item.tolist())]
+        )
+    scores = counts / np.sqrt(farmers_per_item[left] * farmers_per_item[right])
+
+    # Best first within each item (ties to the older item), then cut at k
+    order = np.lexsort((right, -scores, left))
+    left, right, scores = left[order], right[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, left[1:] != left[:-1]])
+    rank = np.arange(len(left)) - np.repeat(starts, np.diff(np.r_[starts, len(left)]))
+    top = rank < k
+
+    neighbors = defaultdict(list)
+    for item, neighbor, score in zip(
+        item_ids[left[top]].tolist(), item_ids[right[top]].tolist(), scores[top].tolist()
+    ):
+        neighbors[item].append((neighbor, score))
+    return dict(neighbors)
+
+
+def _booked(items=None):
+    """Bookings that count, only those of farmers who booked one of ``items`` if given."""
+    booked = Booking.objects.filter(status__in=BOOKED_STATUSES).order_by()
+    if items is None:
+        return booked
+    farmers = booked.filter(equipment_id__in=items).values('farmer_id')
+    return booked.filter(farmer_id__in=farmers)
+
+
+def _booked_pairs(items=None):
+    rows = _booked(items).values_list('farmer_id', 'equipment_id').distinct()
+    return np.array(list(rows), dtype=np.int64).reshape(-1, 2)
+
+
+def _farmer_counts(items):
+    # Every farmer of the items co-booked with ``items``, not only the ones in their pairs
+    cobooked = _booked(items).values('equipment_id')
+    rows = (
+        Booking.objects.filter(status__in=BOOKED_STATUSES, equipment_id__in=cobooked)
+        .order_by()
+        .values('equipment_id')
+        .annotate(farmers=Count('farmer_id', distinct=True))
+        .values_list('equipment_id', 'farmers')
+    )
+    return dict(rows)
+
+
+def _changed_items(since):
+    # Every item of a farmer with a changed booking gains or loses co-bookings
+    farmers = Booking.objects.filter(updated_at__gte=since).values('farmer_id')
+    return set(Booking.objects.filter(farmer_id__in=farmers).values_list('equipment_id', flat=True))
+
+
+def refresh(full=False):
+    """Recompute the stored co-booking neighbors. Returns how many items were refreshed."""
+    started = timezone.now()
+    rows = EquipmentNeighbor.objects.filter(kind=EquipmentNeighbor.COBOOKED)
+    since = None if full else NeighborRefresh.last(EquipmentNeighbor.COBOOKED)
+    items = None if since is None else _changed_items(since)
+    if items is not None and not items:
+        NeighborRefresh.mark(EquipmentNeighbor.COBOOKED, started)
+        return 0
+
+    if items is None:
+        neighbors = cobooking_neighbors(_booked_pairs())
+    else:
+        neighbors = cobooking_neighbors(_booked_pairs(items), items=items, farmer_counts=_farmer_counts(items))
+    with transaction.atomic():
+        stale = rows if items is None else rows.filter(equipment_id__in=items)
+        stale.delete()
+        # Bookings changed while this ran are picked up by the next run
+        NeighborRefresh.mark(EquipmentNeighbor.COBOOKED, started)
+        EquipmentNeighbor.objects.bulk_create(
+            [
+                EquipmentNeighbor(
+                    equipment_id=item, neighbor_id=neighbor, kind=EquipmentNeighbor.COBOOKED,
+                    rank=rank, score=score, computed_at=started,
+                )
+                for item, ranked in neighbors.items()
+                for rank, (neighbor, score) in enumerate(ranked)
+            ],
+            batch_size=1000,
+        )
+    return len(neighbors) if items is None else len(items)
+
+
+def recommended_for(user, limit=3):
+    """
+    Available equipment ``user`` hasn't booked, ranked by its co-booking
+    score with everything they have; topped up with the newest listings.
+    """
+    booked = list(Booking.objects.filter(farmer=user).order_by().values_list('equipment_id', flat=True).distinct())
+    available = Equipment.objects.filter(availability=True).exclude(id__in=booked).select_related('owner')
+
+    recommended = []
+    if booked:
+        recommended = list(
+            available.filter(
+                neighbor_of__kind=EquipmentNeighbor.COBOOKED, neighbor_of__equipment_id__in=booked
+            )
+            .annotate(score=Sum('neighbor_of__score'))
+            .order_by('-score', '-created_at', '-id')[:limit]
+        )
+    if len(recommended) < limit:
+        recommended += available.exclude(id__in=[item.id for item in recommended]).order_by(
+            '-created_at', '-id'
+        )[:limit - len(recommended)]
+    return recommended
@@ -0,0 +1,145 @@
+"""
+Full-text search over the equipment catalog.
+
+SQLite keeps an FTS5 table (``equipment_search``) whose rowid is the
+equipment id; it is kept in sync from the Equipment post_save/post_delete
+signals. Postgres uses a generated ``search_vector`` tsvector column with a
+GIN index, so the database keeps it in sync on its own. Any other backend
+falls back to the old icontains filters.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'equipment_search'
+INDEXED_FIELDS = ('name', 'category', 'location', 'description')
+
+# bm25 column weights, in INDEXED_FIELDS order
+FTS_WEIGHTS = (10.0, 5.0, 3.0, 1.0)
+
+
+def search_terms(query):
+    # Only word characters reach the index, so user input can never be
+    # parsed as FTS5 / tsquery syntax
+    return re.findall(r'\w+', (query or '').lower())
+
+
+def _fts_query(terms):
+    # Every term must match, as a prefix so partially typed words still hit
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _ts_query(terms):
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def _equipment_table():
+    from .models import Equipment
+    return Equipment._meta.db_table
+
+
+def matching(query):
+    """Q object selecting equipment that matches ``query``."""
+    terms = search_terms(query)
+    if not terms:
+        return Q()
+
+    if connection.vendor == 'sqlite':
+        return Q(id__in=RawSQL(
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+            [_fts_query(terms)],
+        ))
+    if connection.vendor == 'postgresql':
+        return Q(RawSQL(
+            f"{_equipment_table()}.search_vector @@ to_tsquery('simple', %s)",
+            [_ts_query(terms)],
+            output_field=BooleanField(),
+        ))
+
+    q = Q()
+    for field in INDEXED_FIELDS:
+        q |= Q(**{f'{field}__icontains': query})
+    return q
+
+
+def rank(query):
+    """Relevance expression for ``query``; higher is more relevant."""
+    terms = search_terms(query)
+    if not terms:
+        return Value(0.0, output_field=FloatField())
+
+    if connection.vendor == 'sqlite':
+        weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+        # The MATCH runs once per query, and each row looks its score up in
+        # the result: LIMIT -1 stops SQLite flattening the subquery into a
+        # MATCH per row. bm25() is negative, more negative being a better match
+        return RawSQL(
+            f'SELECT hits.score FROM ('
+            f'SELECT rowid AS id, -bm25({SEARCH_TABLE}, {weights}) AS score '
+            f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s LIMIT -1'
+            f') AS hits WHERE hits.id = {_equipment_table()}.id',
+            [_fts_query(terms)],
+            output_field=FloatField(),
+        )
+    if connection.vendor == 'postgresql':
+        return RawSQL(
+            f"ts_rank_cd({_equipment_table()}.search_vector, to_tsquery('simple', %s))",
+            [_ts_query(terms)],
+            output_field=FloatField(),
+        )
+    return Value(0.0, output_field=FloatField())
+
+
+def search_equipment(queryset, query):
+    """Filter ``queryset`` to ``query`` and order it by relevance."""
+    if not search_terms(query):
+        return queryset
+    return queryset.filter(matching(query)).annotate(
+        search_rank=rank(query)
+    ).order_by('-search_rank', '-created_at')
+
+
+def index_equipment(equipment):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [equipment.pk])
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, {", ".join(INDEXED_FIELDS)}) '
+            f'VALUES (%s, %s, %s, %s, %s)',
+            [equipment.pk] + [getattr(equipment, field) or '' for field in INDEXED_FIELDS],
+        )
+
+
+def index_many(equipment_list):
+    """Index newly inserted rows in one statement (e.g. after bulk_create, which sends no signals)."""
+    if connection.vendor != 'sqlite' or not equipment_list:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, {", ".join(INDEXED_FIELDS)}) '
+            f'VALUES (%s, %s, %s, %s, %s)',
+            [[equipment.pk] + [getattr(equipment, field) or '' for field in INDEXED_FIELDS] for equipment in equipment_list],
+        )
+
+
+def unindex_equipment(equipment_id):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [equipment_id])
+
+
+def rebuild_index():
+    if connection.vendor != 'sqlite':
+        return
+    columns = ', '.join(INDEXED_FIELDS)
+    sources = ', '.join(f"COALESCE({field}, '')" for field in INDEXED_FIELDS)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, {columns}) '
+            f'SELECT id, {sources} FROM {_equipment_table()}'
+        )
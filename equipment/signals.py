@@ -0,0 +1,29 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from bookings.models import Booking
+from .models import Equipment
+from . import catalog_cache, search
+
+
+@receiver(post_save, sender=Equipment)
+def index_saved_equipment(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_equipment(instance)
+
+
+@receiver(post_delete, sender=Equipment)
+def unindex_deleted_equipment(sender, instance, **kwargs):
+    search.unindex_equipment(instance.pk)
+
+
+@receiver(post_save, sender=Equipment)
+@receiver(post_delete, sender=Equipment)
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_catalog(sender, raw=False, **kwargs):
+    # Bookings feed the recommendations and the booked dates detail pages show
+    if raw:
+        return
+    catalog_cache.invalidate()
@@ -0,0 +1,220 @@
+"""
+Precomputed "similar equipment" for the detail page.
+
+Each item is described by a TF-IDF vector of its name and description plus
+its category, location and effective daily rate. Two items score
+
+    TEXT_WEIGHT * cosine(text vectors)
+    + CATEGORY_WEIGHT if they share a category
+    + LOCATION_WEIGHT if they share a location
+    + PRICE_WEIGHT * exp(-|log(rate a / rate b)|)
+
+and the STORED_NEIGHBORS best of every item are kept as EquipmentNeighbor
+rows (kind "similar"), so the detail page reads one ranked list. More are
+stored than the page shows, since some will be booked at any given time.
+
+Scoring loads the whole catalog, so it never runs in a request: changing
+what an item is scored on only bumps its content_changed_at (other
+edits, e.g. availability or images, leave it alone), and ``manage.py
+rebuild_similar_equipment`` (from cron, every few minutes) calls
+refresh(). That rewrites the lists of the items changed since its last
+run (a NeighborRefresh row) and the lists they now belong in or drop out of,
+or every list when much of the catalog changed, e.g. after an import.
+Until then the detail page tops new items up from their category. Run it
+with ``--full`` now and then (e.g. nightly) to also refill the lists that
+lost a deleted item.
+"""
+from collections import Counter
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Min, Subquery
+from django.utils import timezone
+
+from . import catalog_cache
+from .models import Equipment, EquipmentNeighbor, NeighborRefresh
+from .search import search_terms
+
+STORED_NEIGHBORS = 12
+
+TEXT_WEIGHT = 0.6
+CATEGORY_WEIGHT = 0.2
+LOCATION_WEIGHT = 0.1
+PRICE_WEIGHT = 0.1
+
+# Vocabulary: words in at least MIN_DF items and at most MAX_DF of them,
+# the MAX_FEATURES most common of those
+MIN_DF = 2
+MAX_DF = 0.5
+MAX_FEATURES = 2000
+
+# Items scored against the whole catalog at a time
+CHUNK_SIZE = 256
+
+# With more than this share of the catalog changed, every list is recomputed
+FULL_REFRESH_SHARE = 0.25
+
+FIELDS = ('id', 'name', 'description', 'category', 'location', 'daily_rate')
+
+
+def _tokens(row):
+    # The name counts twice: it says more about the item than the description
+    return [term for term in search_terms(f"{row['name']} {row['name']} {row['description']}") if len(term) > 1]
+
+
+class Features:
+    """The catalog as arrays, one row per item, in ``ids`` order."""
+
+    def __init__(self, rows):
+        self.ids = np.array([row['id'] for row in rows], dtype=np.int64)
+        self.position = {item_id: i for i, item_id in enumerate(self.ids.tolist())}
+        documents = [Counter(_tokens(row)) for row in rows]
+
+        n = len(rows)
+        document_frequency = Counter(term for document in documents for term in document)
+        max_df = max(MIN_DF, int(MAX_DF * n))
+        vocabulary = [
+            term for term, df in document_frequency.most_common()
+            if MIN_DF <= df <= max_df
+        ][:MAX_FEATURES]
+        columns = {term: j for j, term in enumerate(vocabulary)}
+
+        self.text = np.zeros((n, len(vocabulary)), dtype=np.float32)
+        for i, document in enumerate(documents):
+            for term, count in document.items():
+                if term in columns:
+                    self.text[i, columns[term]] = count
+        # Sublinear term frequency, smoothed idf, unit-length rows
+        np.log1p(self.text, out=self.text, where=self.text > 0)
+        df = np.array([document_frequency[term] for term in vocabulary], dtype=np.float32)
+        self.text *= np.log((1 + n) / (1 + df)) + 1
+        norms = np.linalg.norm(self.text, axis=1, keepdims=True)
+        np.divide(self.text, norms, out=self.text, where=norms > 0)
+
+        _, self.category = np.unique([row['category'] for row in rows], return_inverse=True)
+        locations = [' '.join(search_terms(row['location'])) for row in rows]
+        self.has_location = np.array([bool(location) for location in locations])
+        _, self.location = np.unique(locations, return_inverse=True)
+        self.log_rate = np.log(np.array(
+            [float(row['daily_rate']) if row['daily_rate'] else np.nan for row in rows], dtype=np.float64
+        ))
+
+    @classmethod
+    def load(cls):
+        return cls(list(Equipment.objects.order_by('id').values(*FIELDS)))
+
+    def scores(self, positions):
+        """Scores of the items at ``positions`` (rows) against every item (columns)."""
+        positions = np.asarray(positions)
+        scores = TEXT_WEIGHT * (self.text[positions] @ self.text.T)
+        scores += CATEGORY_WEIGHT * (self.category[positions, None] == self.category[None, :])
+        same_location = self.location[positions, None] == self.location[None, :]
+        scores += LOCATION_WEIGHT * (same_location & self.has_location[None, :])
+        price = np.exp(-np.abs(self.log_rate[positions, None] - self.log_rate[None, :]))
+        scores += PRICE_WEIGHT * np.nan_to_num(price)
+        scores[np.arange(len(positions)), positions] = -np.inf
+        return scores
+
+    def neighbors(self, positions, k=STORED_NEIGHBORS):
+        """``{equipment_id: [(neighbor_id, score), ...]}``, best first."""
+        result = {int(self.ids[position]): [] for position in positions}
+        k = min(k, len(self.ids) - 1)
+        if k < 1:
+            return result
+        for start in range(0, len(positions), CHUNK_SIZE):
+            chunk = positions[start:start + CHUNK_SIZE]
+            scores = self.scores(chunk)
+            # The k best of each row, then those sorted best first (ties to the older item)
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.lexsort((self.ids[top], -top_scores), axis=1)
+            top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+            for position, neighbors, neighbor_scores in zip(chunk, top, top_scores):
+                result[int(self.ids[position])] = [
+                    (int(self.ids[j]), float(score))
+                    for j, score in zip(neighbors.tolist(), neighbor_scores.tolist()) if score > 0
+                ]
+        return result
+
+
+def _store(neighbors, refreshed_at, replace_all=False):
+    rows = EquipmentNeighbor.objects.filter(kind=EquipmentNeighbor.SIMILAR)
+    with transaction.atomic():
+        (rows if replace_all else rows.filter(equipment_id__in=list(neighbors))).delete()
+        EquipmentNeighbor.objects.bulk_create(
+            [
+                EquipmentNeighbor(
+                    equipment_id=item, neighbor_id=neighbor, kind=EquipmentNeighbor.SIMILAR,
+                    rank=rank, score=score, computed_at=refreshed_at,
+                )
+                for item, ranked in neighbors.items()
+                for rank, (neighbor, score) in enumerate(ranked)
+            ],
+            batch_size=1000,
+        )
+        NeighborRefresh.mark(EquipmentNeighbor.SIMILAR, refreshed_at)
+    catalog_cache.invalidate()
+
+
+def _affected(features, equipment_ids):
+    """Positions of the lists to rewrite for changes to ``equipment_ids``."""
+    positions = np.array(sorted(features.position[item] for item in equipment_ids if item in features.position))
+    if not len(positions):
+        return positions
+
+    # The items' own lists, the lists that hold them, and those they now
+    # beat the last entry of
+    lists = EquipmentNeighbor.objects.filter(kind=EquipmentNeighbor.SIMILAR)
+    affected = set(positions.tolist())
+    holding = lists.filter(neighbor_id__in=features.ids[positions].tolist()).values_list('equipment_id', flat=True)
+    affected.update(features.position[item] for item in holding if item in features.position)
+    thresholds = np.zeros(len(features.ids))
+    for row in lists.values('equipment_id').annotate(lowest=Min('score'), count=Count('id')):
+        if row['count'] >= STORED_NEIGHBORS and row['equipment_id'] in features.position:
+            thresholds[features.position[row['equipment_id']]] = row['lowest']
+    for start in range(0, len(positions), CHUNK_SIZE):
+        scores = features.scores(positions[start:start + CHUNK_SIZE])
+        affected.update(np.flatnonzero((scores > thresholds[None, :]).any(axis=0)).tolist())
+    return np.array(sorted(affected))
+
+
+def refresh(full=False):
+    """
+    Bring the stored lists up to date with the items changed since the last
+    run (all of them with ``full``). Returns how many lists were rewritten.
+    """
+    started = timezone.now()
+    since = None if full else NeighborRefresh.last(EquipmentNeighbor.SIMILAR)
+    changed = None
+    if since is not None:
+        changed = list(Equipment.objects.filter(content_changed_at__gte=since).values_list('id', flat=True))
+        if not changed:
+            NeighborRefresh.mark(EquipmentNeighbor.SIMILAR, started)
+            return 0
+
+    features = Features.load()
+    if changed is None or len(changed) > FULL_REFRESH_SHARE * len(features.ids):
+        _store(features.neighbors(np.arange(len(features.ids))), started, replace_all=True)
+        return len(features.ids)
+    positions = _affected(features, changed)
+    _store(features.neighbors(positions), started)
+    return len(positions)
+
+
+async def asimilar_to(equipment_id, limit=4):
+    """
+    The ``limit`` most similar available items, topped up with the same
+    category while the item has no (or too few) stored neighbors.
+    """
+    available = Equipment.objects.filter(availability=True).exclude(id=equipment_id).select_related('owner')
+    similar = [
+        item async for item in available.filter(
+            neighbor_of__kind=EquipmentNeighbor.SIMILAR, neighbor_of__equipment_id=equipment_id
+        ).order_by('neighbor_of__rank')[:limit]
+    ]
+    if len(similar) < limit:
+        same_category = available.filter(
+            category=Subquery(Equipment.objects.filter(id=equipment_id).values('category')[:1])
+        ).exclude(id__in=[item.id for item in similar])
+        similar += [item async for item in same_category[:limit - len(similar)]]
+    return similar
@@ -1,3 +1,794 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from bookings.models import Booking
+from bookings.transitions import create_booking, transition
+from greengear_project import geo
+from greengear_project.querycount import budget_for
+from greengear_project.testing import QueryBudgetTestCase
+from users.counters import counters_for
+from users.models import User
+from . import catalog_cache, facets, images, recommendations, similar, urls
+from .checks import check_shared_cache
+from .models import Equipment, EquipmentNeighbor, NeighborRefresh
+from .search import search_equipment, search_terms
+from .views import PRICE_ORDERINGS
+
+
+class EquipmentQueryBudgetTests(QueryBudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owners = [User.objects.create_user(f'owner{i}', role='owner', location='Pune') for i in range(3)]
+        cls.farmer = User.objects.create_user('farmer', role='farmer', location='Nashik')
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', None, role='admin')
+        cls.equipment = [
+            Equipment.objects.create(
+                owner=cls.owners[i % 3], name=f'Tractor {i}', category='tractor',
+                description='45 HP diesel tractor', rent_per_day=400 + 100 * i, location='Pune',
+            )
+            for i in range(8)
+        ]
+        for item in cls.equipment[:2]:
+            create_booking(cls.farmer, item.id, date.today() + timedelta(days=3), 2, 'days')
+
+    def setUp(self):
+        # Measure cold listings, not the catalog cache
+        cache.clear()
+
+    def assertCheap(self, response):
+        self.assertWithinQueryBudget(response)
+        self.assertNoRepeatedQueries(response)
+
+    def test_every_view_has_a_budget(self):
+        for pattern in urls.urlpatterns:
+            self.assertIsNotNone(budget_for(f'{urls.app_name}:{pattern.name}'), pattern.name)
+
+    def test_home(self):
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertCheap(response)
+
+    def test_list(self):
+        for query in ('', '?q=tractor', '?near=Pune&radius=50', '?near=Pune', '?category=tractor&price_range=500-1000'):
+            response = self.client.get(reverse('equipment:list') + query)
+            self.assertEqual(response.status_code, 200)
+            self.assertCheap(response)
+
+        self.client.force_login(self.farmer)
+        response = self.client.get(reverse('equipment:list'))
+        self.assertCheap(response)
+
+    def test_impossible_coordinates_are_ignored(self):
+        # They fall back to the place name
+        near_pune = self.client.get(reverse('equipment:list') + '?near=Pune').context['equipment_list']
+        for query in ('?lat=1e400&lon=73.8', '?lat=nan&lon=73.8', '?lat=91&lon=73.8', '?lat=18.5&lon=-181'):
+            response = self.client.get(reverse('equipment:list') + query + '&near=Pune')
+            self.assertEqual(response.status_code, 200, query)
+            self.assertEqual(list(response.context['equipment_list']), list(near_pune), query)
+        response = self.client.get(reverse('equipment:list') + '?near=Pune&radius=inf')
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail(self):
+        response = self.client.get(reverse('equipment:detail', args=[self.equipment[2].id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertCheap(response)
+
+    async def test_catalog_views_under_asgi(self):
+        # The async request path an ASGI worker takes, middleware included
+        for url in (
+            reverse('home'),
+            reverse('equipment:list') + '?near=Pune',
+            reverse('equipment:detail', args=[self.equipment[2].id]),
+        ):
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertCheap(response)
+        response = await self.async_client.get(reverse('equipment:detail', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+        owner = self.owners[1]
+        await self.async_client.aforce_login(owner)
+        response = await self.async_client.get(reverse('equipment:list') + '?my_equipment=true')
+        self.assertCheap(response)
+        self.assertEqual(
+            {item.owner_id for item in response.context['equipment_list']}, {owner.id}
+        )
+
+    def test_query_plans(self):
+        # The facet counts group every available listing (and are cached, see equipment.facets)
+        with self.assertNoFullScans(allow={'equipment_category_idx'}):
+            for url in (
+                reverse('home'),
+                reverse('equipment:list'),
+                reverse('equipment:list') + '?category=tractor&price_range=500-1000&q=diesel',
+                reverse('equipment:list') + '?sort=price_desc&min_price=300',
+                reverse('equipment:list') + '?near=Pune&radius=25',
+                reverse('equipment:detail', args=[self.equipment[2].id]),
+            ):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+        available = Equipment.objects.filter(availability=True)
+        self.assertUsesIndex(available.order_by('-created_at', '-id')[:13], 'equipment_available_idx')
+        self.assertUsesIndex(
+            available.filter(category='tractor').order_by('-created_at', '-id')[:13], 'equipment_category_idx'
+        )
+        self.assertUsesIndex(available.order_by('daily_rate', 'id')[:13], 'equipment_rate_idx')
+
+    def test_owner_views(self):
+        item = self.equipment[0]
+        self.client.force_login(item.owner)
+        for name, args in [('equipment:add', []), ('equipment:edit', [item.id]), ('equipment:delete', [item.id])]:
+            response = self.client.get(reverse(name, args=args))
+            self.assertEqual(response.status_code, 200)
+            self.assertCheap(response)
+
+        response = self.client.post(reverse('equipment:edit', args=[item.id]), {
+            'name': 'Tractor 0', 'category': 'tractor', 'description': 'Serviced',
+            'rent_per_day': '450', 'location': 'Pune', 'availability': 'on',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertWithinQueryBudget(response)
+
+    def test_admin_views(self):
+        self.client.force_login(self.admin)
+        item = self.equipment[5]
+        response = self.client.post(reverse('equipment:admin_edit', args=[item.id]), {
+            'name': 'Tractor 5', 'category': 'tractor', 'description': 'Serviced',
+            'rent_per_day': '900', 'location': 'Nashik', 'availability': 'on',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertWithinQueryBudget(response)
+
+        response = self.client.post(reverse('equipment:admin_delete', args=[item.id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertWithinQueryBudget(response)
+
+
+class EquipmentSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', role='owner')
+        listings = [
+            # name, category, description, location
+            ('Disc harrow', 'other', 'Heavy harrow for tractors', 'Pune'),
+            ('Rotavator 7 ft', 'rotavator', 'Rotary tiller for a tractor', 'Nashik'),
+            ('Tractor 45 HP', 'tractor', 'Mahindra tractor with trolley', 'Pune'),
+            ('Knapsack sprayer', 'sprayer', 'Battery sprayer', 'Satara'),
+        ]
+        cls.equipment = {
+            name: Equipment.objects.create(
+                owner=owner, name=name, category=category, description=description,
+                rent_per_day=500, location=location,
+            )
+            for name, category, description, location in listings
+        }
+
+    def search(self, query):
+        return [item.name for item in search_equipment(Equipment.objects.all(), query)]
+
+    def test_search_terms(self):
+        self.assertEqual(search_terms('  Disc-Harrow, 7ft! '), ['disc', 'harrow', '7ft'])
+        # FTS5 / tsquery syntax is dropped along with the other punctuation
+        self.assertEqual(search_terms('tractor" OR "x* NEAR(a b) -c ^d:*'), ['tractor', 'or', 'x', 'near', 'a', 'b', 'c', 'd'])
+        self.assertEqual(search_terms(None), [])
+
+    def test_matches_every_term_by_prefix(self):
+        self.assertEqual(self.search('harrow'), ['Disc harrow'])
+        self.assertEqual(self.search('spray'), ['Knapsack sprayer'])
+        self.assertEqual(self.search('tractor pune'), ['Tractor 45 HP', 'Disc harrow'])
+        self.assertEqual(self.search('harvester'), [])
+        # Syntax in user input is matched as plain words, never parsed
+        self.assertEqual(self.search('"harrow" OR *'), [])
+        self.assertEqual(self.search('harrow)'), ['Disc harrow'])
+        self.assertEqual(len(self.search('')), 4)
+
+    def test_ranked_by_field_weight(self):
+        # A match in the name outranks one in the category, which outranks the description
+        ranked = search_equipment(Equipment.objects.all(), 'tractor')
+        scores = [item.search_rank for item in ranked]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertEqual([item.name for item in ranked][:1], ['Tractor 45 HP'])
+        self.assertEqual(len(scores), 3)
+        self.assertGreater(scores[0], scores[1])
+
+    def test_ranking_runs_one_match_per_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            list(search_equipment(Equipment.objects.all(), 'tractor'))
+        if connection.vendor == 'sqlite':
+            plan = str(search_equipment(Equipment.objects.all(), 'tractor').explain())
+            # A MATCH for the filter and one for the scores, none per row
+            self.assertEqual(plan.count('VIRTUAL TABLE INDEX 0:M'), 2, plan)
+        self.assertEqual(len(queries), 1)
+
+
+class EquipmentFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', role='owner')
+        listings = [
+            ('tractor', 450, 'Pune'), ('tractor', 500, 'Pune'), ('tractor', 1500, 'Nashik'),
+            ('sprayer', 300, 'Pune'), ('sprayer', 2500, 'Satara'), ('harvester', 2000, 'Nashik'),
+        ]
+        for i, (category, rent, location) in enumerate(listings):
+            Equipment.objects.create(
+                owner=owner, name=f'Machine {i}', category=category, description='Well kept',
+                rent_per_day=rent, location=location,
+            )
+        Equipment.objects.create(
+            owner=owner, name='Hidden', category='tractor', description='Off the market',
+            rent_per_day=100, location='Pune', availability=False,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def facets_for(self, query=''):
+        response = self.client.get(reverse('equipment:list') + query)
+        return {
+            name: {option['value']: option['count'] for option in options}
+            for name, options in response.context['facets'].items()
+        }
+
+    def test_counts_ignore_their_own_filter(self):
+        counts = self.facets_for('?category=tractor&price_range=0-500')
+        # Categories are counted under the price filter, price bands under the category filter
+        self.assertEqual(counts['category']['tractor'], 1)
+        self.assertEqual(counts['category']['sprayer'], 1)
+        self.assertEqual(counts['price_range'], {'0-500': 1, '500-1000': 1, '1000-2000': 1, '2000+': 0})
+        self.assertEqual(counts['location'], {'Pune': 1})
+
+    def test_counts_match_the_results(self):
+        expected = self.facets_for('?location=pune')['price_range']
+        for band, *_ in facets.PRICE_BANDS:
+            response = self.client.get(reverse('equipment:list'), {'location': 'pune', 'price_range': band})
+            self.assertEqual(len(response.context['equipment_list']), expected[band], band)
+
+    def test_search(self):
+        counts = self.facets_for('?q=machine')
+        self.assertEqual(sum(counts['category'].values()), 6)
+        self.assertEqual(self.facets_for('?q=hidden')['category']['tractor'], 0)
+
+    def test_one_grouped_query_cached_for_popular_searches(self):
+        queryset = Equipment.objects.filter(availability=True)
+        with CaptureQueriesContext(connection) as queries:
+            facets.grouped_rows(queryset, 'machine')
+        self.assertEqual(len(queries), 1)
+
+        # Unfiltered counts are cached right away, searches once they are popular
+        for search, cached_after in (('', 1), ('machine', facets.POPULAR_AFTER)):
+            for hit in range(1, facets.POPULAR_AFTER + 2):
+                with CaptureQueriesContext(connection) as queries:
+                    facets.cached_rows(queryset, search)
+                self.assertEqual(len(queries), 0 if hit > cached_after else 1, (search, hit))
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', role='owner')
+        cls.item = cls.create('Tractor')
+
+    @classmethod
+    def create(cls, name):
+        return Equipment.objects.create(
+            owner=cls.owner, name=name, category='tractor', description='Well kept',
+            rent_per_day=500, location='Pune',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self):
+        return catalog_cache.cached_listing(
+            'names', {}, lambda: sorted(Equipment.objects.values_list('name', flat=True))
+        )
+
+    def test_cached_until_equipment_changes(self):
+        self.assertEqual(self.names(), ['Tractor'])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.names(), ['Tractor'])
+        self.assertEqual(len(queries), 0)
+
+        baler = self.create('Baler')
+        self.assertEqual(self.names(), ['Baler', 'Tractor'])
+        self.item.name = 'Big tractor'
+        self.item.save()
+        self.assertEqual(self.names(), ['Baler', 'Big tractor'])
+        baler.delete()
+        self.assertEqual(self.names(), ['Big tractor'])
+
+    @override_settings(CATALOG_CACHE_TTL=600, CATALOG_LOCAL_CACHE_TTL=5)
+    def test_process_local_cache(self):
+        self.assertFalse(catalog_cache.shared())
+        self.assertEqual(catalog_cache.ttl(), 5)
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            catalog_cache.cached_listing('names', {}, list, timeout=300)
+        self.assertEqual(cache_set.call_args.args[2], 5)
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['equipment.W001'])
+
+    @override_settings(CATALOG_CACHE_TTL=600, CATALOG_LOCAL_CACHE_TTL=5)
+    def test_shared_cache(self):
+        shared_cache = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/unused'}
+        with override_settings(CACHES=dict(settings.CACHES, default=shared_cache)):
+            self.assertTrue(catalog_cache.shared())
+            self.assertEqual(catalog_cache.ttl(), 600)
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class EquipmentPriceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', role='owner')
+        rates = [(1200, None), (None, 100), (300, 50), (None, None), (2500, None), (700, 90), (950, None)]
+        cls.equipment = [
+            Equipment.objects.create(
+                owner=owner, name=f'Rotavator {i}', category='rotavator', description='Rotary tiller',
+                rent_per_day=day, rent_per_hour=hour, location='Pune',
+            )
+            for i, (day, hour) in enumerate(rates)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def listing(self, **params):
+        response = self.client.get(reverse('equipment:list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def rates(self, response):
+        return [item.daily_rate for item in response.context['equipment_list']]
+
+    def test_effective_daily_rate_follows_both_rates(self):
+        item = self.equipment[1]
+        self.assertEqual(Equipment.objects.get(id=item.id).daily_rate, 800)
+        item.rent_per_day = 650
+        item.save()
+        self.assertEqual(Equipment.objects.get(id=item.id).daily_rate, 650)
+        Equipment.objects.filter(id=item.id).update(rent_per_day=None, rent_per_hour=120)
+        self.assertEqual(Equipment.objects.get(id=item.id).daily_rate, 960)
+
+    def test_min_max_price_includes_hourly_only_equipment(self):
+        response = self.listing(min_price='700', max_price='1000', sort='price_asc')
+        self.assertEqual(self.rates(response), [700, 800, 950])
+        self.assertEqual(self.rates(self.listing(min_price='2000')), [2500])
+        # Nonsense bounds are ignored
+        self.assertEqual(len(self.listing(min_price='cheap', max_price='-5').context['equipment_list']), 7)
+
+    def test_quote_comparison(self):
+        response = self.listing(sort='price_asc', quote='7d')
+        quotes = {item.daily_rate: item.quote.amount for item in response.context['equipment_list']}
+        # A week is 10% off; hourly-only equipment is rented by the working day
+        self.assertEqual(quotes[1200], 7560)
+        self.assertEqual(quotes[800], 5040)
+        self.assertContains(response, '₹7560.00</strong> for 1 week')
+
+        response = self.listing(quote='4h')
+        quotes = {item.id: item.quote.amount for item in response.context['equipment_list']}
+        # Without an hourly rate a few hours cost the whole day
+        self.assertEqual(quotes[self.equipment[0].id], 1200)
+        self.assertEqual(quotes[self.equipment[1].id], 400)
+        self.assertIsNone(quotes[self.equipment[3].id])
+
+        for item in self.listing(quote='forever').context['equipment_list']:
+            self.assertFalse(hasattr(item, 'quote'))
+
+    def test_price_sort_pages(self):
+        # Ties on the rate, spilling onto a second page
+        owner = self.equipment[0].owner
+        for i in range(8):
+            Equipment.objects.create(
+                owner=owner, name=f'Tiller {i}', category='rotavator', description='Tiller',
+                rent_per_day=800, location='Pune',
+            )
+        priced = Equipment.objects.filter(daily_rate__isnull=False)
+        for sort, ordering in PRICE_ORDERINGS.items():
+            expected = list(priced.order_by(*ordering).values_list('id', flat=True))
+            seen, params = [], {'sort': sort}
+            while True:
+                page = self.listing(**params).context['page']
+                seen += [item.id for item in page.object_list]
+                if not page.has_next:
+                    break
+                params['cursor'] = page.next_cursor
+            self.assertEqual(seen, expected, sort)
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', role='owner')
+        cls.items = [
+            Equipment.objects.create(
+                owner=owner, name=f'Machine {i}', category='other', description='Well kept',
+                rent_per_day=500, location='Pune',
+            )
+            for i in range(6)
+        ]
+        cls.farmers = [User.objects.create_user(f'farmer{i}', role='farmer') for i in range(4)]
+        cls.book(cls.farmers[0], 0, 1)
+        cls.book(cls.farmers[1], 0, 1, 2)
+        cls.book(cls.farmers[2], 0, 3)
+
+    @classmethod
+    def book(cls, farmer, *items):
+        for item in items:
+            start = date.today() + timedelta(days=3 + 2 * Booking.objects.filter(equipment=cls.items[item]).count())
+            booking = create_booking(farmer, cls.items[item].id, start, 1, 'days')
+            transition(booking.id, 'approved')
+            transition(booking.id, 'completed')
+
+    def test_neighbors_are_cosine_similar_items(self):
+        pairs = [(1, 10), (1, 20), (2, 10), (2, 20), (2, 30), (3, 10), (3, 40)]
+        neighbors = recommendations.cobooking_neighbors(pairs, k=2)
+        # 10 and 20 share two of 10's three farmers and both of 20's
+        self.assertEqual([item for item, _ in neighbors[10]], [20, 30])
+        self.assertAlmostEqual(neighbors[10][0][1], 2 / 6 ** 0.5)
+        self.assertEqual([item for item, _ in neighbors[30]], [20, 10])
+        self.assertEqual(recommendations.cobooking_neighbors(pairs, k=2, items={40}), {40: neighbors[40]})
+
+    def test_recommendations_follow_co_bookings(self):
+        recommendations.refresh(full=True)
+        with self.assertNumQueries(3):
+            recommended = recommendations.recommended_for(self.farmers[0])
+            # Item 2 was co-booked with both of the farmer's items, 3 with one; the newest listing tops up
+            self.assertEqual([item.id for item in recommended], [self.items[i].id for i in (2, 3, 5)])
+            self.assertEqual(recommended[0].owner.username, 'owner')
+
+        # No history: the newest listings
+        fresh = recommendations.recommended_for(self.farmers[3])
+        self.assertEqual([item.id for item in fresh], [self.items[i].id for i in (5, 4, 3)])
+
+    def test_incremental_refresh(self):
+        recommendations.refresh(full=True)
+        self.assertEqual(recommendations.refresh(), 0)
+
+        self.book(self.farmers[3], 3, 4)
+        # Only the items of the farmer with new bookings are rewritten
+        self.assertEqual(recommendations.refresh(), 2)
+        neighbors = EquipmentNeighbor.objects.filter(equipment=self.items[4]).values_list('neighbor_id', flat=True)
+        self.assertEqual(list(neighbors), [self.items[3].id])
+        self.assertEqual(
+            recommendations.recommended_for(self.farmers[3])[0], self.items[0]
+        )
+
+    def test_incremental_refresh_matches_a_full_one(self):
+        recommendations.refresh(full=True)
+        self.book(self.farmers[3], 3, 4)
+        # Only the bookings of farmers who booked the changed items are read
+        changed = {self.items[3].id, self.items[4].id}
+        farmers = {farmer for farmer, _ in recommendations._booked_pairs(changed).tolist()}
+        self.assertEqual(farmers, {self.farmers[2].id, self.farmers[3].id})
+
+        def stored():
+            rows = EquipmentNeighbor.objects.filter(equipment_id__in=changed)
+            return sorted((row.equipment_id, row.neighbor_id, row.rank, round(row.score, 9)) for row in rows)
+
+        recommendations.refresh()
+        incremental = stored()
+        recommendations.refresh(full=True)
+        self.assertEqual(incremental, stored())
+
+    def test_runs_that_write_nothing_advance_the_watermark(self):
+        recommendations.refresh(full=True)
+        # A cancelled booking's items lose nothing, so nothing is written...
+        start = date.today() + timedelta(days=40)
+        booking = create_booking(self.farmers[3], self.items[5].id, start, 1, 'days')
+        transition(booking.id, 'cancelled')
+        last = NeighborRefresh.last(EquipmentNeighbor.COBOOKED)
+        self.assertEqual(recommendations.refresh(), 1)
+        self.assertFalse(EquipmentNeighbor.objects.filter(equipment=self.items[5]).exists())
+        # ...but the run is recorded, so the booking isn't scanned again
+        self.assertGreater(NeighborRefresh.last(EquipmentNeighbor.COBOOKED), last)
+        self.assertEqual(recommendations.refresh(), 0)
+
+
+class SimilarEquipmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', role='owner')
+        cls.items = [
+            Equipment.objects.create(
+                owner=cls.owner, name=name, category=category, description=description,
+                rent_per_day=rent, location=location,
+            )
+            for name, category, description, rent, location in (
+                ('John Deere 5050 tractor', 'tractor', 'Diesel tractor, 50 hp, power steering', 1200, 'Pune'),
+                ('Mahindra 575 tractor', 'tractor', 'Diesel tractor, 45 hp, power steering', 1100, 'Pune'),
+                ('Sonalika tractor', 'tractor', 'Heavy 60 hp tractor for haulage', 3000, 'Nashik'),
+                ('Knapsack sprayer', 'sprayer', 'Battery sprayer, 16 litre tank', 200, 'Pune'),
+                ('Boom sprayer', 'sprayer', 'Tractor mounted boom sprayer, 400 litre tank', 900, 'Nashik'),
+                ('Drip irrigation kit', 'irrigation', 'Drip lines for one acre', 500, 'Pune'),
+            )
+        ]
+        similar.refresh(full=True)
+
+    def neighbors(self, item):
+        return list(
+            EquipmentNeighbor.objects.filter(kind=EquipmentNeighbor.SIMILAR, equipment=item)
+            .order_by('rank').values_list('neighbor_id', flat=True)
+        )
+
+    def test_ranked_by_description_category_location_and_price(self):
+        ids = [item.id for item in self.items]
+        self.assertEqual(self.neighbors(self.items[0])[:2], [ids[1], ids[2]])
+        self.assertEqual(self.neighbors(self.items[3])[0], ids[4])
+
+    def test_detail_shows_the_stored_list(self):
+        cache.clear()
+        response = self.client.get(reverse('equipment:detail', args=[self.items[4].id]))
+        self.assertEqual(
+            [item.id for item in response.context['similar_equipment']],
+            self.neighbors(self.items[4])[:4],
+        )
+
+    def test_refresh_updates_the_lists_of_saved_items(self):
+        with CaptureQueriesContext(connection) as queries:
+            twin = Equipment.objects.create(
+                owner=self.owner, name='Mahindra 575 DI tractor', category='tractor',
+                description='Diesel tractor, 47 hp, power steering', rent_per_day=1150, location='Pune',
+            )
+        # Saving doesn't score anything
+        self.assertFalse([q for q in queries if 'equipment_equipmentneighbor' in q['sql']])
+        self.assertEqual(self.neighbors(twin), [])
+
+        # The twin's list, and the lists of the items it is now close to
+        self.assertGreater(similar.refresh(), 1)
+        self.assertEqual(self.neighbors(twin)[0], self.items[1].id)
+        self.assertEqual(self.neighbors(self.items[1])[0], twin.id)
+        self.assertEqual(similar.refresh(), 0)
+
+        twin.name, twin.category, twin.description = 'Seed drill', 'other', 'Nine row seed drill'
+        twin.save()
+        similar.refresh()
+        self.assertNotIn(twin.id, self.neighbors(self.items[1])[:2])
+
+    def test_many_changes_refresh_everything(self):
+        Equipment.objects.filter(id__in=[item.id for item in self.items[:3]]).update(content_changed_at=timezone.now())
+        self.assertEqual(similar.refresh(), len(self.items))
+
+    def test_only_scored_fields_trigger_a_refresh(self):
+        item = Equipment.objects.get(id=self.items[0].id)
+        item.availability = False
+        item.save()
+        Equipment.objects.filter(id=item.id).update(image_variants={'card': {}}, updated_at=timezone.now())
+        self.assertEqual(similar.refresh(), 0)
+
+        item.rent_per_day = 5000
+        item.save(update_fields=['rent_per_day'])
+        self.assertGreater(similar.refresh(), 0)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('rebuild_similar_equipment', '--full', stdout=out)
+        self.assertIn(f'for {len(self.items)} items', out.getvalue())
+
+
+class EquipmentImageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.media_root)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', role='owner')
+
+    def upload(self, name, content):
+        return Equipment.objects.create(
+            owner=self.owner, name='Plough', category='plough', description='Steel plough',
+            rent_per_day=500, location='Pune', image=SimpleUploadedFile(name, content),
+        )
+
+    def png(self, size):
+        buffer = BytesIO()
+        Image.new('RGBA', size, (40, 120, 40, 128)).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def test_variants(self):
+        item = self.upload('plough.png', self.png((2000, 1000)))
+        images.update_variants(item)
+        item.refresh_from_db()
+        self.assertEqual(set(item.image_variants), set(images.VARIANT_SIZES))
+
+        storage = item.image.storage
+        for variant, (width, height) in images.VARIANT_SIZES.items():
+            for ext, image_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+                path = item.image_variants[variant][ext]
+                self.assertTrue(path.endswith(f'__{variant}.{ext}'), path)
+                with storage.open(path) as handle, Image.open(handle) as variant_image:
+                    self.assertEqual(variant_image.format, image_format)
+                    self.assertEqual(variant_image.mode, 'RGB')
+                    # Scaled to cover the box, keeping the 2:1 shape
+                    self.assertEqual(variant_image.height, max(height, width // 2))
+                    self.assertEqual(variant_image.width, 2 * variant_image.height)
+                self.assertEqual(item.images[variant][ext], storage.url(path))
+
+    def test_small_images_are_not_upscaled(self):
+        item = self.upload('small.png', self.png((200, 100)))
+        images.update_variants(item)
+        with item.image.storage.open(item.image_variants['detail']['jpeg']) as handle:
+            self.assertEqual(Image.open(handle).size, (200, 100))
+
+    def test_corrupt_image_falls_back_to_the_original(self):
+        item = self.upload('broken.jpg', b'not an image')
+        with self.assertLogs('equipment.images', 'WARNING'):
+            images.update_variants(item)
+        item.refresh_from_db()
+        self.assertEqual(item.image_variants, {})
+        self.assertEqual(item.images['card'], {'webp': None, 'jpeg': item.image.url})
+
+    def test_storing_variants_does_not_resave(self):
+        item = self.upload('plough.png', self.png((800, 600)))
+        updated_at = item.updated_at
+        with mock.patch('equipment.signals.search.index_equipment') as index_equipment, \
+                CaptureQueriesContext(connection) as queries:
+            images.update_variants(item)
+        index_equipment.assert_not_called()
+        self.assertEqual([query['sql'].split()[0] for query in queries], ['UPDATE'])
+        item.refresh_from_db()
+        self.assertGreater(item.updated_at, updated_at)
+
+
+class ImportEquipmentTests(TestCase):
+    HEADER = 'owner_email,name,category,description,rent_per_day,rent_per_hour,location,availability,image\n'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=os.path.join(cls.tmp, 'media')))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.tmp)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', email='Owner@example.com', role='owner')
+        User.objects.create_user('farmer', email='farmer@example.com', role='farmer')
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(text)
+        return path
+
+    def run_import(self, path, *args):
+        out, err = StringIO(), StringIO()
+        call_command('import_equipment', path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue().splitlines()
+
+    def test_csv(self):
+        path = self.write('equipment.csv', self.HEADER + (
+            'owner@example.com,Mahindra 575,Tractor,45 HP,1500,,"Pune, Maharashtra",yes,\n'
+            'OWNER@example.com,Boom sprayer,sprayer,,,120.50,Nashik,no,\n'
+        ))
+        out, err = self.run_import(path, '--batch-size', '1')
+        self.assertIn('Imported 2 equipment, 0 rows rejected.', out)
+        self.assertEqual(err, [])
+
+        tractor, sprayer = Equipment.objects.order_by('id')
+        self.assertEqual((tractor.owner, tractor.category, tractor.rent_per_day), (self.owner, 'tractor', 1500))
+        self.assertTrue(tractor.availability)
+        self.assertEqual(tractor.geohash, geo.geohash_encode(*geo.geocode('Pune')))
+        self.assertEqual((sprayer.rent_per_day, sprayer.rent_per_hour, sprayer.availability), (None, Decimal('120.50'), False))
+        self.assertEqual(counters_for(self.owner).equipment_count, 2)
+
+        # Bulk-created rows are in the search index
+        self.assertEqual([item.name for item in search_equipment(Equipment.objects.all(), 'mahindra')], ['Mahindra 575'])
+        self.assertEqual([item.name for item in search_equipment(Equipment.objects.all(), 'sprayer')], ['Boom sprayer'])
+
+    def test_jsonl(self):
+        path = self.write('equipment.jsonl', '\n'.join([
+            json.dumps({'owner_email': 'owner@example.com', 'name': 'Rotavator', 'category': 'other',
+                        'rent_per_day': 900, 'location': 'Farm 12', 'latitude': 18.5, 'longitude': 73.8}),
+            '',
+            json.dumps({'owner_email': 'owner@example.com', 'name': 'Harvester', 'category': 'harvester',
+                        'rent_per_hour': '300', 'location': 'Satara'}),
+        ]))
+        out, err = self.run_import(path)
+        self.assertIn('Imported 2 equipment', out)
+        rotavator = Equipment.objects.get(name='Rotavator')
+        self.assertEqual((rotavator.latitude, rotavator.longitude), (18.5, 73.8))
+        self.assertEqual(rotavator.geohash, geo.geohash_encode(18.5, 73.8))
+        self.assertEqual(search_equipment(Equipment.objects.all(), 'harvester').get().name, 'Harvester')
+
+    def test_rejected_rows(self):
+        rows = [
+            {'name': 'No owner', 'category': 'tractor', 'rent_per_day': 1, 'location': 'Pune'},
+            {'owner_email': 'farmer@example.com', 'name': 'Farmer', 'category': 'tractor', 'rent_per_day': 1, 'location': 'Pune'},
+            {'owner_email': 'owner@example.com', 'category': 'tractor', 'rent_per_day': 1, 'location': 'Pune'},
+            {'owner_email': 'owner@example.com', 'name': 'Boat', 'category': 'boat', 'rent_per_day': 1, 'location': 'Pune'},
+            {'owner_email': 'owner@example.com', 'name': 'Free', 'category': 'tractor', 'location': 'Pune'},
+            {'owner_email': 'owner@example.com', 'name': 'Cheap', 'category': 'tractor', 'rent_per_day': 'abc', 'location': 'Pune'},
+            {'owner_email': 'owner@example.com', 'name': 'Odd', 'category': 'tractor', 'rent_per_day': '1.005', 'location': 'Pune'},
+            {'owner_email': 'owner@example.com', 'name': 'Nan', 'category': 'tractor', 'rent_per_day': 'nan', 'location': 'Pune'},
+            {'owner_email': 'owner@example.com', 'name': 'Inf', 'category': 'tractor', 'rent_per_hour': 'inf', 'location': 'Pune'},
+            {'owner_email': 'owner@example.com', 'name': 'Minus', 'category': 'tractor', 'rent_per_day': '-Infinity', 'location': 'Pune'},
+            {'owner_email': 'owner@example.com', 'name': 'Maybe', 'category': 'tractor', 'rent_per_day': 1, 'location': 'Pune', 'availability': 'maybe'},
+            {'owner_email': 'owner@example.com', 'name': 'Half', 'category': 'tractor', 'rent_per_day': 1, 'location': 'Pune', 'latitude': 18},
+            {'owner_email': 'owner@example.com', 'name': 'Pole', 'category': 'tractor', 'rent_per_day': 1, 'location': 'Pune', 'latitude': 'nan', 'longitude': 0},
+            {'owner_email': 'owner@example.com', 'name': 'Photo', 'category': 'tractor', 'rent_per_day': 1, 'location': 'Pune', 'image': 'a.png'},
+            {'owner_email': 'owner@example.com', 'name': 'Good', 'category': 'tractor', 'rent_per_day': 1, 'location': 'Pune'},
+        ]
+        path = self.write('rows.jsonl', '\n'.join([json.dumps(row) for row in rows] + ['{oops', '[1, 2]']))
+        out, err = self.run_import(path)
+        self.assertIn('Imported 1 equipment, 16 rows rejected.', out)
+        self.assertEqual(err, [
+            'line 1: owner_email is missing',
+            'line 2: no equipment owner with email "farmer@example.com"',
+            'line 3: name and location are required',
+            'line 4: unknown category "boat"',
+            'line 5: rent_per_day or rent_per_hour is required',
+            'line 6: rent_per_day "abc" is not a number',
+            'line 7: rent_per_day 1.005 is out of range',
+            'line 8: rent_per_day "nan" is not a number',
+            'line 9: rent_per_hour "inf" is not a number',
+            'line 10: rent_per_day "-Infinity" is not a number',
+            'line 11: availability "maybe" is not yes/no',
+            'line 12: latitude and longitude go together',
+            'line 13: latitude nan is out of range',
+            'line 14: has an image but no --images-dir was given',
+            'line 16: invalid JSON (Expecting property name enclosed in double quotes: line 1 column 2 (char 1))',
+            'line 17: invalid JSON (not a JSON object)',
+        ])
+        self.assertEqual(list(Equipment.objects.values_list('name', flat=True)), ['Good'])
+
+    def test_dry_run_writes_nothing(self):
+        images_dir = os.path.join(self.tmp, 'dry')
+        os.makedirs(images_dir)
+        with open(os.path.join(images_dir, 'tractor.png'), 'wb') as handle:
+            Image.new('RGB', (10, 10)).save(handle, 'PNG')
+        path = self.write('dry.csv', self.HEADER + 'owner@example.com,Tractor,tractor,,500,,Pune,,tractor.png\n')
+        out, err = self.run_import(path, '--dry-run', '--images-dir', images_dir)
+        self.assertIn('Validated 1 equipment, 0 rows rejected.', out)
+        self.assertFalse(Equipment.objects.exists())
+        self.assertFalse(os.path.exists(settings.MEDIA_ROOT))
+
+    def test_images_dir(self):
+        images_dir = os.path.join(self.tmp, 'images')
+        os.makedirs(os.path.join(images_dir, 'sub'))
+        for name in ('sub/tractor.png', '../outside.png'):
+            with open(os.path.join(images_dir, name), 'wb') as handle:
+                Image.new('RGB', (10, 10)).save(handle, 'PNG')
+        os.symlink(os.path.join(self.tmp, 'outside.png'), os.path.join(images_dir, 'link.png'))
+
+        rows = ''.join(
+            f'owner@example.com,Tractor {i},tractor,,500,,Pune,,{image}\n'
+            for i, image in enumerate(['sub/tractor.png', '../outside.png', os.path.join(self.tmp, 'outside.png'), 'link.png', 'missing.png'])
+        )
+        out, err = self.run_import(self.write('images.csv', self.HEADER + rows), '--images-dir', images_dir)
+        self.assertEqual(err, [
+            'line 3: image "../outside.png" is outside --images-dir',
+            f'line 4: image "{os.path.join(self.tmp, "outside.png")}" is outside --images-dir',
+            'line 5: image "link.png" is outside --images-dir',
+            'line 6: image "missing.png" not found',
+        ])
+        item = Equipment.objects.get()
+        self.assertEqual(item.image.name, f'equipment_photos/user_{self.owner.id}/tractor.png')
+        self.assertTrue(item.image.storage.exists(item.image.name))
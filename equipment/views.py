@@ -1,13 +1,58 @@
-from django.shortcuts import render, get_object_or_404, redirect
+import math
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Q
+from django.utils import timezone
 from .models import Equipment
-from bookings.models import Booking
+from .search import matching, search_equipment
+from . import catalog_cache, facets, images, similar
+from greengear_project import geo
+from greengear_project.db_router import replica_reads
+from greengear_project.pagination import CursorPage, paginate
+from bookings import pricing
+from bookings.intervals import upcoming_bookings
 from django.contrib.auth.decorators import login_required, user_passes_test  # Add this import
 
+# Most results a proximity search will return
+NEAR_RESULTS_LIMIT = 24
+
+# ?sort= price orderings, on the indexed effective daily rate
+PRICE_ORDERINGS = {
+    'price_asc': ['daily_rate', 'id'],
+    'price_desc': ['-daily_rate', '-id'],
+}
+
+def _price_param(request, name):
+    try:
+        value = Decimal(request.GET.get(name, ''))
+    except InvalidOperation:
+        return None
+    return value if value.is_finite() and value >= 0 else None
+
+def _search_origin(request, near_query):
+    # Browser coordinates win over a typed place name; impossible ones are ignored
+    try:
+        point = float(request.GET['lat']), float(request.GET['lon'])
+    except (KeyError, ValueError):
+        pass
+    else:
+        if geo.is_valid_point(*point):
+            return point
+    
+    if near_query == 'me':
+        user = request.user
+        if user.is_authenticated and user.latitude is not None:
+            return user.latitude, user.longitude
+        return None
+    return geo.geocode(near_query)
+
 @login_required
 @user_passes_test(lambda u: u.is_superuser)
+@replica_reads
 def manage_all_equipment(request):
     equipment_list = Equipment.objects.all().select_related('owner').order_by('-created_at')
     
@@ -15,9 +60,7 @@ def manage_all_equipment(request):
     search_query = request.GET.get('q', '')
     if search_query:
         equipment_list = equipment_list.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(location__icontains=search_query) |
+            matching(search_query) |
             Q(owner__username__icontains=search_query)
         )
     
@@ -30,8 +73,11 @@ def manage_all_equipment(request):
     if availability_filter:
         equipment_list = equipment_list.filter(availability=(availability_filter == 'true'))
     
+    page = paginate(request, equipment_list, ordering=('-created_at', '-id'))
+    
     context = {
-        'equipment_list': equipment_list,
+        'equipment_list': page.object_list,
+        'page': page,
         'search_query': search_query,
         'category_filter': category_filter,
         'availability_filter': availability_filter
@@ -52,10 +98,13 @@ def admin_edit_equipment(request, equipment_id):
         equipment.location = request.POST.get('location')
         equipment.availability = request.POST.get('availability') == 'on'
         
-        if request.FILES.get('image'):
-            equipment.image = request.FILES['image']
+        new_image = request.FILES.get('image')
+        if new_image:
+            equipment.image = new_image
         
         equipment.save()
+        if new_image:
+            images.update_variants(equipment)
         messages.success(request, f'Equipment "{equipment.name}" updated successfully!')
         return redirect('equipment:manage_all')
     
@@ -109,6 +158,8 @@ def equipment_add(request):
                 availability=availability,
                 image=image
             )
+            if image:
+                images.update_variants(equipment)
             messages.success(request, f'Equipment "{name}" added successfully!')
             return redirect('users:owner_dashboard')
         except Exception as e:
@@ -133,10 +184,13 @@ def equipment_edit(request, equipment_id):
         equipment.location = request.POST.get('location')
         equipment.availability = request.POST.get('availability') == 'on'
         
-        if request.FILES.get('image'):
-            equipment.image = request.FILES['image']
+        new_image = request.FILES.get('image')
+        if new_image:
+            equipment.image = new_image
         
         equipment.save()
+        if new_image:
+            images.update_variants(equipment)
         messages.success(request, f'Equipment "{equipment.name}" updated successfully!')
         return redirect('users:owner_dashboard')
     
@@ -164,23 +218,26 @@ def equipment_delete(request, equipment_id):
     }
     return render(request, 'equipment/delete.html', context)
 
-def equipment_list(request):
+@replica_reads
+async def equipment_list(request):
+    near_query = request.GET.get('near', '').strip()
+    if request.GET.get('my_equipment') or near_query == 'me':
+        # Loaded with the async ORM up front; the template reuses the same object
+        request.user = await request.auser()
+    
     # Base queryset - only available equipment
     equipment_list = Equipment.objects.filter(availability=True).select_related('owner')
     
     # Show only owner's equipment if requested
-    if request.GET.get('my_equipment') and request.user.is_authenticated and request.user.role == 'owner':
-        equipment_list = Equipment.objects.filter(owner=request.user)
+    own_equipment = bool(request.GET.get('my_equipment') and request.user.is_authenticated and request.user.role == 'owner')
+    if own_equipment:
+        equipment_list = Equipment.objects.filter(owner=request.user).select_related('owner')
+    facet_base = equipment_list
     
     # Handle search
     search_query = request.GET.get('q', '')
     if search_query:
-        equipment_list = equipment_list.filter(
-            Q(name__icontains=search_query) |
-            Q(category__icontains=search_query) |
-            Q(location__icontains=search_query) |
-            Q(description__icontains=search_query)
-        )
+        equipment_list = search_equipment(equipment_list, search_query)
     
     # Handle category filter
     category_filter = request.GET.get('category', '')
@@ -194,43 +251,130 @@ def equipment_list(request):
     
     # Handle price range filter
     price_filter = request.GET.get('price_range', '')
-    if price_filter:
-        if price_filter == '0-500':
-            equipment_list = equipment_list.filter(rent_per_day__lte=500)
-        elif price_filter == '500-1000':
-            equipment_list = equipment_list.filter(rent_per_day__gte=500, rent_per_day__lte=1000)
-        elif price_filter == '1000-2000':
-            equipment_list = equipment_list.filter(rent_per_day__gte=1000, rent_per_day__lte=2000)
-        elif price_filter == '2000+':
-            equipment_list = equipment_list.filter(rent_per_day__gte=2000)
+    price_band = facets.price_band_q(price_filter)
+    if price_band is not None:
+        equipment_list = equipment_list.filter(price_band)
+    
+    # Handle min/max price (per day; hourly-only equipment by a working day's rent)
+    min_price = _price_param(request, 'min_price')
+    max_price = _price_param(request, 'max_price')
+    price_bounds = {}
+    if min_price is not None:
+        price_bounds['daily_rate__gte'] = min_price
+    if max_price is not None:
+        price_bounds['daily_rate__lte'] = max_price
+    equipment_list = equipment_list.filter(**price_bounds)
+    facet_base = facet_base.filter(**price_bounds)
+    
+    sort_filter = request.GET.get('sort', '')
+    
+    # Price every result for one duration, to compare them
+    quote_filter = request.GET.get('quote', '')
+    compared = pricing.compared_duration(quote_filter)
+    
+    # Handle proximity search: radius when given, otherwise nearest first
+    radius_filter = request.GET.get('radius', '')
+    origin = None
+    if near_query or request.GET.get('lat'):
+        origin = _search_origin(request, near_query)
+        if origin is None:
+            messages.warning(request, f'Could not find the location "{near_query}". Showing all results.')
+    
+    def build_page():
+        if origin:
+            try:
+                radius_km = float(radius_filter)
+            except ValueError:
+                radius_km = None
+            if radius_km and 0 < radius_km < math.inf:
+                results = geo.within_radius(equipment_list, *origin, radius_km, limit=NEAR_RESULTS_LIMIT)
+            else:
+                results = geo.nearest(equipment_list, *origin, k=NEAR_RESULTS_LIMIT)
+            return CursorPage(results)
+        # Relevance first when searching, newest first otherwise
+        listing = equipment_list
+        ordering = ['-created_at', '-id']
+        if sort_filter in PRICE_ORDERINGS:
+            # Equipment without any rate has no place in a price order
+            listing = listing.filter(daily_rate__isnull=False)
+            ordering = PRICE_ORDERINGS[sort_filter]
+        elif search_query and 'search_rank' in equipment_list.query.annotations:
+            ordering.insert(0, '-search_rank')
+        return paginate(request, listing, ordering=ordering, per_page=12)
+    
+    # Result counts next to each filter value; proximity results are a
+    # short nearest-first list, so they are not counted
+    def count_facets():
+        if origin:
+            return facets.facet_counts(None)
+        if own_equipment:
+            rows = facets.grouped_rows(facet_base, search_query)
+        else:
+            rows = facets.cached_rows(facet_base, search_query, {k: str(v) for k, v in price_bounds.items()})
+        return facets.facet_counts(rows, category_filter, price_filter, location_filter)
+    
+    # The pagination, proximity and facet helpers are sync; they run on the request's sync thread
+    build_page = sync_to_async(build_page)
+    
+    # Results only depend on the query string unless they are about the user
+    if own_equipment or (near_query == 'me' and origin):
+        listing = build_page()
+    else:
+        # Quotes are added to the page below, so they don't split its cache entry
+        params = {key: values for key, values in request.GET.lists() if key != 'quote'}
+        listing = catalog_cache.acached_listing('explore', params, build_page)
+    page = await listing
+    facet_counts = await sync_to_async(count_facets)()
+    
+    if compared:
+        _, duration, duration_type, _ = compared
+        quotes = pricing.quote_table(page.object_list, [duration], duration_type)
+        for equipment, (quote,) in zip(page.object_list, quotes):
+            equipment.quote = quote
     
     context = {
-        'equipment_list': equipment_list,
+        'equipment_list': page.object_list,
+        'page': page,
         'search_query': search_query,
         'category_filter': category_filter,
         'location_filter': location_filter,
-        'price_filter': price_filter
+        'price_filter': price_filter,
+        'min_price': min_price,
+        'max_price': max_price,
+        'sort_filter': sort_filter,
+        'quote_filter': quote_filter,
+        'quote_label': compared[3] if compared else '',
+        'compared_durations': pricing.COMPARED_DURATIONS,
+        'near_query': near_query,
+        'radius_filter': radius_filter,
+        'near_active': origin is not None,
+        'facets': facet_counts,
+        'catalog_cache_ttl': catalog_cache.ttl()
     }
-    return render(request, 'equipment/list.html', context)
+    return await sync_to_async(render)(request, 'equipment/list.html', context)
 
-def equipment_detail(request, equipment_id):
-    equipment = get_object_or_404(Equipment, id=equipment_id)
-    
-    # Check if equipment is currently booked
-    active_booking = Booking.objects.filter(
-        equipment=equipment,
-        status__in=['pending', 'approved']
-    ).first()
-    
-    # Get similar equipment (same category, different owner, available)
-    similar_equipment = Equipment.objects.filter(
-        category=equipment.category,
-        availability=True
-    ).exclude(id=equipment_id).select_related('owner')[:4]
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
+@replica_reads
+async def equipment_detail(request, equipment_id):
+    # Equipment, bookings still to run (other dates remain bookable) and
+    # similar equipment. The async ORM and cache calls all run on the
+    # request's sync thread, one after another, so they are simply awaited
+    equipment = await aget_object_or_404(Equipment, id=equipment_id)
+    booked_intervals = await _alist(upcoming_bookings(equipment_id, limit=5))
+    similar_equipment = await catalog_cache.acached_listing(
+        'similar', {'id': equipment_id}, lambda: similar.asimilar_to(equipment_id)
+    )
     
+    # Soonest first, so only the first one can be running right now
+    booked_now = bool(booked_intervals) and booked_intervals[0].start_at <= timezone.now()
     context = {
         'equipment': equipment,
         'similar_equipment': similar_equipment,
-        'is_available': equipment.availability and not active_booking
+        'is_available': equipment.availability and not booked_now,
+        'can_book': equipment.availability,
+        'booked_intervals': booked_intervals,
+        'catalog_cache_ttl': catalog_cache.ttl()
     }
-    return render(request, 'equipment/detail.html', context)
\ No newline at end of file
+    return await sync_to_async(render)(request, 'equipment/detail.html', context)
\ No newline at end of file
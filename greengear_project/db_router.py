@@ -0,0 +1,186 @@
+"""
+Read replicas for the read-only views.
+
+Views wrapped in replica_reads() (the catalog and the list views) run
+their queries on one of the replicas in settings.DATABASE_REPLICAS;
+everything else, and every write, uses the primary (``default``). Reads
+stay on the primary when serving them from a replica could miss a write:
+
+- inside a transaction on the primary, which may hold uncommitted rows;
+- for PIN_SECONDS after a client's last POST (or other unsafe request),
+  marked by the PIN_COOKIE that PinAfterWriteMiddleware sets, so users
+  see their own changes on the page they are redirected to;
+- for sessions, which must be there the moment a user has logged in.
+
+A replica is only used while its replication lag is at most
+settings.REPLICA_MAX_LAG seconds. Each worker measures the lag at most
+every REPLICA_LAG_CHECK_INTERVAL seconds; a replica that can't be reached,
+or whose lag can't be told, is left alone until the next check. With
+every replica lagging, reads fall back to the primary.
+"""
+import logging
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+DEFAULT_MAX_LAG = 2
+DEFAULT_LAG_CHECK_INTERVAL = 1
+DEFAULT_PIN_SECONDS = 5
+
+# Apps whose rows must be read back right after they are written
+PRIMARY_ONLY_APPS = {'sessions'}
+
+_LAG_QUERIES = {
+    # An idle primary replays nothing, so a caught-up replica counts as in sync
+    'postgresql': """
+        SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+    """,
+}
+
+_use_replica = ContextVar('use_replica', default=False)
+# {alias: (checked at, lag in seconds or None)}, per worker
+_lag = {}
+
+
+def max_lag():
+    return getattr(settings, 'REPLICA_MAX_LAG', DEFAULT_MAX_LAG)
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', DEFAULT_PIN_SECONDS)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def measure_lag(alias):
+    """Replication lag of ``alias`` in seconds, or None when it can't be told."""
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute('SHOW REPLICA STATUS')
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                columns = [column[0] for column in cursor.description]
+                lag = row[columns.index('Seconds_Behind_Source')]
+            elif connection.vendor in _LAG_QUERIES:
+                cursor.execute(_LAG_QUERIES[connection.vendor])
+                lag = cursor.fetchone()[0]
+            else:
+                # A copy of an SQLite file has nothing to replay
+                cursor.execute('SELECT 1')
+                lag = 0
+    except DatabaseError:
+        logger.warning('Replica %s is unreachable', alias, exc_info=True)
+        return None
+    return None if lag is None else float(lag)
+
+
+def lag_check_interval():
+    return getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', DEFAULT_LAG_CHECK_INTERVAL)
+
+
+def max_staleness():
+    """Most seconds a replica still in use can be behind: the lag limit, plus the time since it was measured."""
+    return max_lag() + lag_check_interval()
+
+
+def replica_lag(alias):
+    """measure_lag(), remembered for LAG_CHECK_INTERVAL seconds."""
+    now = time.monotonic()
+    checked_at, lag = _lag.get(alias, (None, None))
+    if checked_at is None or now - checked_at >= lag_check_interval():
+        lag = measure_lag(alias)
+        _lag[alias] = (now, lag)
+    return lag
+
+
+def healthy_replicas():
+    limit = max_lag()
+    return [alias for alias in replicas() if (lag := replica_lag(alias)) is not None and lag <= limit]
+
+
+def reading_replicas():
+    """Whether reads in the current context may be served by a replica."""
+    return _use_replica.get()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _use_replica.get() or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        candidates = healthy_replicas()
+        return random.choice(candidates) if candidates else None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+
+def _pinned(request):
+    return request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+
+
+def replica_reads(view):
+    """Serve the view's reads from a replica, unless the client just wrote something."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            token = _use_replica.set(bool(replicas()) and not _pinned(request))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            token = _use_replica.set(bool(replicas()) and not _pinned(request))
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+    return wrapper
+
+
+class PinAfterWriteMiddleware:
+    """Keep a client's reads on the primary for a few seconds after each unsafe request."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _pin(self, request, response):
+        if request.method not in SAFE_METHODS and replicas():
+            response.set_cookie(PIN_COOKIE, '1', max_age=pin_seconds(), httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._pin(request, await self.get_response(request))
@@ -0,0 +1,254 @@
+"""
+Offline geocoding and geohash-indexed proximity search.
+
+Free-text locations are resolved against the bundled gazetteer
+(data/gazetteer.csv), so no network geocoder is involved. Located rows
+carry a geohash; radius and nearest-k queries only look at the geohash
+cells around the search point and compute exact distances for those
+candidates.
+
+GeoLocatedModel adds the coordinates and geohash to a model with a
+``location`` (equipment and users).
+
+Search points must be finite, with latitude in -90..90 and longitude in
+-180..180; within_radius() and nearest() raise ValueError for any other,
+so callers taking coordinates from a request check is_valid_point() first.
+"""
+import csv
+import math
+import re
+from functools import lru_cache
+from pathlib import Path
+
+from django.db import models
+from django.db.models import Q
+
+GAZETTEER_PATH = Path(__file__).resolve().parent / 'data' / 'gazetteer.csv'
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+GEOHASH_PRECISION = 8
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Words that commonly pad Indian addresses but are not place names
+STOP_WORDS = {'district', 'dist', 'taluka', 'tal', 'tehsil', 'city', 'village', 'near', 'india'}
+
+
+def _normalize(text):
+    return ' '.join(re.findall(r'[a-z]+', text.lower()))
+
+
+@lru_cache(maxsize=1)
+def gazetteer():
+    places = {}
+    with open(GAZETTEER_PATH, newline='', encoding='utf-8') as handle:
+        for row in csv.DictReader(handle):
+            point = (float(row['latitude']), float(row['longitude']))
+            places[_normalize(row['name'])] = point
+            for alias in filter(None, row['aliases'].split('|')):
+                places[_normalize(alias)] = point
+    return places
+
+
+@lru_cache(maxsize=4096)
+def geocode(location):
+    """Return ``(latitude, longitude)`` for a free-text location, or None."""
+    if not location:
+        return None
+    places = gazetteer()
+
+    candidates = [location] + re.split(r'[,/;()\-]', location)
+    for candidate in candidates:
+        key = _normalize(candidate)
+        if key in places:
+            return places[key]
+
+    # Fall back to any run of up to three words, longest first
+    words = [w for w in _normalize(location).split() if w not in STOP_WORDS]
+    for size in (3, 2, 1):
+        for start in range(len(words) - size + 1):
+            key = ' '.join(words[start:start + size])
+            if key in places:
+                return places[key]
+    return None
+
+
+def is_valid_point(latitude, longitude):
+    return (
+        math.isfinite(latitude) and math.isfinite(longitude)
+        and -90 <= latitude <= 90 and -180 <= longitude <= 180
+    )
+
+
+def _check_point(latitude, longitude):
+    if not is_valid_point(latitude, longitude):
+        raise ValueError(f'({latitude}, {longitude}) is not a valid point.')
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bit = value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coord = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bit = value = 0
+    return ''.join(chars)
+
+
+def _cell_size_degrees(precision):
+    bits = precision * 5
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def _covered_radius_km(latitude, precision):
+    # A point inside the centre cell of a 3x3 block is at least one cell
+    # height/width away from anything outside the block
+    lat_deg, lon_deg = _cell_size_degrees(precision)
+    return min(lat_deg * KM_PER_DEGREE, lon_deg * KM_PER_DEGREE * math.cos(math.radians(latitude)))
+
+
+def _block_prefixes(latitude, longitude, precision):
+    lat_deg, lon_deg = _cell_size_degrees(precision)
+    prefixes = set()
+    for dlat in (-lat_deg, 0, lat_deg):
+        for dlon in (-lon_deg, 0, lon_deg):
+            lat = max(-89.999999, min(89.999999, latitude + dlat))
+            lon = (longitude + dlon + 180.0) % 360.0 - 180.0
+            prefixes.add(geohash_encode(lat, lon, precision))
+    return prefixes
+
+
+def _precision_for_radius(latitude, radius_km):
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        if _covered_radius_km(latitude, precision) >= radius_km:
+            return precision
+    return None
+
+
+def _in_cells(prefixes):
+    # Range scans (not LIKE) so the geohash B-tree index is used everywhere
+    q = Q()
+    for prefix in prefixes:
+        q |= Q(geohash__gte=prefix, geohash__lt=prefix + '~')
+    return q
+
+
+def _with_distances(candidates, latitude, longitude, radius_km=None):
+    results = []
+    # Sorted by distance here, so the database needn't order them: a model
+    # ordering would make it walk that index instead of the cells'
+    for obj in candidates.order_by():
+        obj.distance_km = haversine_km(latitude, longitude, obj.latitude, obj.longitude)
+        if radius_km is None or obj.distance_km <= radius_km:
+            results.append(obj)
+    # Newest first among equally distant rows
+    results.sort(key=lambda obj: (obj.distance_km, -obj.pk))
+    return results
+
+
+def within_radius(queryset, latitude, longitude, radius_km, limit=None):
+    """Rows of ``queryset`` within ``radius_km``, nearest first, with ``distance_km`` set."""
+    _check_point(latitude, longitude)
+    if not math.isfinite(radius_km):
+        raise ValueError(f'{radius_km} is not a valid radius.')
+    located = queryset.exclude(geohash='')
+    precision = _precision_for_radius(latitude, radius_km)
+    if precision is not None:
+        located = located.filter(_in_cells(_block_prefixes(latitude, longitude, precision)))
+
+    # Cheap bounding-box cut before computing exact distances
+    lat_delta = radius_km / KM_PER_DEGREE
+    lon_delta = radius_km / max(KM_PER_DEGREE * math.cos(math.radians(latitude)), 1e-6)
+    located = located.filter(
+        latitude__gte=latitude - lat_delta, latitude__lte=latitude + lat_delta,
+    )
+    if lon_delta < 180:
+        west, east = longitude - lon_delta, longitude + lon_delta
+        # A box across the antimeridian is two ranges, one either side of it
+        if west < -180:
+            located = located.filter(Q(longitude__gte=west + 360) | Q(longitude__lte=east))
+        elif east > 180:
+            located = located.filter(Q(longitude__gte=west) | Q(longitude__lte=east - 360))
+        else:
+            located = located.filter(longitude__gte=west, longitude__lte=east)
+
+    results = _with_distances(located, latitude, longitude, radius_km)
+    return results[:limit] if limit else results
+
+
+def nearest(queryset, latitude, longitude, k):
+    """The ``k`` rows of ``queryset`` nearest to the point, with ``distance_km`` set."""
+    _check_point(latitude, longitude)
+    located = queryset.exclude(geohash='')
+    if located.count() <= k:
+        # Everything qualifies; widening cell by cell would only repeat the query
+        return _with_distances(located, latitude, longitude)
+    # Widen the cell block until it holds k rows that are provably the closest
+    for precision in range(GEOHASH_PRECISION - 2, 0, -1):
+        candidates = located.filter(_in_cells(_block_prefixes(latitude, longitude, precision)))
+        results = _with_distances(candidates, latitude, longitude)
+        covered = _covered_radius_km(latitude, precision)
+        if len(results) >= k and results[k - 1].distance_km <= covered:
+            return results[:k]
+    return _with_distances(located, latitude, longitude)[:k]
+
+
+class GeoLocatedModel(models.Model):
+    """Adds coordinates, geocoded from ``location``, and a geohash index."""
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_location = instance.__dict__.get('location')
+        return instance
+
+    def locate(self):
+        # Re-geocode new rows and edited locations; coordinates set directly
+        # (e.g. from a device) are kept when the location text is unchanged
+        location_changed = self.location != getattr(self, '_loaded_location', None)
+        if self.location and (self.latitude is None or location_changed):
+            point = geocode(self.location)
+            if point:
+                self.latitude, self.longitude = point
+        self.geohash = (
+            geohash_encode(self.latitude, self.longitude)
+            if self.latitude is not None and self.longitude is not None else ''
+        )
+
+    def save(self, *args, **kwargs):
+        self.locate()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'location' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'latitude', 'longitude', 'geohash'}
+        super().save(*args, **kwargs)
+        self._loaded_location = self.location
+
+    class Meta:
+        abstract = True
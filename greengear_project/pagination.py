@@ -0,0 +1,129 @@
+"""
+Keyset (cursor) pagination for the list views.
+
+Pages are selected with a WHERE on the last row's ordering values instead
+of OFFSET, so page 500 costs the same as page 1. Cursors are signed so a
+client can't hand us arbitrary filter values; a cursor that can't be
+read, or doesn't fit the ordering, gives the first page.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+PAGE_SIZE = 20
+CURSOR_PARAM = 'cursor'
+CURSOR_SALT = 'greengear.pagination'
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _field_name(field):
+    return field.lstrip('-')
+
+
+def _flip(field):
+    return _field_name(field) if field.startswith('-') else f'-{field}'
+
+
+def _serialize(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _row_values(obj, ordering):
+    return [_serialize(getattr(obj, _field_name(field))) for field in ordering]
+
+
+def _after(ordering, values):
+    # (a, b) "after" (x, y) in ORDER BY a, b  ==  a > x OR (a = x AND b > y)
+    condition = Q()
+    equal = {}
+    for field, value in zip(ordering, values):
+        name = _field_name(field)
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+    return condition
+
+
+def encode_cursor(direction, values):
+    return signing.dumps([direction, values], salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token):
+    try:
+        direction, values = signing.loads(token, salt=CURSOR_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        return 'next', None
+    if direction not in ('next', 'previous') or not isinstance(values, list):
+        return 'next', None
+    return direction, values
+
+
+def paginate(request, queryset, ordering, per_page=PAGE_SIZE, param=CURSOR_PARAM):
+    """
+    Return one CursorPage of ``queryset`` ordered by ``ordering``.
+
+    ``ordering`` must end in a unique column (normally ``-id``) so that every
+    row has a distinct position.
+    """
+    ordering = list(ordering)
+    direction, values = decode_cursor(request.GET.get(param, ''))
+    if values is not None and len(values) != len(ordering):
+        direction, values = 'next', None
+
+    # Walking backwards is walking forwards over the reversed ordering
+    scan_ordering = ordering if direction == 'next' else [_flip(f) for f in ordering]
+    rows = queryset.order_by(*scan_ordering)
+    if values is not None:
+        try:
+            rows = rows.filter(_after(scan_ordering, values))
+        except (ValidationError, ValueError, TypeError):
+            # Signed, but for another ordering (e.g. a link kept across a sort change)
+            direction, values = 'next', None
+
+    rows = list(rows[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'previous':
+        rows.reverse()
+
+    has_next = has_more if direction == 'next' else values is not None
+    has_previous = values is not None if direction == 'next' else has_more
+
+    next_cursor = previous_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor('next', _row_values(rows[-1], ordering))
+    if rows and has_previous:
+        previous_cursor = encode_cursor('previous', _row_values(rows[0], ordering))
+
+    return CursorPage(rows, next_cursor, previous_cursor)
@@ -0,0 +1,122 @@
+"""
+Per-request database query instrumentation.
+
+QueryCountMiddleware records how many queries each request runs, how long
+they take and which statements repeat (the usual sign of an N+1 loop in a
+template), and compares the count with the view's budget in
+settings.QUERY_BUDGETS. Over-budget requests and repeated statements are
+logged; the numbers are also sent back as X-Query-Count and Server-Timing
+headers and kept on ``response.query_stats`` for tests (see
+greengear_project.testing).
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Literal numbers and IN (...) list lengths vary between otherwise identical queries
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_NUMBER = re.compile(r'\b\d+\b')
+
+
+def fingerprint(sql):
+    return _NUMBER.sub('?', _IN_LIST.sub('IN (...)', sql))
+
+
+def budget_for(view_name):
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(view_name)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.view_name = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def duplicates(self):
+        """Statements run more than once, with how many times they ran."""
+        return {sql: n for sql, n in self.fingerprints.items() if n > 1}
+
+    @contextmanager
+    def record(self):
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield self
+
+    def summary(self):
+        return f'{self.count} queries in {self.duration * 1000:.1f} ms'
+
+
+def _enabled():
+    return getattr(settings, 'QUERY_INSTRUMENTATION', False)
+
+
+class QueryCountMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not _enabled():
+            return self.get_response(request)
+
+        stats = QueryStats()
+        with stats.record():
+            response = self.get_response(request)
+        return self.report(request, response, stats)
+
+    async def __acall__(self, request):
+        if not _enabled():
+            return await self.get_response(request)
+
+        # The async ORM runs queries on the request's thread-sensitive sync
+        # thread, and connections are per thread, so the wrappers go there
+        stats = QueryStats()
+        recording = stats.record()
+        await sync_to_async(recording.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recording.__exit__)(None, None, None)
+        return self.report(request, response, stats)
+
+    def report(self, request, response, stats):
+        if request.resolver_match:
+            stats.view_name = request.resolver_match.view_name
+
+        response.query_stats = stats
+        response['X-Query-Count'] = str(stats.count)
+        response['Server-Timing'] = f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"'
+
+        budget = budget_for(stats.view_name)
+        if budget is not None and stats.count > budget:
+            logger.warning('%s ran %s, over its budget of %s', request.path, stats.summary(), budget)
+        for sql, times in stats.duplicates.items():
+            logger.info('%s ran the same query %s times: %s', request.path, times, sql)
+        return response
+
@@ -0,0 +1,50 @@
+"""
+Session store for authenticated traffic.
+
+Sessions here only hold the login (user id, backend and password hash), so
+they are written at login, logout and password change and read on every
+request. This store keeps them in the database like Django's ``db`` engine,
+but serves reads from the process-local ``sessions`` cache, so a logged-in
+request normally runs no django_session query at all.
+
+Each worker has its own cache, so entries are kept for at most
+SESSION_LOCAL_CACHE_TTL seconds: a logout or password change made through
+one worker reaches the others within that time. Writes still go straight
+to the database, which stays the source of truth across workers and
+restarts.
+"""
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+
+DEFAULT_LOCAL_TTL = 60
+
+
+def local_ttl():
+    return getattr(settings, 'SESSION_LOCAL_CACHE_TTL', DEFAULT_LOCAL_TTL)
+
+
+class LocalCache:
+    """Cache proxy that stores entries for at most local_ttl() seconds."""
+
+    def __init__(self, cache):
+        self._cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self._cache, name)
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    def set(self, key, value, timeout):
+        self._cache.set(key, value, min(timeout, local_ttl()))
+
+    async def aset(self, key, value, timeout):
+        await self._cache.aset(key, value, min(timeout, local_ttl()))
+
+
+class SessionStore(cached_db.SessionStore):
+    cache_key_prefix = 'greengear.sessions'
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._cache = LocalCache(self._cache)
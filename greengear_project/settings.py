@@ -33,10 +33,11 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = 'django-insecure-56cfh)3!@p*x)fib$%9+wvm^=+=4(qjg=zvbx(#a&m4dks2^2q'
 
-# SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
-
 import os
+
+# SECURITY WARNING: don't run with debug turned on in production!
+# DEBUG=false also switches static files to the hashed, compressed build
+DEBUG = os.environ.get('DEBUG', 'true').lower() in ('1', 'true')
 ALLOWED_HOSTS = [
     "greengear.onrender.com",
     "www.greengear.onrender.com",
@@ -55,14 +56,21 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
+    # Lets runserver serve static files through WhiteNoise too
+    'whitenoise.runserver_nostatic',
     'django.contrib.staticfiles',
     'users',
     'equipment',
     'bookings',
+    'rest_framework',
+    'api',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'greengear_project.querycount.QueryCountMiddleware',
+    'greengear_project.db_router.PinAfterWriteMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -78,6 +86,8 @@ TEMPLATES = [
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
+        # With no 'loaders' given, Django wraps these in the cached loader
+        # (reloading on change when DEBUG); see greengear_project.warmup
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -100,11 +110,42 @@ WSGI_APPLICATION = 'greengear_project.wsgi.application'
 DATABASES = {
     'default': dj_database_url.config(
         default='sqlite:///db.sqlite3',
-        conn_max_age=600,
-        ssl_require=True
+        conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        ssl_require=os.environ.get('DATABASE_URL', '').startswith('postgres')
     )
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # SQLite has no row locks: transactions take the write lock when they
+    # begin, so concurrent writers queue up instead of failing as "locked"
+    DATABASES['default']['OPTIONS'] = {'transaction_mode': 'IMMEDIATE', 'timeout': 20}
+    # A file rather than an in-memory test database, so tests can use
+    # several connections at once (e.g. the concurrent booking tests)
+    DATABASES['default']['TEST'] = {'NAME': BASE_DIR / 'test_db.sqlite3'}
+
+# Read replicas for the catalog and list views (greengear_project.db_router):
+# DATABASE_REPLICA_URLS is a comma-separated list of database URLs
+DATABASE_REPLICAS = []
+for number, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    alias = f'replica{number}'
+    DATABASES[alias] = dj_database_url.parse(url.strip(), conn_max_age=DATABASES['default']['CONN_MAX_AGE'])
+    # Tests have no replication, so replicas read the primary's test database
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+if not DATABASE_REPLICAS:
+    # A second connection to the primary that nothing reads from unless
+    # it is listed in DATABASE_REPLICAS, which only the routing tests do.
+    # Connections open lazily, so outside those tests it costs nothing
+    DATABASES['replica'] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['greengear_project.db_router.ReplicaRouter']
+
+# Replicas further behind than this many seconds are not read from
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 2))
+# Reads stay on the primary this long after a client's POST, to show their own changes
+REPLICA_PIN_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -145,6 +186,20 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Without DEBUG, collectstatic writes content-hashed copies of every file
+# plus .gz and .br (with Brotli installed) variants; WhiteNoise serves the
+# hashed names with a far-future immutable Cache-Control and picks the
+# variant the browser accepts. Pages then fail loudly if a template links a
+# file that is missing from the build.
+STATIC_STORAGE = (
+    'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+    else 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': STATIC_STORAGE},
+}
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -161,5 +216,111 @@ LOGIN_REDIRECT_URL = 'home'
 
 LOGOUT_REDIRECT_URL = 'home'
 
+# The default cache holds the catalog listings and the version that
+# invalidates them, so production needs one every process shares:
+# CACHE_URL=redis://host:6379/0 (needs the redis package) or
+# memcached://host:11211 (needs pymemcache). Without it each process caches
+# for itself and listings are kept for CATALOG_LOCAL_CACHE_TTL seconds at most.
+CACHE_URL = os.environ.get('CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    DEFAULT_CACHE = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}
+elif CACHE_URL.startswith('memcached://'):
+    DEFAULT_CACHE = {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': CACHE_URL.removeprefix('memcached://'),
+    }
+else:
+    DEFAULT_CACHE = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+
+CACHES = {
+    'default': DEFAULT_CACHE,
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sessions',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Session storage (SESSION_BACKEND):
+#   cache  - database sessions read through a per-process cache (default)
+#   cookie - signed cookies, no server-side storage; a copied cookie stays
+#            valid after logout until it expires
+#   db     - plain database sessions
+# Expired database rows are removed with ``manage.py purge_sessions``.
+SESSION_ENGINES = {
+    'cache': 'greengear_project.sessions',
+    'cookie': 'django.contrib.sessions.backends.signed_cookies',
+    'db': 'django.contrib.sessions.backends.db',
+}
+SESSION_ENGINE = SESSION_ENGINES[os.environ.get('SESSION_BACKEND', 'cache')]
+SESSION_CACHE_ALIAS = 'sessions'
+# Seconds a worker trusts its cached copy of a session
+SESSION_LOCAL_CACHE_TTL = int(os.environ.get('SESSION_LOCAL_CACHE_TTL', 60))
+
+# Seconds the admin dashboard statistics snapshot is reused before recomputing
+ADMIN_STATS_TTL = int(os.environ.get('ADMIN_STATS_TTL', 300))
+
+# Seconds catalog listings and equipment cards stay cached (0 disables listing caching)
+CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL', 600))
+# The cap on that when CACHES['default'] is process-local
+CATALOG_LOCAL_CACHE_TTL = int(os.environ.get('CATALOG_LOCAL_CACHE_TTL', 30))
+
+# Count the queries of every request (X-Query-Count/Server-Timing headers,
+# warnings for views over budget); the test suite always turns this on
+QUERY_INSTRUMENTATION = os.environ.get('QUERY_INSTRUMENTATION', str(DEBUG)).lower() in ('1', 'true')
+
+# Most database queries each view may run, by URL name. Writes leave room
+# for BEGIN/COMMIT, which the tests (already inside a transaction) don't run
+QUERY_BUDGETS = {
+    'home': 2,
+    'equipment:list': 4,
+    # One more while an item has too few similar items stored (see equipment.similar)
+    'equipment:detail': 5,
+    'equipment:add': 2,
+    'equipment:edit': 8,
+    'equipment:delete': 3,
+    'equipment:manage_all': 4,
+    'equipment:admin_edit': 8,
+    'equipment:admin_delete': 9,
+    'bookings:create': 14,
+    'bookings:detail': 3,
+    'bookings:farmer_list': 3,
+    'bookings:owner_list': 3,
+    'bookings:update_status': 14,
+    # The CSV rows are read while the response streams, after the view returns
+    'bookings:export': 2,
+    'bookings:export_earnings': 2,
+    # A successful login saves the session twice and updates last_login
+    'users:login': 9,
+    'users:logout': 4,
+    'users:register_farmer': 2,
+    'users:register_owner': 2,
+    # Seven more on a user's first visit, which builds their counters row (see users.counters)
+    'users:profile': 12,
+    'users:farmer_dashboard': 13,
+    'users:owner_dashboard': 11,
+    'users:change_password': 2,
+    'users:admin_dashboard': 17,
+    'users:manage_users': 3,
+    'users:create_user': 6,
+    'users:edit_user': 6,
+    'users:delete_user': 25,
+    'api:equipment_list': 2,
+    'api:equipment_detail': 2,
+    'api:booking_list': 4,
+    'api:booking_detail': 4,
+    'api:dashboard': 12,
+}
+
+# JSON API (api app): read-only JSON, session auth for the site and basic auth for apps
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated'],
+}
+
 
 
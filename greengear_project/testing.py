@@ -0,0 +1,95 @@
+"""
+Test helpers.
+
+QueryBudgetTestCase turns on the query instrumentation middleware and adds
+assertions against settings.QUERY_BUDGETS, so a view that starts running
+more queries than its budget fails the test suite. Its assertNoFullScans()
+also EXPLAINs the queries a block runs and fails on any that reads a whole
+table or walks a whole index, so a view whose query stops matching an
+index is caught too.
+"""
+import re
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .querycount import budget_for
+
+# A SQLite plan step visiting every row of a table, bare or in the order
+# of one of its indexes: ``SCAN t`` or ``SCAN t USING INDEX i``
+_FULL_SCAN = re.compile(r'^SCAN (\w+)(?: USING INDEX (\w+))?$')
+
+
+def query_plan(sql):
+    """SQLite's EXPLAIN QUERY PLAN steps for ``sql``."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def full_scans(sql, plan, allow=()):
+    """
+    The steps of ``plan`` that read a whole table. SEARCH steps, covering
+    index scans (which never touch the table) and full-text MATCH lookups
+    pass, and so does an index walk driving a LIMIT without a sort (a
+    first page, newest first), which stops after that many rows. Walks of
+    the indexes in ``allow`` are expected.
+    """
+    bounded = ' LIMIT ' in sql and not any(step.startswith('USE TEMP B-TREE FOR ORDER BY') for step in plan)
+    scans = []
+    for number, step in enumerate(plan):
+        match = _FULL_SCAN.match(step)
+        if not match or match[1] == 'CONSTANT':
+            continue
+        if match[2] and (match[2] in allow or (bounded and number == 0)):
+            continue
+        scans.append(step)
+    return scans
+
+
+@override_settings(QUERY_INSTRUMENTATION=True)
+class QueryBudgetTestCase(TestCase):
+    def assertWithinQueryBudget(self, response, budget=None):
+        stats = response.query_stats
+        if budget is None:
+            budget = budget_for(stats.view_name)
+        if budget is None:
+            self.fail(f'{stats.view_name} has no entry in QUERY_BUDGETS')
+        repeated = ''.join(f'\n  {n}x {sql}' for sql, n in stats.duplicates.items())
+        self.assertLessEqual(
+            stats.count, budget,
+            f'{stats.view_name} ran {stats.summary()}, budget is {budget}{repeated}',
+        )
+
+    def assertNoRepeatedQueries(self, response):
+        duplicates = response.query_stats.duplicates
+        self.assertFalse(
+            duplicates,
+            f'{response.query_stats.view_name} repeated queries:'
+            + ''.join(f'\n  {n}x {sql}' for sql, n in duplicates.items()),
+        )
+
+    @contextmanager
+    def assertNoFullScans(self, allow=()):
+        with CaptureQueriesContext(connection) as queries:
+            yield
+        # Plans are only read on SQLite, which the test suite runs on
+        if connection.vendor != 'sqlite':
+            return
+        for query in queries.captured_queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            plan = query_plan(query['sql'])
+            scans = full_scans(query['sql'], plan, allow)
+            self.assertFalse(
+                scans,
+                f'Full table scan ({", ".join(scans)}) in:\n  {query["sql"]}\nPlan:\n  ' + '\n  '.join(plan),
+            )
+
+    def assertUsesIndex(self, queryset, index_name):
+        if connection.vendor != 'sqlite':
+            return
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f'{index_name} is not used by:\n  {queryset.query}\nPlan:\n{plan}')
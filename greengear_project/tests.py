@@ -0,0 +1,300 @@
+import math
+import random
+import re
+import shutil
+import tempfile
+import time
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from equipment import catalog_cache
+from equipment.models import Equipment
+from users.models import User
+from . import db_router, geo, pagination
+from .testing import full_scans
+
+# A configured replica, or the unused mirror settings adds without one
+REPLICA = settings.DATABASE_REPLICAS[0] if settings.DATABASE_REPLICAS else 'replica'
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        cache.clear()
+        db_router._lag.clear()
+        owner = User.objects.create_user('owner', role='owner')
+        Equipment.objects.create(
+            owner=owner, name='Steel plough', category='plough', description='Steel plough',
+            rent_per_day=500, location='Pune',
+        )
+
+    def get(self, url):
+        """``(response, aliases that read equipment)`` for a GET of ``url``."""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        aliases = {
+            alias for alias, queries in (('default', primary), (REPLICA, replica))
+            if any('equipment_equipment' in query['sql'] for query in queries)
+        }
+        return response, aliases
+
+    def test_catalog_reads_from_the_replica(self):
+        for url in (reverse('equipment:list'), reverse('home')):
+            response, aliases = self.get(url)
+            self.assertContains(response, 'Steel plough')
+            self.assertEqual(aliases, {REPLICA}, url)
+
+    def test_reads_after_a_write_use_the_primary(self):
+        response = self.client.post(reverse('users:logout'))
+        self.assertEqual(response.cookies[db_router.PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+        self.assertEqual(self.get(reverse('equipment:list'))[1], {'default'})
+
+    def test_lagging_replica_is_skipped(self):
+        with override_settings(REPLICA_MAX_LAG=-1):
+            self.assertEqual(self.get(reverse('equipment:list'))[1], {'default'})
+
+    def test_listings_read_soon_after_a_change_are_not_cached(self):
+        # setUp's writes just bumped the catalog version; the replica may not have them yet
+        for _ in range(2):
+            self.assertEqual(self.get(reverse('equipment:list'))[1], {REPLICA})
+
+        stale = time.time_ns() - int(db_router.max_staleness() * 1e9) - 1
+        cache.set(catalog_cache.VERSION_KEY, stale, None)
+        self.assertEqual(self.get(reverse('equipment:list'))[1], {REPLICA})
+        self.assertEqual(self.get(reverse('equipment:list'))[1], set())
+
+    def test_transactions_and_writes_use_the_primary(self):
+        @db_router.replica_reads
+        def view(request):
+            with transaction.atomic():
+                in_transaction = Equipment.objects.db
+            return Equipment.objects.db, in_transaction
+
+        self.assertEqual(view(RequestFactory().get('/')), (REPLICA, 'default'))
+        self.assertEqual(Equipment.objects.db, 'default')
+        self.assertEqual(db_router.ReplicaRouter().db_for_write(Equipment), 'default')
+
+
+class GeoTests(TestCase):
+    PLACES = ['Pune', 'Satara', 'Mumbai', 'Nashik', 'Nagpur']
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', role='owner')
+        for place in cls.PLACES:
+            Equipment.objects.create(
+                owner=owner, name=place, category='tractor', description='Well kept',
+                rent_per_day=500, location=place,
+            )
+        cls.pune = geo.geocode('Pune')
+
+    def test_geohash_encoding(self):
+        self.assertEqual(geo.geohash_encode(57.64911, 10.40744, precision=11), 'u4pruydqqvj')
+        self.assertEqual(geo.geohash_encode(0, 0), 's0000000')
+        self.assertEqual(Equipment.objects.get(name='Pune').geohash, geo.geohash_encode(*self.pune))
+
+    def test_neighbor_cells_cover_the_radius(self):
+        rng = random.Random(3)
+        for latitude, longitude in (self.pune, (0.0, 179.999), (-0.001, -0.001), (89.9, 10.0)):
+            for precision in (3, 5):
+                prefixes = geo._block_prefixes(latitude, longitude, precision)
+                self.assertLessEqual(len(prefixes), 9)
+                self.assertIn(geo.geohash_encode(latitude, longitude, precision), prefixes)
+                # Every point closer than the covered radius is in one of the cells
+                reach = geo._covered_radius_km(latitude, precision) * 0.99
+                for _ in range(200):
+                    bearing, km = rng.uniform(0, 2 * math.pi), rng.uniform(0, reach)
+                    lat = latitude + km * math.cos(bearing) / geo.KM_PER_DEGREE
+                    lon = longitude + km * math.sin(bearing) / (geo.KM_PER_DEGREE * math.cos(math.radians(latitude)))
+                    if -90 <= lat <= 90:
+                        lon = (lon + 180) % 360 - 180
+                        self.assertIn(geo.geohash_encode(lat, lon, precision), prefixes, (lat, lon))
+
+        # Cells across the antimeridian wrap around
+        self.assertIn(geo.geohash_encode(0.0, -179.999, 3), geo._block_prefixes(0.0, 179.999, 3))
+
+    def test_radius_filtering(self):
+        equipment = Equipment.objects.all()
+        for radius in (10, 100, 130, 200, 1000):
+            expected = sorted(
+                (distance, item.name) for item in equipment
+                if (distance := geo.haversine_km(*self.pune, item.latitude, item.longitude)) <= radius
+            )
+            results = geo.within_radius(equipment, *self.pune, radius)
+            self.assertEqual([item.name for item in results], [name for _, name in expected], radius)
+            self.assertEqual([item.distance_km for item in results], [distance for distance, _ in expected])
+
+        self.assertEqual([item.name for item in geo.nearest(equipment, *self.pune, 3)], ['Pune', 'Satara', 'Mumbai'])
+        self.assertEqual([item.name for item in geo.within_radius(equipment, *self.pune, 1000, limit=2)], ['Pune', 'Satara'])
+
+    def test_radius_across_the_antimeridian(self):
+        owner = User.objects.get(username='owner')
+        # Unknown places keep the coordinates they are given
+        for name, longitude in (('East', 179.95), ('West', -179.9), ('Far west', -179.0)):
+            Equipment.objects.create(
+                owner=owner, name=name, category='tractor', description='Well kept',
+                rent_per_day=500, location='Taveuni', latitude=-16.8, longitude=longitude,
+            )
+        for longitude in (179.99, -179.99):
+            results = geo.within_radius(Equipment.objects.all(), -16.8, longitude, 50)
+            self.assertEqual({item.name for item in results}, {'East', 'West'}, longitude)
+
+    def test_invalid_points(self):
+        for point in ((math.inf, 0), (math.nan, 0), (91, 0), (0, -181)):
+            self.assertFalse(geo.is_valid_point(*point))
+            with self.assertRaises(ValueError):
+                geo.within_radius(Equipment.objects.all(), *point, 50)
+            with self.assertRaises(ValueError):
+                geo.nearest(Equipment.objects.all(), *point, 3)
+        with self.assertRaises(ValueError):
+            geo.within_radius(Equipment.objects.all(), *self.pune, math.inf)
+
+
+class PaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', role='owner')
+        cls.items = [
+            Equipment.objects.create(
+                owner=owner, name=f'Tractor {i}', category='tractor', description='Well kept',
+                rent_per_day=100 * (i % 3 + 1), location='Pune',
+            )
+            for i in range(7)
+        ]
+
+    def page(self, cursor=None, ordering=('-created_at', '-id'), queryset=None):
+        request = RequestFactory().get('/', {pagination.CURSOR_PARAM: cursor} if cursor else {})
+        return pagination.paginate(request, Equipment.objects.all() if queryset is None else queryset, ordering, per_page=3)
+
+    def ids(self, page):
+        return [item.id for item in page]
+
+    def walk(self, ordering):
+        """Every page forwards, then back again from the last one."""
+        forward = [self.page(ordering=ordering)]
+        while forward[-1].has_next:
+            forward.append(self.page(forward[-1].next_cursor, ordering))
+        backward = [forward[-1]]
+        while backward[-1].has_previous:
+            backward.append(self.page(backward[-1].previous_cursor, ordering))
+        return [self.ids(page) for page in forward], [self.ids(page) for page in reversed(backward)]
+
+    def test_forward_and_back(self):
+        expected = [item.id for item in reversed(self.items)]
+        forward, backward = self.walk(('-created_at', '-id'))
+        self.assertEqual(forward, [expected[:3], expected[3:6], expected[6:]])
+        self.assertEqual(backward, forward)
+
+        first = self.page()
+        self.assertFalse(first.has_previous)
+        self.assertTrue(self.page(first.next_cursor).has_previous)
+
+    def test_ties_on_the_sort_key(self):
+        # Three rents shared by seven rows: the id decides within each
+        forward, backward = self.walk(('rent_per_day', 'id'))
+        expected = list(Equipment.objects.order_by('rent_per_day', 'id').values_list('id', flat=True))
+        self.assertEqual(sum(forward, []), expected)
+        self.assertEqual(backward, forward)
+
+        Equipment.objects.update(created_at=timezone.now())
+        forward, backward = self.walk(('-created_at', '-id'))
+        self.assertEqual(sum(forward, []), sorted(expected, reverse=True))
+        self.assertEqual(backward, forward)
+
+    def test_bad_cursors_give_the_first_page(self):
+        first = self.ids(self.page())
+        cursor = self.page().next_cursor
+        for bad in (
+            cursor[:-2] + ('A' if cursor[-2] != 'A' else 'B') + cursor[-1],
+            'not-a-cursor',
+            pagination.encode_cursor('sideways', [1, 2]),
+            pagination.encode_cursor('next', [1]),
+            pagination.encode_cursor('next', 'created_at'),
+            # Signed, but with values for another ordering
+            pagination.encode_cursor('next', ['500.00', 'x']),
+            self.page(ordering=('rent_per_day', 'id')).next_cursor,
+        ):
+            self.assertEqual(self.ids(self.page(bad)), first, bad)
+
+    def test_last_and_empty_pages(self):
+        # Six rows make two full pages and no empty third one
+        six = Equipment.objects.exclude(id=self.items[0].id)
+        second = self.page(self.page(queryset=six).next_cursor, queryset=six)
+        self.assertEqual(len(second), 3)
+        self.assertFalse(second.has_next)
+
+        empty = self.page(queryset=Equipment.objects.none())
+        self.assertEqual(list(empty), [])
+        self.assertFalse(empty.has_other_pages)
+
+        # The rows after a cursor were deleted meanwhile
+        cursor = self.page().next_cursor
+        Equipment.objects.filter(id__in=[item.id for item in self.items[:4]]).delete()
+        page = self.page(cursor)
+        self.assertEqual(list(page), [])
+        self.assertFalse(page.has_next)
+
+
+class FullScanTests(TestCase):
+    def test_plans(self):
+        select = 'SELECT * FROM equipment_equipment'
+        for sql, plan, scans in (
+            (select, ['SCAN equipment_equipment'], 1),
+            (select, ['SCAN equipment_equipment USING INDEX equipment_available_idx'], 1),
+            (select, ['SCAN equipment_equipment USING COVERING INDEX equipment_updated_idx'], 0),
+            (select, ['SEARCH equipment_equipment USING INDEX equipment_category_idx (category=?)'], 0),
+            (select, ['SCAN equipment_search VIRTUAL TABLE INDEX 0:M4'], 0),
+            (select, ['SCAN CONSTANT ROW'], 0),
+            # A first page stops after LIMIT rows of the index, unless they must be sorted first
+            (f'{select} LIMIT 13', ['SCAN equipment_equipment USING INDEX equipment_available_idx'], 0),
+            (f'{select} LIMIT 13', ['SCAN equipment_equipment USING INDEX equipment_available_idx', 'USE TEMP B-TREE FOR ORDER BY'], 1),
+            (f'{select} LIMIT 13', ['SEARCH users_user USING INDEX user_date_joined_idx (role=?)', 'SCAN equipment_equipment USING INDEX equipment_available_idx'], 1),
+        ):
+            self.assertEqual(len(full_scans(sql, plan)), scans, plan)
+        self.assertEqual(full_scans(select, ['SCAN equipment_equipment USING INDEX equipment_category_idx'], {'equipment_category_idx'}), [])
+
+
+class StaticFilesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(
+            STATIC_ROOT=cls.static_root,
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+            },
+        ))
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.static_root)
+
+    def test_pages_link_hashed_assets(self):
+        html = self.client.get(reverse('home')).content.decode()
+        urls = re.findall(r'/static/(?:css/style|js/scripts)\.[0-9a-f]{12}\.(?:css|js)', html)
+        self.assertEqual(len(urls), 2, html)
+
+        encodings = ['gzip'] + (['br'] if find_spec('brotli') else [])
+        for url in urls:
+            for encoding in encodings:
+                response = self.client.get(url, headers={'Accept-Encoding': encoding})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Encoding'], encoding)
+                self.assertIn('immutable', response['Cache-Control'])
+                self.assertIn('max-age=315360000', response['Cache-Control'])
@@ -29,8 +29,8 @@ urlpatterns = [
     path('users/', include('users.urls')),
     path('equipment/', include('equipment.urls')),
     path('bookings/', include('bookings.urls')),
+    path('api/', include('api.urls')),
 ]
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -1,16 +1,23 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
 from equipment.models import Equipment
+from equipment import catalog_cache
+from .db_router import replica_reads
 
-def home(request):
+@replica_reads
+async def home(request):
     # Get featured equipment (recently added, available)
-    featured_equipment = Equipment.objects.filter(
-        availability=True
-    ).select_related('owner').order_by('-created_at')[:6]
+    async def featured():
+        featured = Equipment.objects.filter(availability=True).select_related('owner').order_by('-created_at')
+        return [equipment async for equipment in featured[:6]]
+    featured_equipment = await catalog_cache.acached_listing('featured', {}, featured)
     
     context = {
-        'featured_equipment': featured_equipment
+        'featured_equipment': featured_equipment,
+        'catalog_cache_ttl': catalog_cache.ttl()
     }
-    return render(request, 'pages/home.html', context)
+    # Templates read the session and user lazily, which is sync-only
+    return await sync_to_async(render)(request, 'pages/home.html', context)
 
 def about(request):
     context = {
@@ -0,0 +1,62 @@
+"""
+Warm-up for freshly started workers.
+
+Django keeps compiled templates in the cached template loader, one cache
+per process, and imports the URLconf and builds its reverse() lookups on
+first use. Left alone, the first request for each page in a new worker pays
+for all of that: reading and parsing the page, base.html and its includes,
+and importing every app's views. warm_up() does it before the worker takes
+traffic; gunicorn.conf.py runs it as each worker starts, and ``manage.py
+warmup`` runs it as a deploy check that every template compiles.
+"""
+import logging
+import time
+from pathlib import Path
+
+from django.template import TemplateSyntaxError, engines
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def template_names(engine):
+    for directory in map(Path, engine.dirs):
+        for path in sorted(directory.rglob('*.html')):
+            yield path.relative_to(directory).as_posix()
+
+
+def warm_templates():
+    """
+    Compile every template under the project template directories into the
+    cached loader. Returns the number compiled and a ``{name: error}`` dict
+    of those that failed.
+    """
+    compiled, errors = 0, {}
+    for engine in engines.all():
+        for name in template_names(engine):
+            try:
+                engine.get_template(name)
+            except TemplateSyntaxError as exc:
+                errors[name] = exc
+            else:
+                compiled += 1
+    return compiled, errors
+
+
+def warm_urls():
+    """Import the URLconf and build the reverse() lookups of every namespace."""
+    resolvers = [get_resolver()]
+    while resolvers:
+        resolver = resolvers.pop()
+        resolver.reverse_dict
+        resolvers += [namespace_resolver for _, namespace_resolver in resolver.namespace_dict.values()]
+
+
+def warm_up():
+    start = time.perf_counter()
+    warm_urls()
+    compiled, errors = warm_templates()
+    logger.info('Warmed up %s templates and the URLconf in %.1f ms', compiled, (time.perf_counter() - start) * 1000)
+    for name, exc in errors.items():
+        logger.error('Template %s does not compile: %s', name, exc)
+    return compiled, errors
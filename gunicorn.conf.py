@@ -0,0 +1,50 @@
+"""
+Gunicorn profile for serving GreenGear over ASGI.
+
+Gunicorn picks this file up from the working directory, so starting the
+site is just::
+
+    gunicorn
+
+Each worker is a uvicorn event loop running greengear_project.asgi. The
+public catalog views (home, equipment list and detail) are async, so a
+worker keeps serving while slow mobile clients download their pages
+instead of holding a thread per connection; the remaining sync views run
+in Django's per-request thread as usual. Everything can be tuned with the
+environment variables below, e.g. ``WEB_CONCURRENCY=4 gunicorn``.
+
+The WSGI entry point still works for a plain threaded deployment
+(command-line options override this file):
+``gunicorn greengear_project.wsgi -k gthread --threads 8``.
+"""
+import multiprocessing
+import os
+
+wsgi_app = 'greengear_project.asgi:application'
+worker_class = 'uvicorn_worker.UvicornWorker'
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+# One event loop per core is enough; it is not blocked by slow clients
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+
+# Under ASGI each request's queries run on a thread of their own, so
+# persistent connections would be left open on threads that are gone
+raw_env = [f"DB_CONN_MAX_AGE={os.environ.get('DB_CONN_MAX_AGE', '0')}"]
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then to cap slow memory growth
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = '-'
+
+
+def post_worker_init(worker):
+    # The app (and Django) is loaded by now; compile the templates and load
+    # the URLconf before the worker takes its first request
+    from greengear_project.warmup import warm_up
+
+    warm_up()
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User
+from .models import AdminStatsSnapshot, User, UserCounters
 
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
@@ -8,7 +8,7 @@ class CustomUserAdmin(UserAdmin):
     list_filter = ('role', 'is_staff', 'is_superuser', 'is_active')
     fieldsets = UserAdmin.fieldsets + (
         ('GreenGear Information', {
-            'fields': ('role', 'phone', 'location', 'workshop_name', 'address')
+            'fields': ('role', 'phone', 'location', 'latitude', 'longitude', 'workshop_name', 'address')
         }),
     )
     add_fieldsets = UserAdmin.add_fieldsets + (
@@ -17,4 +17,16 @@ class CustomUserAdmin(UserAdmin):
         }),
     )
     search_fields = ('username', 'email', 'first_name', 'last_name', 'phone')
-    ordering = ('-date_joined',)
\ No newline at end of file
+    ordering = ('-date_joined',)
+
+@admin.register(UserCounters)
+class UserCountersAdmin(admin.ModelAdmin):
+    list_display = ('user', 'bookings_total', 'requests_pending', 'requests_completed', 'total_earnings', 'equipment_count')
+    search_fields = ('user__username', 'user__email')
+    readonly_fields = [field.name for field in UserCounters._meta.fields]
+
+
+@admin.register(AdminStatsSnapshot)
+class AdminStatsSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('id', 'computed_at')
+    readonly_fields = ('stats', 'computed_at')
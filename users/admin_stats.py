@@ -0,0 +1,68 @@
+"""
+Admin dashboard statistics.
+
+Each table is aggregated once with conditional aggregates, and the result
+is kept as a single AdminStatsSnapshot row that is reused until it is
+older than settings.ADMIN_STATS_TTL seconds or explicitly refreshed.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import AdminStatsSnapshot, User
+
+SNAPSHOT_ID = 1
+DEFAULT_TTL = 300
+
+
+def compute_stats():
+    from bookings.models import Booking
+    from equipment.models import Equipment
+
+    stats = User.objects.aggregate(
+        total_users=Count('id'),
+        farmer_count=Count('id', filter=Q(role='farmer')),
+        owner_count=Count('id', filter=Q(role='owner')),
+    )
+    stats.update(Equipment.objects.aggregate(
+        total_equipment=Count('id'),
+        available_equipment=Count('id', filter=Q(availability=True)),
+    ))
+    stats.update(Booking.objects.aggregate(
+        total_bookings=Count('id'),
+        active_bookings=Count('id', filter=Q(status__in=['pending', 'approved'])),
+        completed_bookings=Count('id', filter=Q(status='completed')),
+        total_revenue=Sum('total_amount', filter=Q(status='completed')),
+    ))
+    # JSON has no decimals; keep the exact value as a string, with two
+    # decimal places on every database (SQLite drops a SUM's trailing zeros)
+    stats['total_revenue'] = str(Decimal(stats['total_revenue'] or 0).quantize(Decimal('0.01')))
+    return stats
+
+
+def refresh():
+    snapshot, _ = AdminStatsSnapshot.objects.update_or_create(
+        id=SNAPSHOT_ID,
+        defaults={'stats': compute_stats(), 'computed_at': timezone.now()},
+    )
+    return snapshot
+
+
+def get_snapshot(force_refresh=False):
+    """The current snapshot, recomputed when missing, stale or ``force_refresh``."""
+    ttl = getattr(settings, 'ADMIN_STATS_TTL', DEFAULT_TTL)
+    if not force_refresh:
+        snapshot = AdminStatsSnapshot.objects.filter(id=SNAPSHOT_ID).first()
+        if snapshot and timezone.now() - snapshot.computed_at < timedelta(seconds=ttl):
+            return snapshot
+    return refresh()
+
+
+def stats_context(snapshot):
+    stats = dict(snapshot.stats)
+    stats['total_revenue'] = Decimal(stats.get('total_revenue', '0'))
+    stats['stats_computed_at'] = snapshot.computed_at
+    return stats
@@ -0,0 +1,149 @@
+"""
+Per-user booking and earnings counters.
+
+Dashboards and the profile page read one UserCounters row instead of
+aggregating the booking history. Rows are adjusted with F() updates from
+the Booking/Equipment signals, inside the same transaction as the write.
+Users without a row yet are skipped; counters_for() builds the row from
+the source tables on first read, and rebuild() recomputes any set of users.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import User, UserCounters
+
+COUNTED_STATUSES = ('pending', 'approved', 'completed')
+
+COUNTER_FIELDS = [
+    'bookings_total', 'bookings_pending', 'bookings_approved', 'bookings_completed',
+    'requests_total', 'requests_pending', 'requests_approved', 'requests_completed',
+    'total_earnings', 'equipment_count',
+]
+
+
+def _booking_deltas(deltas, state, sign):
+    farmer_id, owner_id, status, amount = state
+    deltas[farmer_id]['bookings_total'] += sign
+    deltas[owner_id]['requests_total'] += sign
+    if status in COUNTED_STATUSES:
+        deltas[farmer_id][f'bookings_{status}'] += sign
+        deltas[owner_id][f'requests_{status}'] += sign
+    if status == 'completed':
+        deltas[owner_id]['total_earnings'] += sign * Decimal(amount or 0)
+
+
+def _apply(deltas):
+    for user_id, fields in deltas.items():
+        changes = {name: F(name) + delta for name, delta in fields.items() if delta}
+        if changes:
+            UserCounters.objects.filter(user_id=user_id).update(**changes)
+
+
+def booking_changed(old_state, new_state):
+    """
+    Adjust counters for a booking going from ``old_state`` to ``new_state``.
+
+    States are ``(farmer_id, owner_id, status, total_amount)`` tuples, or
+    None for a booking that didn't exist before / doesn't exist anymore.
+    """
+    bookings_changed([(old_state, new_state)])
+
+
+def bookings_changed(changes):
+    """booking_changed() for many ``(old_state, new_state)`` pairs, one UPDATE per user."""
+    deltas = defaultdict(lambda: defaultdict(int))
+    for old_state, new_state in changes:
+        if old_state == new_state:
+            continue
+        if old_state is not None:
+            _booking_deltas(deltas, old_state, -1)
+        if new_state is not None:
+            _booking_deltas(deltas, new_state, 1)
+    if not deltas:
+        return
+    with transaction.atomic(savepoint=False):
+        _apply(deltas)
+
+
+def equipment_changed(old_owner_id, new_owner_id):
+    if old_owner_id == new_owner_id:
+        return
+    deltas = defaultdict(lambda: defaultdict(int))
+    if old_owner_id is not None:
+        deltas[old_owner_id]['equipment_count'] -= 1
+    if new_owner_id is not None:
+        deltas[new_owner_id]['equipment_count'] += 1
+    with transaction.atomic(savepoint=False):
+        _apply(deltas)
+
+
+def rebuild(user_ids=None):
+    """Recompute the counters of ``user_ids`` (every user when None) from the source tables."""
+    return len(_rebuild_rows(user_ids))
+
+
+def _rebuild_rows(user_ids):
+    from bookings.models import Booking
+    from equipment.models import Equipment
+
+    users = User.objects.all()
+    farmer_bookings = owner_bookings = Booking.objects.all()
+    equipment = Equipment.objects.all()
+    if user_ids is not None:
+        users = users.filter(id__in=user_ids)
+        # Separately, so each side seeks its own index (an OR across the
+        # join would read every booking)
+        farmer_bookings = farmer_bookings.filter(farmer_id__in=user_ids)
+        owner_bookings = owner_bookings.filter(equipment__owner_id__in=user_ids)
+        equipment = equipment.filter(owner_id__in=user_ids)
+
+    rows = {user_id: UserCounters(user_id=user_id) for user_id in users.values_list('id', flat=True)}
+
+    def status_counts(prefix):
+        counts = {f'{prefix}_total': Count('id')}
+        for status in COUNTED_STATUSES:
+            counts[f'{prefix}_{status}'] = Count('id', filter=Q(status=status))
+        return counts
+
+    for row in farmer_bookings.values('farmer_id').annotate(**status_counts('bookings')):
+        counters = rows.get(row.pop('farmer_id'))
+        if counters is not None:
+            for name, value in row.items():
+                setattr(counters, name, value)
+
+    owner_rows = owner_bookings.values('equipment__owner_id').annotate(
+        total_earnings=Sum('total_amount', filter=Q(status='completed')),
+        **status_counts('requests'),
+    )
+    for row in owner_rows:
+        counters = rows.get(row.pop('equipment__owner_id'))
+        if counters is not None:
+            row['total_earnings'] = row['total_earnings'] or 0
+            for name, value in row.items():
+                setattr(counters, name, value)
+
+    for row in equipment.values('owner_id').annotate(equipment_count=Count('id')):
+        counters = rows.get(row['owner_id'])
+        if counters is not None:
+            counters.equipment_count = row['equipment_count']
+
+    with transaction.atomic():
+        UserCounters.objects.bulk_create(
+            rows.values(),
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=COUNTER_FIELDS,
+        )
+    return rows
+
+
+def counters_for(user):
+    """The user's counters row, building it on first use."""
+    try:
+        return UserCounters.objects.get(user_id=user.id)
+    except UserCounters.DoesNotExist:
+        return _rebuild_rows([user.id])[user.id]
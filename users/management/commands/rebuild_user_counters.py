@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from users import counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-user booking and earnings counters from the booking and equipment tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int, help='Only rebuild these users (default: everyone)')
+
+    def handle(self, *args, **options):
+        rebuilt = counters.rebuild(options['user_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters for {rebuilt} users.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from users import admin_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the admin dashboard statistics snapshot'
+
+    def handle(self, *args, **options):
+        snapshot = admin_stats.refresh()
+        self.stdout.write(self.style.SUCCESS(f'Admin statistics refreshed at {snapshot.computed_at:%Y-%m-%d %H:%M:%S}.'))
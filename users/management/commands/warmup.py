@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from greengear_project.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = 'Compile every project template and load the URLconf, failing if a template has a syntax error'
+
+    def handle(self, *args, **options):
+        compiled, errors = warm_up()
+        if errors:
+            raise CommandError('\n'.join(f'{name}: {exc}' for name, exc in errors.items()))
+        self.stdout.write(self.style.SUCCESS(f'Compiled {compiled} templates.'))
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:57
+
+from django.db import migrations, models
+
+from greengear_project import geo
+
+
+def geocode_existing(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    for obj in User.objects.exclude(location='').only('id', 'location').iterator():
+        point = geo.geocode(obj.location)
+        if point:
+            User.objects.filter(id=obj.id).update(
+                latitude=point[0],
+                longitude=point[1],
+                geohash=geo.geohash_encode(*point),
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(geocode_existing, migrations.RunPython.noop),
+    ]
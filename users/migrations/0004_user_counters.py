@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounters',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('bookings_total', models.IntegerField(default=0)),
+                ('bookings_pending', models.IntegerField(default=0)),
+                ('bookings_approved', models.IntegerField(default=0)),
+                ('bookings_completed', models.IntegerField(default=0)),
+                ('requests_total', models.IntegerField(default=0)),
+                ('requests_pending', models.IntegerField(default=0)),
+                ('requests_approved', models.IntegerField(default=0)),
+                ('requests_completed', models.IntegerField(default=0)),
+                ('total_earnings', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('equipment_count', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -1,7 +1,10 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import AbstractUser
 
-class User(AbstractUser):
+from greengear_project.geo import GeoLocatedModel
+
+class User(GeoLocatedModel, AbstractUser):
     ROLE_CHOICES = (
         ('farmer', 'Farmer'),
         ('owner', 'Equipment Owner'),
@@ -33,4 +36,47 @@ class User(AbstractUser):
     )
 
     def __str__(self):
-        return f"{self.username} ({self.role})"
\ No newline at end of file
+        return f"{self.username} ({self.role})"
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['-date_joined', '-id'], name='user_date_joined_idx'),
+            # login_view looks users up by email, the equipment import by
+            # email in any case
+            models.Index(fields=['email'], name='user_email_idx'),
+            models.Index(Lower('email'), name='user_email_lower_idx'),
+        ]
+
+class UserCounters(models.Model):
+    """Denormalized booking and earnings counters, kept current by users.counters."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='counters')
+
+    # As a farmer: bookings the user has made
+    bookings_total = models.IntegerField(default=0)
+    bookings_pending = models.IntegerField(default=0)
+    bookings_approved = models.IntegerField(default=0)
+    bookings_completed = models.IntegerField(default=0)
+
+    # As an equipment owner: bookings of the user's equipment
+    requests_total = models.IntegerField(default=0)
+    requests_pending = models.IntegerField(default=0)
+    requests_approved = models.IntegerField(default=0)
+    requests_completed = models.IntegerField(default=0)
+    total_earnings = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    equipment_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Counters for {self.user}"
+
+    @property
+    def bookings_active(self):
+        return self.bookings_pending + self.bookings_approved
+
+
+class AdminStatsSnapshot(models.Model):
+    """The admin dashboard statistics as of ``computed_at``; see users.admin_stats."""
+    stats = models.JSONField(default=dict)
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Admin statistics at {self.computed_at:%Y-%m-%d %H:%M}"
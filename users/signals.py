@@ -0,0 +1,64 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from bookings.models import Booking
+from equipment.models import Equipment
+from . import counters
+
+
+def _owner_id(equipment_id, booking=None):
+    if booking is not None and booking.equipment_id == equipment_id:
+        return booking.equipment.owner_id
+    return Equipment.objects.filter(id=equipment_id).values_list('owner_id', flat=True).first()
+
+
+def _booking_state(booking):
+    return (booking.farmer_id, _owner_id(booking.equipment_id, booking), booking.status, booking.total_amount)
+
+
+@receiver(post_save, sender=Booking)
+def count_saved_booking(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new_state = _booking_state(instance)
+    if created:
+        counters.booking_changed(None, new_state)
+        return
+
+    loaded = getattr(instance, '_loaded_state', None)
+    if loaded is None or None in loaded[:3]:
+        # Saved without having been loaded first; recount both parties
+        counters.rebuild([new_state[0], new_state[1]])
+        return
+    farmer_id, equipment_id, status, amount = loaded
+    old_state = (farmer_id, _owner_id(equipment_id, instance), status, amount)
+    counters.booking_changed(old_state, new_state)
+
+
+@receiver(post_delete, sender=Booking)
+def count_deleted_booking(sender, instance, **kwargs):
+    owner_id = _owner_id(instance.equipment_id)
+    if owner_id is None:
+        # The equipment is already gone; recount the farmer
+        counters.rebuild([instance.farmer_id])
+        return
+    counters.booking_changed(
+        (instance.farmer_id, owner_id, instance.status, instance.total_amount), None
+    )
+
+
+@receiver(post_save, sender=Equipment)
+def count_saved_equipment(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.equipment_changed(None, instance.owner_id)
+    elif getattr(instance, '_loaded_owner_id', instance.owner_id) != instance.owner_id:
+        # Moving equipment moves its booking requests and earnings too
+        counters.rebuild([instance._loaded_owner_id, instance.owner_id])
+
+
+@receiver(post_delete, sender=Equipment)
+def count_deleted_equipment(sender, instance, **kwargs):
+    # Its bookings have already been uncounted by count_deleted_booking
+    counters.equipment_changed(instance.owner_id, None)
@@ -1,3 +1,372 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import Mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management import CommandError, call_command
+from django.db.models.functions import Lower
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from bookings.models import Booking
+from bookings.transitions import create_booking, transition
+from equipment.models import Equipment
+from greengear_project import sessions
+from greengear_project.querycount import budget_for
+from greengear_project.testing import QueryBudgetTestCase
+from . import admin_stats, counters, urls
+from .counters import counters_for
+from .models import AdminStatsSnapshot, User, UserCounters
+
+
+class UserQueryBudgetTests(QueryBudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', role='owner', location='Pune')
+        other_owner = User.objects.create_user('owner2', role='owner', location='Nashik')
+        cls.farmers = [User.objects.create_user(f'farmer{i}', role='farmer', location='Pune') for i in range(3)]
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', None, role='admin')
+        equipment = [
+            Equipment.objects.create(
+                owner=(cls.owner, other_owner)[i % 2], name=f'Sprayer {i}', category='sprayer',
+                description='Boom sprayer', rent_per_day=300, location='Pune',
+            )
+            for i in range(6)
+        ]
+        start = date.today() + timedelta(days=3)
+        for i, farmer in enumerate(cls.farmers):
+            for item in equipment[:4]:
+                booking = create_booking(farmer, item.id, start + timedelta(days=3 * i), 2, 'days')
+        transition(booking.id, 'approved')
+        transition(booking.id, 'completed')
+
+    def assertCheap(self, response):
+        self.assertWithinQueryBudget(response)
+        self.assertNoRepeatedQueries(response)
+
+    def test_every_view_has_a_budget(self):
+        for pattern in urls.urlpatterns:
+            self.assertIsNotNone(budget_for(f'{urls.app_name}:{pattern.name}'), pattern.name)
+
+    def test_anonymous_views(self):
+        for name in ('users:login', 'users:register_farmer', 'users:register_owner'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            self.assertCheap(response)
+
+    def test_login_and_registration_posts(self):
+        for name, data in (
+            ('users:register_farmer', {
+                'name': 'Asha', 'phone': '9876543210', 'email': 'asha@example.com',
+                'password': 'secret-pass', 'location': 'Pune',
+            }),
+            ('users:register_owner', {
+                'name': 'Ravi', 'phone': '9876543211', 'email': 'ravi@example.com',
+                'password': 'secret-pass', 'workshop_name': 'Ravi Works', 'address': 'Pune',
+            }),
+            # Taken email
+            ('users:register_farmer', {'name': 'Asha', 'email': 'asha@example.com', 'password': 'x'}),
+        ):
+            response = self.client.post(reverse(name), data)
+            self.assertWithinQueryBudget(response)
+
+        for password, login_type, status in (('wrong', 'farmer', 200), ('secret-pass', 'owner', 200), ('secret-pass', 'farmer', 302)):
+            response = self.client.post(reverse('users:login'), {
+                'email': 'asha@example.com', 'password': password, 'login_type': login_type,
+            })
+            self.assertEqual(response.status_code, status)
+            self.assertWithinQueryBudget(response)
+
+    def test_dashboards_before_counters_exist(self):
+        # The first visit builds the user's counters row
+        UserCounters.objects.all().delete()
+        for user, name in ((self.farmers[0], 'users:farmer_dashboard'), (self.owner, 'users:owner_dashboard')):
+            self.client.force_login(user)
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            self.assertWithinQueryBudget(response)
+
+    def test_farmer_views(self):
+        self.client.force_login(self.farmers[2])
+        for name in ('users:profile', 'users:farmer_dashboard', 'users:change_password'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            self.assertCheap(response)
+
+        response = self.client.get(reverse('users:logout'))
+        self.assertEqual(response.status_code, 302)
+        self.assertWithinQueryBudget(response)
+
+    def test_query_plans(self):
+        with self.assertNoFullScans():
+            response = self.client.post(reverse('users:login'), {
+                'email': 'admin@example.com', 'password': 'wrong', 'login_type': 'admin',
+            })
+            self.assertEqual(response.status_code, 200)
+
+            for user, names in (
+                (self.farmers[0], ('users:profile', 'users:farmer_dashboard')),
+                (self.owner, ('users:profile', 'users:owner_dashboard')),
+            ):
+                self.client.force_login(user)
+                for name in names:
+                    self.assertEqual(self.client.get(reverse(name)).status_code, 200)
+
+        self.assertUsesIndex(User.objects.filter(email='admin@example.com'), 'user_email_idx')
+        # How import_equipment finds owners
+        owners = User.objects.alias(email_lower=Lower('email')).filter(email_lower__in=['owner@example.com'], role='owner')
+        self.assertUsesIndex(owners, 'user_email_lower_idx')
+
+    def test_owner_views(self):
+        self.client.force_login(self.owner)
+        for name in ('users:profile', 'users:owner_dashboard'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            self.assertCheap(response)
+
+    def test_admin_views(self):
+        self.client.force_login(self.admin)
+        for name in ('users:admin_dashboard', 'users:manage_users'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            self.assertCheap(response)
+
+        farmer = self.farmers[0]
+        response = self.client.post(reverse('users:edit_user', args=[farmer.id]), {
+            'username': farmer.username,
+            'first_name': 'Asha', 'last_name': 'Patil', 'email': 'asha@example.com',
+            'phone': '9876543210', 'location': 'Pune', 'role': 'farmer',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertWithinQueryBudget(response)
+
+        response = self.client.post(reverse('users:delete_user', args=[farmer.id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertWithinQueryBudget(response)
+
+
+class UserCountersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owners = [User.objects.create_user(f'owner{i}', role='owner') for i in range(2)]
+        cls.farmers = [User.objects.create_user(f'farmer{i}', role='farmer') for i in range(2)]
+        cls.users = cls.owners + cls.farmers
+        # Counters are only kept up to date once the row exists
+        for user in cls.users:
+            counters_for(user)
+        cls.equipment = [
+            Equipment.objects.create(
+                owner=cls.owners[i % 2], name=f'Sprayer {i}', category='sprayer',
+                description='Boom sprayer', rent_per_day=300 + 100 * i, location='Pune',
+            )
+            for i in range(3)
+        ]
+        cls.start = date.today() + timedelta(days=3)
+
+    def book(self, farmer, item, day=0, duration=2):
+        return create_booking(farmer, item.id, self.start + timedelta(days=day), duration, 'days')
+
+    def expected(self, user):
+        """The user's counters, aggregated afresh in Python."""
+        bookings = list(Booking.objects.select_related('equipment'))
+        mine = [b for b in bookings if b.farmer_id == user.id]
+        requests = [b for b in bookings if b.equipment.owner_id == user.id]
+        values = {
+            'bookings_total': len(mine), 'requests_total': len(requests),
+            'total_earnings': sum((b.total_amount for b in requests if b.status == 'completed'), Decimal('0')),
+            'equipment_count': Equipment.objects.filter(owner=user).count(),
+        }
+        for status in counters.COUNTED_STATUSES:
+            values[f'bookings_{status}'] = sum(b.status == status for b in mine)
+            values[f'requests_{status}'] = sum(b.status == status for b in requests)
+        return values
+
+    def assertCountersMatch(self):
+        for user in self.users:
+            row = UserCounters.objects.get(user=user)
+            self.assertEqual({name: getattr(row, name) for name in counters.COUNTER_FIELDS}, self.expected(user), user)
+
+    def test_create_transition_and_delete(self):
+        first = self.book(self.farmers[0], self.equipment[0])
+        second = self.book(self.farmers[1], self.equipment[1])
+        third = self.book(self.farmers[1], self.equipment[2], day=5)
+        self.assertCountersMatch()
+
+        transition(first.id, 'approved')
+        transition(first.id, 'completed')
+        transition(second.id, 'rejected')
+        transition(third.id, 'approved')
+        self.assertCountersMatch()
+        self.assertEqual(UserCounters.objects.get(user=self.owners[0]).total_earnings, first.total_amount)
+
+        Booking.objects.get(id=second.id).delete()
+        self.assertCountersMatch()
+
+        # Deleting equipment takes its bookings and their earnings with it
+        self.equipment[0].delete()
+        self.assertCountersMatch()
+        self.assertEqual(UserCounters.objects.get(user=self.owners[0]).total_earnings, 0)
+
+    def test_moving_equipment(self):
+        booking = self.book(self.farmers[0], self.equipment[0])
+        transition(booking.id, 'approved')
+        transition(booking.id, 'completed')
+        item = Equipment.objects.get(id=self.equipment[0].id)
+        item.owner = self.owners[1]
+        item.save()
+        self.assertCountersMatch()
+
+    def test_rebuild(self):
+        booking = self.book(self.farmers[0], self.equipment[1])
+        transition(booking.id, 'approved')
+        self.book(self.farmers[1], self.equipment[0])
+        UserCounters.objects.update(bookings_total=99, requests_pending=-1, total_earnings=7, equipment_count=0)
+
+        self.assertEqual(counters.rebuild([self.farmers[0].id]), 1)
+        self.assertEqual(UserCounters.objects.get(user=self.farmers[1]).bookings_total, 99)
+        self.assertEqual(counters.rebuild(), len(self.users))
+        self.assertCountersMatch()
+
+        # Users without a row get one
+        UserCounters.objects.filter(user=self.owners[1]).delete()
+        counters.rebuild()
+        self.assertCountersMatch()
+
+
+@override_settings(ADMIN_STATS_TTL=300)
+class AdminStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', None, role='admin')
+        owner = User.objects.create_user('owner', role='owner')
+        cls.farmer = User.objects.create_user('farmer', role='farmer')
+        cls.equipment = [
+            Equipment.objects.create(
+                owner=owner, name=f'Sprayer {i}', category='sprayer', description='Boom sprayer',
+                rent_per_day=300 + 100 * i, location='Pune',
+            )
+            for i in range(3)
+        ]
+        start = date.today() + timedelta(days=3)
+        for i, item in enumerate(cls.equipment):
+            booking = create_booking(cls.farmer, item.id, start, 2, 'days')
+            for status in (('approved', 'completed'), ('rejected',), ())[i]:
+                transition(booking.id, status)
+
+    def live(self):
+        """The statistics aggregated afresh in Python."""
+        users, equipment, bookings = list(User.objects.all()), list(Equipment.objects.all()), list(Booking.objects.all())
+        return {
+            'total_users': len(users),
+            'farmer_count': sum(user.role == 'farmer' for user in users),
+            'owner_count': sum(user.role == 'owner' for user in users),
+            'total_equipment': len(equipment),
+            'available_equipment': sum(item.availability for item in equipment),
+            'total_bookings': len(bookings),
+            'active_bookings': sum(booking.status in ('pending', 'approved') for booking in bookings),
+            'completed_bookings': sum(booking.status == 'completed' for booking in bookings),
+            'total_revenue': str(sum((b.total_amount for b in bookings if b.status == 'completed'), Decimal('0'))),
+        }
+
+    def age(self, seconds):
+        AdminStatsSnapshot.objects.update(computed_at=timezone.now() - timedelta(seconds=seconds))
+
+    def book_more(self, day=20):
+        create_booking(self.farmer, self.equipment[0].id, date.today() + timedelta(days=day), 1, 'days')
+
+    def test_matches_live_aggregates(self):
+        self.assertEqual(admin_stats.compute_stats(), self.live())
+        context = admin_stats.stats_context(admin_stats.get_snapshot())
+        self.assertEqual(context['total_revenue'], Decimal('600.00'))
+        self.assertEqual(context['active_bookings'], 1)
+
+    def test_snapshot_is_reused_until_it_expires(self):
+        snapshot = admin_stats.get_snapshot()
+        self.book_more()
+        self.age(299)
+        with self.assertNumQueries(1):
+            self.assertEqual(admin_stats.get_snapshot().stats, snapshot.stats)
+
+        self.age(300)
+        refreshed = admin_stats.get_snapshot()
+        self.assertEqual(refreshed.stats, self.live())
+        self.assertEqual(refreshed.stats['total_bookings'], snapshot.stats['total_bookings'] + 1)
+        self.assertEqual(AdminStatsSnapshot.objects.count(), 1)
+
+    def test_refresh_on_request(self):
+        admin_stats.get_snapshot()
+        self.book_more()
+        self.assertEqual(admin_stats.get_snapshot(force_refresh=True).stats, self.live())
+
+        self.book_more(day=10)
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('users:admin_dashboard'), {'refresh_stats': '1'})
+        self.assertRedirects(response, reverse('users:admin_dashboard'))
+        self.assertEqual(AdminStatsSnapshot.objects.get().stats, self.live())
+
+
+@override_settings(SESSION_ENGINE='greengear_project.sessions', QUERY_INSTRUMENTATION=True)
+class SessionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = User.objects.create_user('farmer', role='farmer')
+
+    def test_logged_in_requests_skip_the_session_table(self):
+        self.client.force_login(self.farmer)
+        for _ in range(2):
+            response = self.client.get(reverse('users:farmer_dashboard'))
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse([sql for sql in response.query_stats.fingerprints if 'django_session' in sql])
+
+    def test_logout_ends_the_cached_session(self):
+        self.client.force_login(self.farmer)
+        session_key = self.client.session.session_key
+        self.client.get(reverse('users:logout'))
+        self.assertFalse(sessions.SessionStore().exists(session_key))
+        self.assertEqual(self.client.get(reverse('users:farmer_dashboard')).status_code, 302)
+
+    def test_session_falls_back_to_the_database(self):
+        self.client.force_login(self.farmer)
+        store = sessions.SessionStore(self.client.session.session_key)
+        store._cache.delete(store.cache_key)
+        self.assertEqual(self.client.get(reverse('users:farmer_dashboard')).status_code, 200)
+
+    @override_settings(SESSION_LOCAL_CACHE_TTL=5)
+    def test_cache_entries_are_short_lived(self):
+        cache = Mock()
+        sessions.LocalCache(cache).set('key', 'data', 1209600)
+        cache.set.assert_called_once_with('key', 'data', 5)
+
+    def test_purge_sessions(self):
+        now = timezone.now()
+        for i in range(5):
+            Session.objects.create(session_key=f'expired{i}', session_data='', expire_date=now - timedelta(days=1))
+        Session.objects.create(session_key='current', session_data='', expire_date=now + timedelta(days=1))
+
+        out = StringIO()
+        call_command('purge_sessions', batch_size=2, stdout=out)
+        self.assertIn('Deleted 5 expired sessions.', out.getvalue())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['current'])
+
+
+class WarmupTests(TestCase):
+    def test_every_template_compiles(self):
+        out = StringIO()
+        call_command('warmup', stdout=out)
+        compiled = len(list((Path(settings.BASE_DIR) / 'templates').rglob('*.html')))
+        self.assertIn(f'Compiled {compiled} templates.', out.getvalue())
+
+    def test_syntax_errors_fail_the_command(self):
+        with TemporaryDirectory() as directory:
+            (Path(directory) / 'pages').mkdir()
+            (Path(directory) / 'pages' / 'broken.html').write_text('{% if %}')
+            (Path(directory) / 'fine.html').write_text('{{ greeting }}')
+            templates = [dict(settings.TEMPLATES[0], DIRS=[directory])]
+            with override_settings(TEMPLATES=templates), self.assertLogs('greengear_project.warmup', 'ERROR'):
+                with self.assertRaisesMessage(CommandError, 'pages/broken.html'):
+                    call_command('warmup', stdout=StringIO())
@@ -1,18 +1,21 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Q
 from .models import User
+from .counters import counters_for
+from . import admin_stats
 from equipment.models import Equipment
+from equipment.recommendations import recommended_for
 from bookings.models import Booking
+from greengear_project.pagination import paginate
 
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.forms import PasswordChangeForm
 
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.db.models import Count, Sum
 
 def is_admin(user):
     return user.is_superuser
@@ -23,37 +26,20 @@ def admin_dashboard(request):
     from equipment.models import Equipment
     from bookings.models import Booking
     
-    # Statistics
-    total_users = User.objects.count()
-    farmer_count = User.objects.filter(role='farmer').count()
-    owner_count = User.objects.filter(role='owner').count()
-    
-    total_equipment = Equipment.objects.count()
-    available_equipment = Equipment.objects.filter(availability=True).count()
-    
-    total_bookings = Booking.objects.count()
-    active_bookings = Booking.objects.filter(status__in=['pending', 'approved']).count()
-    completed_bookings = Booking.objects.filter(status='completed').count()
-    
-    total_revenue = Booking.objects.filter(status='completed').aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
+    # Statistics, from a snapshot that is recomputed when stale or on request
+    if request.method == 'POST' and request.POST.get('refresh_stats'):
+        admin_stats.refresh()
+        messages.success(request, 'Statistics refreshed.')
+        return redirect('users:admin_dashboard')
+    snapshot = admin_stats.get_snapshot()
     
     # Recent data
     recent_users = User.objects.all().order_by('-date_joined')[:5]
-    recent_equipment = Equipment.objects.all().order_by('-created_at')[:5]
-    recent_bookings = Booking.objects.all().order_by('-created_at')[:5]
+    recent_equipment = Equipment.objects.select_related('owner').order_by('-created_at')[:5]
+    recent_bookings = Booking.objects.select_related('equipment', 'farmer').order_by('-created_at')[:5]
     
     context = {
-        'total_users': total_users,
-        'farmer_count': farmer_count,
-        'owner_count': owner_count,
-        'total_equipment': total_equipment,
-        'available_equipment': available_equipment,
-        'total_bookings': total_bookings,
-        'active_bookings': active_bookings,
-        'completed_bookings': completed_bookings,
-        'total_revenue': total_revenue,
+        **admin_stats.stats_context(snapshot),
         'recent_users': recent_users,
         'recent_equipment': recent_equipment,
         'recent_bookings': recent_bookings,
@@ -81,8 +67,11 @@ def manage_users(request):
     if role_filter:
         users = users.filter(role=role_filter)
     
+    page = paginate(request, users, ordering=('-date_joined', '-id'))
+    
     context = {
-        'users': users,
+        'users': page.object_list,
+        'page': page,
         'search_query': search_query,
         'role_filter': role_filter
     }
@@ -266,32 +255,8 @@ def register_owner(request):
 
 @login_required
 def profile(request):
-    # Calculate statistics
-    total_earnings = 0
-    booking_requests_count = 0
-    active_bookings_count = 0
-    
-    if request.user.role == 'owner':
-        # Calculate total earnings from completed bookings
-        completed_bookings = Booking.objects.filter(
-            equipment__owner=request.user,
-            status='completed'
-        )
-        total_earnings = completed_bookings.aggregate(
-            total_sum=Sum('total_amount')
-        )['total_sum'] or 0
-        
-        # Count pending booking requests
-        booking_requests_count = Booking.objects.filter(
-            equipment__owner=request.user,
-            status='pending'
-        ).count()
-    elif request.user.role == 'farmer':
-        # Count active bookings for farmers
-        active_bookings_count = Booking.objects.filter(
-            farmer=request.user,
-            status__in=['pending', 'approved']
-        ).count()
+    # Statistics come from the user's counters row
+    counters = counters_for(request.user)
     
     if request.method == 'POST':
         user = request.user
@@ -312,9 +277,10 @@ def profile(request):
             messages.error(request, f'Error updating profile: {str(e)}')
     
     context = {
-        'total_earnings': total_earnings,
-        'booking_requests_count': booking_requests_count,
-        'active_bookings_count': active_bookings_count
+        'counters': counters,
+        'total_earnings': counters.total_earnings,
+        'booking_requests_count': counters.requests_pending,
+        'active_bookings_count': counters.bookings_active
     }
     return render(request, 'users/profile.html', context)
 @login_required
@@ -323,24 +289,20 @@ def farmer_dashboard(request):
         messages.error(request, 'Access denied.')
         return redirect('home')
     
-    # Get farmer's bookings with counts
+    # Get farmer's bookings
     bookings = Booking.objects.filter(farmer=request.user).select_related('equipment', 'equipment__owner')
     
     # Count bookings by status
-    pending_count = bookings.filter(status='pending').count()
-    approved_count = bookings.filter(status='approved').count()
-    completed_count = bookings.filter(status='completed').count()
+    counters = counters_for(request.user)
     
-    # Get recent equipment for recommendations
-    recommended_equipment = Equipment.objects.filter(availability=True).exclude(
-        bookings__farmer=request.user
-    ).select_related('owner').order_by('-created_at')[:3]
+    # Equipment booked by farmers who booked the same things; see equipment.recommendations
+    recommended_equipment = recommended_for(request.user)
     
     context = {
         'bookings': bookings[:5],  # Show only recent 5 bookings
-        'pending_count': pending_count,
-        'approved_count': approved_count,
-        'completed_count': completed_count,
+        'pending_count': counters.bookings_pending,
+        'approved_count': counters.bookings_approved,
+        'completed_count': counters.bookings_completed,
         'recommended_equipment': recommended_equipment
     }
     return render(request, 'users/farmer_dashboard.html', context)
@@ -354,28 +316,8 @@ def owner_dashboard(request):
     # Get owner's equipment
     equipment_list = Equipment.objects.filter(owner=request.user)
     
-    # Get pending booking requests count
-    pending_bookings = Booking.objects.filter(
-        equipment__owner=request.user,
-        status='pending'
-    ).count()
-    
-    # Get total equipment count
-    total_equipment = equipment_list.count()
-    
-    # Calculate total earnings from COMPLETED bookings
-    completed_bookings = Booking.objects.filter(
-        equipment__owner=request.user,
-        status='completed'
-    )
-    
-    # Sum total_amount from all completed bookings
-    total_earnings = completed_bookings.aggregate(
-        total_sum=Sum('total_amount')
-    )['total_sum'] or 0
-    
-    # Get completed bookings count
-    completed_bookings_count = completed_bookings.count()
+    # Request counts and earnings from COMPLETED bookings
+    counters = counters_for(request.user)
     
     # Get recent booking requests for display
     recent_booking_requests = Booking.objects.filter(
@@ -384,10 +326,10 @@ def owner_dashboard(request):
     
     context = {
         'equipment_list': equipment_list[:4],  # Show only first 4 equipment
-        'pending_bookings_count': pending_bookings,
-        'total_equipment': total_equipment,
-        'total_earnings': total_earnings,
-        'completed_bookings_count': completed_bookings_count,
+        'pending_bookings_count': counters.requests_pending,
+        'total_equipment': counters.equipment_count,
+        'total_earnings': counters.total_earnings,
+        'completed_bookings_count': counters.requests_completed,
         'booking_requests': recent_booking_requests
     }
     return render(request, 'users/owner_dashboard.html', context)
\ No newline at end of file